@@ -1,4 +1,10 @@
-def generate_agent_explanation(captions: dict, consensus: dict, final_caption: str, tot_debug=None) -> str:
+def generate_agent_explanation(
+    captions: dict,
+    consensus: dict,
+    final_caption: str,
+    tot_debug=None,
+    early_exit=None
+) -> str:
     lines = []
 
     # 1) Résumé des sorties
@@ -23,7 +29,33 @@ def generate_agent_explanation(captions: dict, consensus: dict, final_caption: s
     )
     lines.append(f"- Selected caption: _{best_caption}_")
 
-    # 3) ToT si présent
+    # 3) Early exit (mode adaptatif)
+    if early_exit:
+        lines.append("\n### ⚡ Adaptive early exit")
+        limits = early_exit["thresholds"]
+        lines.append(f"- Agreement between models: `{early_exit['agreement']:.2f}`")
+        if early_exit["skipped_models"]:
+            skipped = ", ".join(f"**{m}**" for m in early_exit["skipped_models"])
+            lines.append(
+                f"- Skipped {skipped}: the first models already agreed "
+                f"(≥ `{limits['skip_models']:.2f}`)."
+            )
+        if early_exit["gemini"] == "consensus":
+            lines.append(
+                f"- Gemini skipped: agreement ≥ `{limits['consensus']:.2f}`, "
+                "the consensus caption is kept as the final caption."
+            )
+        elif early_exit["gemini"] == "fusion":
+            lines.append(
+                f"- Gemini reduced to a single fusion call: agreement ≥ `{limits['fusion_only']:.2f}` "
+                "(no Tree of Thoughts, no self-correction)."
+            )
+        else:
+            lines.append("- Models disagree: full Gemini refinement.")
+        if early_exit["gemini_calls_saved"]:
+            lines.append(f"- Gemini calls saved: `{early_exit['gemini_calls_saved']}`")
+
+    # 4) ToT si présent
     if tot_debug:
         lines.append("\n### 🌳 Tree of Thoughts (Gemini candidates)")
         for i, cand in enumerate(tot_debug["candidates"], start=1):
@@ -35,7 +67,7 @@ def generate_agent_explanation(captions: dict, consensus: dict, final_caption: s
 
         lines.append(f"\n✅ Picked: **{tot_debug['picked']}**")
 
-    # 4) Résultat final
+    # 5) Résultat final
     lines.append("\n### 🤖 Final caption (after refinement)")
     lines.append(f"➡️ **{final_caption}**")
 
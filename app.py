@@ -1,9 +1,14 @@
+import uuid
+
 import streamlit as st
-from PIL import Image
-import tempfile
-import os
 
-from pipeline import run_captioning_pipeline
+import early_exit
+from caption_client import SERVER_URL, ServerBusy, run_remote_pipeline
+from caption_models import model_stats
+from image_ingest import load_image
+from job_queue import JobQueue
+from pipeline import iter_captioning_pipeline
+from warmup import start_warmup
 
 # =========================================================
 # PAGE CONFIG
@@ -15,12 +20,62 @@ st.set_page_config(
 
 st.title("🧠 Multi-Model Consensus for Image Captioning")
 
+
+# =========================================================
+# MODEL WARM-UP (once per server process, in the background)
+# =========================================================
+# With CAPTION_SERVER_URL set, the models live in server.py and this
+# page is only a thin client: nothing is loaded here.
+@st.cache_resource
+def get_warmup():
+    return start_warmup()
+
+
+warmup = None if SERVER_URL else get_warmup()
+
 st.markdown("""
 This application generates **robust and reliable image captions** by combining
 multiple vision–language models and applying an **explicit reasoning pipeline**
 (semantic consensus, Tree of Thoughts, refinement, and self-correction).
 """)
 
+def _events_from_result(result: dict):
+    """Replay a finished (remote) result as pipeline events."""
+    if result.get("near_duplicate"):
+        yield {"stage": "near_duplicate", "near_duplicate": result["near_duplicate"]}
+    for model, caption in result["captions"].items():
+        yield {"stage": "caption", "model": model, "caption": caption,
+               "stage_seconds": result.get("model_timings", {}).get(model)}
+    yield {"stage": "consensus", "consensus": result["consensus"]}
+    if result.get("early_exit"):
+        yield {"stage": "early_exit", "early_exit": result["early_exit"]}
+    yield {"stage": "final_caption", "caption": result["final_caption"]}
+    yield {"stage": "done", "result": result}
+
+
+def _remote_events(image, image_name: str, **options):
+    yield from _events_from_result(run_remote_pipeline(SERVER_URL, image, image_name, **options))
+
+
+# =========================================================
+# BACKGROUND JOBS (shared by every session of this server)
+# =========================================================
+# Pipelines run in JobQueue worker threads: the page only submits and
+# streams events, so a slow Gemini call never freezes it, a rerun
+# re-attaches to the running job, and uploads from several sessions are
+# served round-robin.
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(_remote_events if SERVER_URL else iter_captioning_pipeline).start()
+
+
+jobs = get_job_queue()
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+    st.session_state.jobs = {}  # (image content hash, options) -> job ID
+    st.session_state.generated = set()  # images "Generate Caption" was clicked for
+
+
 # =========================================================
 # SIDEBAR (CLEAN & UNIQUE)
 # =========================================================
@@ -36,11 +91,34 @@ enable_self_correction = st.sidebar.checkbox(
     value=True
 )
 
+adaptive = st.sidebar.checkbox(
+    "Adaptive early exit (skip models / Gemini when models already agree)",
+    value=early_exit.ADAPTIVE
+)
+
 show_reasoning = st.sidebar.checkbox(
     "Show agent reasoning (dynamic explanation)",
     value=True
 )
 
+if warmup is not None:
+    st.sidebar.header("🔥 Model warm-up")
+    st.sidebar.progress(warmup.progress(), text="Models ready" if warmup.done() else "Loading models...")
+    for model_name, status in warmup.status().items():
+        detail = f" ({status['seconds']:.1f}s)" if status["seconds"] is not None else ""
+        st.sidebar.caption(f"{model_name}: {status['state']}{detail}")
+    memory = model_stats()
+    budget = f" / {memory['budget_mb']:.0f} MB budget" if memory["budget_mb"] else ""
+    st.sidebar.caption(f"Resident models: {memory['resident_mb']:.0f} MB{budget}")
+else:
+    st.sidebar.caption(f"🌐 Using caption server: {SERVER_URL}")
+
+queue_stats = jobs.stats()
+st.sidebar.caption(
+    f"Jobs: {queue_stats['running']} running, {queue_stats['queued']} queued "
+    f"({queue_stats['workers']} workers)"
+)
+
 # =========================================================
 # IMAGE UPLOAD
 # =========================================================
@@ -53,52 +131,101 @@ uploaded_file = st.file_uploader(
 
 if uploaded_file:
 
-    image = Image.open(uploaded_file).convert("RGB")
-    st.image(image, caption="Uploaded Image", width=700)
-
-    # Save temp image
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-        image.save(tmp.name)
-        image_path = tmp.name
+    # Decoded once, shared by the preview and every captioner
+    image = load_image(uploaded_file)
+    st.image(image.image, caption="Uploaded Image", width=700)
 
     image_name = uploaded_file.name
 
+    options = {
+        "enable_self_correction": enable_self_correction,
+        "enable_tot": enable_tot,
+        "adaptive": adaptive,
+    }
+    job_key = (image.content_hash, tuple(sorted(options.items())))
+
     if st.button("🚀 Generate Caption"):
-        with st.spinner("Running intelligent captioning pipeline..."):
+        st.session_state.generated.add(image.content_hash)
+        st.session_state.jobs.pop(job_key, None)
+
+    job_id = st.session_state.jobs.get(job_key)
+    if job_id is not None and jobs.status(job_id) is None:
+        del st.session_state.jobs[job_key]  # expired
+        job_id = None
+    # Toggling a reasoning option re-runs the job: captions, consensus and
+    # embeddings come from the caches, only the affected stages run again
+    if job_id is None and image.content_hash in st.session_state.generated:
+        job_id = st.session_state.jobs[job_key] = jobs.submit(
+            image, image_name, st.session_state.session_id, **options
+        )
 
-            result = run_captioning_pipeline(
-                image_path=image_path,
-                image_name=image_name,
-                enable_self_correction=enable_self_correction,
-                enable_tot=enable_tot
-            )
+    if job_id is not None:
 
         # =================================================
-        # RESULTS
+        # RESULTS (filled in as soon as each stage is ready)
         # =================================================
-        st.success("Captioning completed successfully!")
+        status = st.status("Running intelligent captioning pipeline...", expanded=False)
 
-        # -----------------------------
-        # RAW CAPTIONS
-        # -----------------------------
         st.subheader("📝 Captions from Individual Models")
-        for model, caption in result["captions"].items():
-            st.write(f"**{model}**: {caption}")
+        captions_box = st.container()
 
-        # -----------------------------
-        # CONSENSUS
-        # -----------------------------
         st.subheader("🧩 Semantic Consensus")
-        st.info(
-            f"**Selected model:** {result['consensus']['best_model']}\n\n"
-            f"**Consensus caption:** {result['consensus']['best_caption']}"
-        )
+        consensus_box = st.empty()
 
-        # -----------------------------
-        # FINAL CAPTION
-        # -----------------------------
         st.subheader("🤖 Final Caption (after reasoning & refinement)")
-        st.success(result["final_caption"])
+        final_box = st.empty()
+
+        result = None
+        for event in jobs.stream(job_id):
+            stage = event["stage"]
+            if stage == "queued":
+                status.update(label=f"Queued: {event['position']} job(s) ahead…")
+            elif stage == "error":
+                error = event["error"]
+                if isinstance(error, ServerBusy):
+                    status.update(label="Caption server busy", state="error")
+                    st.warning(f"The caption server is busy, please retry in {error.retry_after:.0f}s.")
+                else:
+                    status.update(label="Captioning failed", state="error")
+                    st.error(f"The pipeline failed: {error!r}")
+                del st.session_state.jobs[job_key]
+                st.session_state.generated.discard(image.content_hash)
+                st.stop()
+            elif stage == "caption":
+                seconds = event.get("stage_seconds")
+                timing = f" _({seconds:.1f}s)_" if seconds else ""
+                captions_box.write(f"**{event['model']}**: {event['caption']}{timing}")
+            elif stage == "consensus":
+                consensus_box.info(
+                    f"**Selected model:** {event['consensus']['best_model']}\n\n"
+                    f"**Consensus caption:** {event['consensus']['best_caption']}"
+                )
+            elif stage == "near_duplicate":
+                match = event["near_duplicate"]
+                status.write(
+                    f"Near-duplicate of a previous image (similarity {match['similarity']:.2f}): "
+                    + ("cached result reused" if match["mode"] == "reuse" else "cached captions reused")
+                )
+            elif stage == "early_exit":
+                decision = event["early_exit"]
+                skipped = ", ".join(decision["skipped_models"]) or "none"
+                status.write(
+                    f"Adaptive early exit: agreement {decision['agreement']:.2f}, "
+                    f"skipped models: {skipped}, Gemini: {decision['gemini']}"
+                )
+            elif stage == "tot_candidates":
+                status.write("Tree of Thoughts candidates:")
+                for cand in event["tot_debug"]["candidates"]:
+                    status.write(f"- {cand}")
+            elif stage == "final_caption":
+                final_box.success(event["caption"])
+            elif stage == "done":
+                result = event["result"]
+
+            if event.get("elapsed") is not None:
+                status.update(label=f"Running pipeline… {stage} ready after {event['elapsed']:.1f}s")
+
+        status.update(label="Captioning completed successfully!", state="complete")
 
         # -----------------------------
         # EVALUATION (OPTIONAL)
@@ -121,6 +248,3 @@ if uploaded_file:
             if result.get("tot_debug"):
                 st.subheader("🌳 Tree of Thoughts – Candidate Analysis")
                 st.json(result["tot_debug"])
-
-    # Clean temp file
-    os.remove(image_path)
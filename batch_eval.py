@@ -0,0 +1,225 @@
+"""
+Offline batch evaluation over a directory of images.
+
+    python batch_eval.py --images-dir test_images_eval --ground-truth data.json \
+        --output eval_results.jsonl --workers 4
+
+Per-image results are appended to the JSONL output as soon as they are
+ready; re-running with the same output skips images already scored, so
+an interrupted run resumes where it stopped. At the end, corpus-level
+metrics are reported for every model over everything in the output file.
+
+With --batch-size N, images go through the pipeline N at a time: batched
+captioners and bulk Gemini requests covering many images each.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from evaluation import corpus_scores, EvaluationEngine
+from ground_truth_store import GROUND_TRUTH_PATH
+from pipeline import get_ground_truth, run_captioning_pipeline, run_captioning_pipeline_batch, set_ground_truth
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+METRICS = ("SPICE", "BLEU-1", "BLEU-2", "BLEU-3", "BLEU-4", "METEOR", "ROUGE-L")
+
+
+def list_images(images_dir: str) -> list[str]:
+    return sorted(
+        name for name in os.listdir(images_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def read_results(path: str) -> dict:
+    """{image_name: record} for every successful line of a results file."""
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # truncated last line of an interrupted run
+            if "error" not in record:
+                results[record["image"]] = record
+    return results
+
+
+def truncate_partial_line(path: str):
+    """Cut a half-written last line (interrupted run) so appends start on a fresh line."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = 0
+        pos = size
+        while pos > 0:
+            step = min(1 << 16, pos)
+            f.seek(pos - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline >= 0:
+                end = pos - step + newline + 1
+                break
+            pos -= step
+        if end < size:
+            f.truncate(end)
+
+
+def caption_one(images_dir: str, image_name: str, args) -> dict:
+    start = time.perf_counter()
+    try:
+        result = run_captioning_pipeline(
+            os.path.join(images_dir, image_name),
+            image_name,
+            enable_self_correction=not args.no_self_correction,
+            enable_tot=not args.no_tot,
+            execution_mode=args.execution_mode,
+            adaptive=args.adaptive,
+            reasoning_mode=args.reasoning_mode
+        )
+    except Exception as exc:
+        return {"image": image_name, "error": repr(exc)}
+    return _record(image_name, result, time.perf_counter() - start)
+
+
+def caption_chunk(images_dir: str, image_names: list, args) -> list:
+    """Batched pipeline over several images; per-image seconds are the mean."""
+    start = time.perf_counter()
+    try:
+        results = run_captioning_pipeline_batch(
+            [os.path.join(images_dir, n) for n in image_names],
+            image_names,
+            enable_self_correction=not args.no_self_correction,
+            enable_tot=not args.no_tot,
+            execution_mode=args.execution_mode
+        )
+    except Exception as exc:
+        return [{"image": n, "error": repr(exc)} for n in image_names]
+    seconds = (time.perf_counter() - start) / len(image_names)
+    return [_record(n, result, seconds) for n, result in zip(image_names, results)]
+
+
+def _record(image_name: str, result: dict, seconds: float) -> dict:
+    if "error" in result:
+        return {"image": image_name, "error": result["error"]}
+    return {
+        "image": image_name,
+        "captions": result["captions"],
+        "final_caption": result["final_caption"],
+        "evaluation": result["evaluation"],
+        "early_exit": result["early_exit"],
+        "seconds": seconds,
+    }
+
+
+def corpus_report(ground_truth, results: dict) -> dict:
+    """{model: corpus scores} over every scored image."""
+    per_model = {}
+    for name, record in results.items():
+        captions = dict(record["captions"])
+        captions["Gemini-Fusion"] = record["final_caption"]
+        for model, caption in captions.items():
+            per_model.setdefault(model, {})[name] = caption
+    engine = EvaluationEngine(ground_truth)
+    return {
+        model: corpus_scores(ground_truth, predictions, engine=engine)
+        for model, predictions in per_model.items()
+    }
+
+
+def format_table(report: dict) -> str:
+    header = "| Model | Images | " + " | ".join(METRICS) + " |"
+    lines = [header, "|" + "---|" * (len(METRICS) + 2)]
+    for model, scores in report.items():
+        if scores is None:
+            continue
+        cells = " | ".join(f"{scores[m]:.4f}" for m in METRICS)
+        lines.append(f"| {model} | {scores['images']} | {cells} |")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images-dir", default="test_images_eval")
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH)
+    parser.add_argument("--output", default="eval_results.jsonl")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--no-tot", action="store_true", help="disable Tree of Thoughts")
+    parser.add_argument("--no-self-correction", action="store_true")
+    parser.add_argument("--execution-mode", default=None,
+                        help="captioner execution mode (sequential/threads/processes)")
+    parser.add_argument("--adaptive", action="store_true", default=None,
+                        help="adaptive early exit when the models agree (see early_exit.py)")
+    parser.add_argument("--reasoning-mode", default=None, choices=("multi", "combined"),
+                        help="Gemini ToT + self-correction as separate calls or one combined call")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="run the pipeline N images at a time with bulk Gemini requests "
+                             "(not with --adaptive / --reasoning-mode combined)")
+    parser.add_argument("--report", default=None, help="write the corpus report as JSON")
+    args = parser.parse_args(argv)
+    # The batch pipeline always runs the full multi-call path
+    if args.batch_size > 0 and (args.adaptive or args.reasoning_mode == "combined"):
+        parser.error("--batch-size cannot be combined with --adaptive or --reasoning-mode combined")
+
+    # Per-image scores (pipeline) and corpus scores use the same references
+    set_ground_truth(args.ground_truth)
+    ground_truth = get_ground_truth()
+    truncate_partial_line(args.output)
+    done = read_results(args.output)
+    todo = [n for n in list_images(args.images_dir) if n not in done]
+    print(f"{len(done)} images already done, {len(todo)} to go")
+
+    write_lock = threading.Lock()
+    processed = failed = 0
+    start = time.perf_counter()
+
+    with open(args.output, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        if args.batch_size > 0:
+            chunks = [todo[i:i + args.batch_size] for i in range(0, len(todo), args.batch_size)]
+            futures = [pool.submit(caption_chunk, args.images_dir, chunk, args) for chunk in chunks]
+        else:
+            futures = [pool.submit(caption_one, args.images_dir, n, args) for n in todo]
+        for future in as_completed(futures):
+            records = future.result()
+            for record in records if isinstance(records, list) else [records]:
+                with write_lock:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                if "error" in record:
+                    failed += 1
+                    print(f"[error] {record['image']}: {record['error']}")
+                else:
+                    processed += 1
+                    print(f"[{processed}/{len(todo)}] {record['image']} ({record['seconds']:.1f}s)")
+
+    elapsed = time.perf_counter() - start
+    throughput = processed / elapsed if elapsed > 0 else 0.0
+    print(f"\nProcessed {processed} images ({failed} failed) in {elapsed:.1f}s "
+          f"-> {throughput:.3f} images/s")
+
+    report = corpus_report(ground_truth, read_results(args.output))
+    print("\nCorpus-level metrics\n")
+    print(format_table(report))
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({
+                "corpus": report,
+                "processed": processed,
+                "failed": failed,
+                "seconds": elapsed,
+                "images_per_second": throughput,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Sharded, resumable multi-process batch captioning job.
+
+    python batch_job.py --input /data/images --output-dir backfill \
+        --workers 4 --threads-per-worker 2 --batch-size 8
+
+`--input` is a directory (scanned recursively) or a manifest file with
+one image path per line. Items are sharded by a stable hash of their
+path, one shard per worker process; every worker loads its own set of
+models with a pinned number of torch threads.
+
+Each shard appends its results to `shard-NNNNN.jsonl` and, after every
+batch, records the committed byte offset in `shard-NNNNN.ckpt`. After a
+crash, re-running the same command truncates each shard file to its
+checkpoint and skips the items already in it (items recorded as
+errors, e.g. after a 429 or an OOM, are retried). By default only the
+captioners run (`--pipeline` runs the full pipeline, Gemini included).
+Aggregate throughput and per-worker utilization (busy time / wall time)
+are printed and written to `report.json`.
+"""
+import argparse
+import json
+import os
+import queue
+import time
+import zlib
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+PROGRESS_EVERY_S = 10.0
+
+
+# =========================================================
+# 🔹 INPUT & SHARDING
+# =========================================================
+def list_items(source: str) -> list[str]:
+    """Image paths of a directory (recursive) or of a manifest file, sorted."""
+    if os.path.isdir(source):
+        items = []
+        for root, _, files in os.walk(source):
+            items.extend(
+                os.path.relpath(os.path.join(root, name), source)
+                for name in files if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        return sorted(items)
+    with open(source, encoding="utf-8") as f:
+        return sorted({line.strip() for line in f if line.strip()})
+
+
+def resolve(source: str, item: str) -> str:
+    base = source if os.path.isdir(source) else os.path.dirname(os.path.abspath(source))
+    return item if os.path.isabs(item) else os.path.join(base, item)
+
+
+def shard_of(item: str, num_shards: int) -> int:
+    # crc32 is stable across runs and processes (unlike hash())
+    return zlib.crc32(item.encode("utf-8")) % num_shards
+
+
+def _shard_path(output_dir: str, shard: int, ext: str) -> str:
+    return os.path.join(output_dir, f"shard-{shard:05d}.{ext}")
+
+
+# =========================================================
+# 🔹 CHECKPOINTS
+# =========================================================
+def read_checkpoint(output_dir: str, shard: int) -> dict:
+    path = _shard_path(output_dir, shard, "ckpt")
+    if not os.path.exists(path):
+        return {"offset": 0, "done": 0}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_checkpoint(output_dir: str, shard: int, checkpoint: dict):
+    # Write-then-rename: a crash leaves either the old or the new checkpoint
+    path = _shard_path(output_dir, shard, "ckpt")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def recover_shard(output_dir: str, shard: int) -> tuple:
+    """
+    Truncate a shard's JSONL to its last checkpoint (dropping lines
+    written after it).
+
+    Returns:
+        (done, failed): ids with a successful record, and ids with only
+        "error" records (retried on restart; the last record of an id
+        is the one that counts).
+    """
+    path = _shard_path(output_dir, shard, "jsonl")
+    offset = read_checkpoint(output_dir, shard)["offset"]
+    done, failed = set(), set()
+    if not os.path.exists(path):
+        return done, failed
+    with open(path, "r+b") as f:
+        f.truncate(offset)
+        f.seek(0)
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "error" in record:
+                failed.add(record["id"])
+            else:
+                done.add(record["id"])
+    return done, failed - done
+
+
+# =========================================================
+# 🔹 WORKER PROCESS
+# =========================================================
+def _pin_threads(num_threads: int):
+    # Must happen before torch is imported by the worker
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(num_threads)
+    import torch
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already set in this process
+
+
+def _process_batch(paths: list, items: list, args: dict) -> list:
+    """Result records for one batch (one "error" record per failed image)."""
+    from image_ingest import load_image
+
+    images, records = [], {}
+    for item, path in zip(items, paths):
+        try:
+            images.append((item, load_image(path)))
+        except Exception as exc:
+            records[item] = {"id": item, "error": repr(exc)}
+    if images:
+        names = [item for item, _ in images]
+        prepared = [image for _, image in images]
+        if args["pipeline"]:
+            from pipeline import run_captioning_pipeline_batch
+            results = run_captioning_pipeline_batch(
+                prepared, names,
+                enable_self_correction=args["self_correction"],
+                enable_tot=args["tot"],
+                max_batch_size=args["batch_size"],
+                execution_mode="sequential"
+            )
+            for item, result in zip(names, results):
+                if "error" in result:
+                    records[item] = {"id": item, "error": result["error"]}
+                    continue
+                records[item] = {
+                    "id": item,
+                    "captions": result["captions"],
+                    "final_caption": result["final_caption"],
+                }
+        else:
+            from caption_models import generate_all_captions_batch
+            results = generate_all_captions_batch(
+                prepared, max_batch_size=args["batch_size"], execution_mode="sequential"
+            )
+            for item, captions in zip(names, results):
+                records[item] = {"id": item, "captions": captions}
+    return [records[item] for item in items]
+
+
+def run_shard(shard: int, items: list, args: dict, progress):
+    """Worker entry point: caption every pending item of one shard."""
+    started = time.perf_counter()
+    _pin_threads(args["threads_per_worker"])
+
+    done, failed = recover_shard(args["output_dir"], shard)
+    pending = [item for item in items if item not in done]
+    stats = {
+        "shard": shard, "pid": os.getpid(), "items": len(items),
+        "skipped": len(items) - len(pending), "retried": sum(item in failed for item in pending),
+        "processed": 0, "errors": 0, "load_s": 0.0, "busy_s": 0.0,
+    }
+
+    if args["pipeline"]:
+        from pipeline import set_ground_truth
+        set_ground_truth(args["ground_truth"])
+
+    # Load the models up front so load time is not counted as busy time
+    if pending:
+        start = time.perf_counter()
+        from caption_models import CAPTIONERS
+        for getter in CAPTIONERS.values():
+            getter()
+        stats["load_s"] = time.perf_counter() - start
+
+    path = _shard_path(args["output_dir"], shard, "jsonl")
+    with open(path, "ab") as out:
+        for i in range(0, len(pending), args["batch_size"]):
+            batch = pending[i:i + args["batch_size"]]
+            start = time.perf_counter()
+            try:
+                records = _process_batch([resolve(args["input"], b) for b in batch], batch, args)
+            except Exception as exc:
+                records = [{"id": item, "error": repr(exc)} for item in batch]
+            stats["busy_s"] += time.perf_counter() - start
+
+            for record in records:
+                out.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            out.flush()
+            os.fsync(out.fileno())
+            stats["processed"] += sum("error" not in r for r in records)
+            stats["errors"] += sum("error" in r for r in records)
+            write_checkpoint(args["output_dir"], shard, {
+                "offset": out.tell(),
+                "done": len(done) + i + len(batch),
+                "updated": time.time(),
+            })
+            stats["wall_s"] = time.perf_counter() - started
+            progress.put(dict(stats))
+
+    stats["wall_s"] = time.perf_counter() - started
+    stats["finished"] = True
+    progress.put(dict(stats))
+
+
+# =========================================================
+# 🔹 COORDINATOR
+# =========================================================
+def _utilization(stats: dict) -> float:
+    return stats["busy_s"] / stats["wall_s"] if stats.get("wall_s") else 0.0
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{report['processed']} images captioned ({report['errors']} errors, "
+        f"{report['skipped']} already done, {report['retried']} failed before and retried) "
+        f"in {report['wall_s']:.1f}s "
+        f"-> {report['images_per_second']:.2f} images/s",
+        "",
+        f"{'shard':>5} {'pid':>7} {'items':>7} {'done':>6} {'err':>4} {'load s':>7} "
+        f"{'busy s':>8} {'util':>5} {'img/s':>6}",
+    ]
+    for w in report["workers"]:
+        rate = w["processed"] / w["busy_s"] if w["busy_s"] else 0.0
+        lines.append(
+            f"{w['shard']:>5} {w['pid']:>7} {w['items']:>7} {w['processed']:>6} {w['errors']:>4} "
+            f"{w['load_s']:>7.1f} {w['busy_s']:>8.1f} {_utilization(w):>5.0%} {rate:>6.2f}"
+        )
+    return "\n".join(lines)
+
+
+def run_job(args: dict) -> dict:
+    import multiprocessing
+
+    os.makedirs(args["output_dir"], exist_ok=True)
+    job_path = os.path.join(args["output_dir"], "job.json")
+    if os.path.exists(job_path):
+        with open(job_path, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous["workers"] != args["workers"]:
+            raise SystemExit(
+                f"{args['output_dir']} was sharded for {previous['workers']} workers; "
+                "use the same --workers to resume"
+            )
+    else:
+        with open(job_path, "w", encoding="utf-8") as f:
+            json.dump({"input": args["input"], "workers": args["workers"]}, f)
+
+    items = list_items(args["input"])
+    shards = [[] for _ in range(args["workers"])]
+    for item in items:
+        shards[shard_of(item, args["workers"])].append(item)
+    print(f"{len(items)} items in {args['workers']} shards")
+
+    if args["pipeline"] and os.path.exists(args["ground_truth"]):
+        # Convert the ground truth once here rather than in every worker
+        from ground_truth_store import open_ground_truth
+        open_ground_truth(args["ground_truth"]).close()
+
+    ctx = multiprocessing.get_context("spawn")
+    progress = ctx.Queue()
+    workers = [
+        ctx.Process(target=run_shard, args=(shard, shard_items, args, progress), name=f"shard-{shard}")
+        for shard, shard_items in enumerate(shards)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+
+    latest = {}
+    last_print = start
+    while any(w.is_alive() for w in workers) or not progress.empty():
+        try:
+            stats = progress.get(timeout=1.0)
+            latest[stats["shard"]] = stats
+        except queue.Empty:
+            pass
+        if time.perf_counter() - last_print >= PROGRESS_EVERY_S and latest:
+            last_print = time.perf_counter()
+            processed = sum(s["processed"] for s in latest.values())
+            elapsed = last_print - start
+            print(f"[{elapsed:.0f}s] {processed} images, {processed / elapsed:.2f} images/s, "
+                  f"utilization " + " ".join(f"{_utilization(s):.0%}" for s in latest.values()))
+    for worker in workers:
+        worker.join()
+
+    wall = time.perf_counter() - start
+    crashed = [w.name for w in workers if w.exitcode != 0]
+    workers_stats = [latest[s] for s in sorted(latest)]
+    processed = sum(s["processed"] for s in workers_stats)
+    report = {
+        "items": len(items),
+        "processed": processed,
+        "errors": sum(s["errors"] for s in workers_stats),
+        "skipped": sum(s["skipped"] for s in workers_stats),
+        "retried": sum(s["retried"] for s in workers_stats),
+        "wall_s": wall,
+        "images_per_second": processed / wall if wall > 0 else 0.0,
+        "crashed_workers": crashed,
+        "workers": workers_stats,
+    }
+    with open(os.path.join(args["output_dir"], "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--input", required=True, help="image directory or manifest file")
+    parser.add_argument("--output-dir", default="batch_job_output")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch threads per worker (default: cores / workers)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("CAPTION_MAX_BATCH_SIZE", "8")))
+    parser.add_argument("--pipeline", action="store_true",
+                        help="run the full pipeline (consensus + Gemini), not only the captioners")
+    parser.add_argument("--no-tot", action="store_true", help="disable Tree of Thoughts (--pipeline)")
+    parser.add_argument("--no-self-correction", action="store_true")
+    parser.add_argument("--ground-truth", default=None,
+                        help="references scored against by --pipeline (default: GROUND_TRUTH_PATH)")
+    args = parser.parse_args(argv)
+
+    from ground_truth_store import GROUND_TRUTH_PATH
+
+    workers = max(1, args.workers)
+    report = run_job({
+        "input": args.input,
+        "output_dir": args.output_dir,
+        "workers": workers,
+        "threads_per_worker": args.threads_per_worker or max(1, (os.cpu_count() or 1) // workers),
+        "batch_size": max(1, args.batch_size),
+        "pipeline": args.pipeline,
+        "tot": not args.no_tot,
+        "self_correction": not args.no_self_correction,
+        "ground_truth": args.ground_truth or GROUND_TRUTH_PATH,
+    })
+    print()
+    print(format_report(report))
+    if report["crashed_workers"]:
+        print(f"\nworkers crashed: {', '.join(report['crashed_workers'])}; re-run to resume")
+
+
+if __name__ == "__main__":
+    main()
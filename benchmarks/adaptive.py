@@ -0,0 +1,182 @@
+"""
+Adaptive early-exit benchmark: compute saved vs quality lost.
+
+    python benchmarks/adaptive.py [--images-dir test_images_eval] [--output adaptive.json]
+
+Every image goes through the full pipeline and through the adaptive one
+(result cache off, models warmed up first). Reported: how often each
+early exit fires, captioner / Gemini / total time saved, Gemini calls
+saved, and the corpus metrics of the final captions in both modes. Images
+are then grouped by decision (return consensus / skip fusion / skip
+models / full run), each group with its mean seconds saved per image and
+mean per-image metric delta against the full run.
+Thresholds come from the ADAPTIVE_* env vars (see early_exit.py); set
+GEMINI_STUB=1 to run offline (the stub echoes the consensus caption, so
+the quality delta then only reflects the skipped captioners).
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+METRICS = ("SPICE", "BLEU-4", "METEOR", "ROUGE-L")
+TIMINGS = ("captioner_s", "gemini_s", "total_s")
+DECISIONS = ("return consensus", "skip fusion", "skip models", "full run")
+
+
+def run(images_dir: str, names: list, adaptive: bool) -> dict:
+    from pipeline import run_captioning_pipeline
+
+    runs = {}
+    for name in names:
+        result = run_captioning_pipeline(
+            os.path.join(images_dir, name), name, use_cache=False, adaptive=adaptive
+        )
+        stages = result["stage_timings"]
+        runs[name] = {
+            "final_caption": result["final_caption"],
+            "early_exit": result["early_exit"],
+            "models_run": len(result["captions"]),
+            "captioner_s": sum(result["model_timings"].values()),
+            "gemini_s": sum(s for stage, s in stages.items() if stage.startswith("gemini.")),
+            "total_s": result["timings"]["total_s"],
+        }
+    return runs
+
+
+def decision_group(decision: dict) -> str:
+    """
+    "return consensus" and "skip fusion" (one plain fusion call, no ToT /
+    self-correction) win over "skip models": the Gemini saving dominates.
+    """
+    if decision["gemini"] == "consensus":
+        return "return consensus"
+    if decision["gemini"] == "fusion":
+        return "skip fusion"
+    if decision["skipped_models"]:
+        return "skip models"
+    return "full run"
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def by_decision(full: dict, adaptive: dict, ground_truth, engine) -> dict:
+    groups = {}
+    for name, record in adaptive.items():
+        groups.setdefault(decision_group(record["early_exit"]), []).append(name)
+
+    report = {}
+    for group in DECISIONS:
+        names = groups.get(group, [])
+        if not names:
+            continue
+        deltas = []
+        for name in names:
+            if name not in ground_truth:
+                continue
+            before = engine.evaluate_caption(name, full[name]["final_caption"])
+            after = engine.evaluate_caption(name, adaptive[name]["final_caption"])
+            deltas.append({m: after[m] - before[m] for m in METRICS})
+        report[group] = {
+            "images": len(names),
+            "saved_s": {f: _mean([full[n][f] - adaptive[n][f] for n in names]) for f in TIMINGS},
+            "quality_delta": {m: _mean([d[m] for d in deltas]) for m in METRICS} if deltas else None,
+        }
+    return report
+
+
+def summarize(full: dict, adaptive: dict, ground_truth) -> dict:
+    from caption_models import CAPTIONERS
+    from early_exit import gemini_plan, thresholds
+    from evaluation import EvaluationEngine, corpus_scores
+
+    engine = EvaluationEngine(ground_truth)
+    quality = {
+        mode: corpus_scores(
+            ground_truth, {n: r["final_caption"] for n, r in runs.items()}, engine=engine
+        )
+        for mode, runs in (("full", full), ("adaptive", adaptive))
+    }
+
+    decisions = {}
+    for record in adaptive.values():
+        decision = record["early_exit"]
+        key = f"{decision['gemini']}, {len(decision['skipped_models'])} model(s) skipped"
+        decisions[key] = decisions.get(key, 0) + 1
+
+    def total(runs, field):
+        return sum(r[field] for r in runs.values())
+
+    full_calls = gemini_plan(0.0, True, True)["calls"]
+    return {
+        "images": len(full),
+        "thresholds": thresholds(),
+        "decisions": decisions,
+        "saved": {
+            field: 1 - total(adaptive, field) / total(full, field) if total(full, field) else 0.0
+            for field in TIMINGS
+        },
+        "model_runs": {"full": len(full) * len(CAPTIONERS), "adaptive": total(adaptive, "models_run")},
+        "gemini_calls": {
+            "full": len(full) * full_calls,
+            "adaptive": sum(full_calls - r["early_exit"]["gemini_calls_saved"] for r in adaptive.values()),
+        },
+        "quality": quality,
+        "quality_delta": {
+            m: quality["adaptive"][m] - quality["full"][m] for m in METRICS
+        } if quality["full"] and quality["adaptive"] else None,
+        "by_decision": by_decision(full, adaptive, ground_truth, engine),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images-dir", default=os.path.join(ROOT, "test_images_eval"))
+    parser.add_argument("--ground-truth", default=os.path.join(ROOT, "data.json"))
+    parser.add_argument("--output", default=None, help="write per-image results as JSON")
+    args = parser.parse_args(argv)
+
+    from evaluation import load_ground_truth
+    from caption_models import generate_all_captions
+
+    names = sorted(n for n in os.listdir(args.images_dir) if n.lower().endswith((".jpg", ".jpeg", ".png")))
+    generate_all_captions(os.path.join(args.images_dir, names[0]))  # load every model first
+
+    full = run(args.images_dir, names, adaptive=False)
+    adaptive = run(args.images_dir, names, adaptive=True)
+    summary = summarize(full, adaptive, load_ground_truth(args.ground_truth))
+
+    print(f"{summary['images']} images, thresholds {summary['thresholds']}")
+    for decision, count in sorted(summary["decisions"].items()):
+        print(f"  {decision}: {count}")
+    print(f"model runs    {summary['model_runs']['full']:>5} -> {summary['model_runs']['adaptive']}")
+    print(f"gemini calls  {summary['gemini_calls']['full']:>5} -> {summary['gemini_calls']['adaptive']}")
+    for field, saved in summary["saved"].items():
+        print(f"{field:<13} {saved * 100:>5.1f}% saved")
+    if summary["quality_delta"]:
+        print(f"{'metric':<8} {'full':>7} {'adaptive':>9} {'delta':>8}")
+        for m, delta in summary["quality_delta"].items():
+            print(f"{m:<8} {summary['quality']['full'][m]:>7.4f} "
+                  f"{summary['quality']['adaptive'][m]:>9.4f} {delta:>+8.4f}")
+
+    print(f"{'decision':<17} {'images':>6} " + " ".join(f"{f:>12}" for f in TIMINGS)
+          + " " + " ".join(f"{'d ' + m:>10}" for m in METRICS))
+    for group, row in summary["by_decision"].items():
+        saved = " ".join(f"{row['saved_s'][f]:>11.3f}s" for f in TIMINGS)
+        delta = " ".join(
+            f"{row['quality_delta'][m]:>+10.4f}" if row["quality_delta"] else f"{'-':>10}" for m in METRICS
+        )
+        print(f"{group:<17} {row['images']:>6} {saved} {delta}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "full": full, "adaptive": adaptive}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Ground-truth store benchmark: indexed SQLite store vs json.load.
+
+    python benchmarks/ground_truth.py [--images 200000] [--refs 5] [--lookups 10000]
+
+A synthetic COCO-sized data.json is written to a temporary directory.
+Reported for the store: one-off conversion time, file size, open time,
+per-image lookup p50 / p95 and streaming iteration rate; then for
+json.load: load time and lookup p50. Peak RSS is read after each phase
+(store first, since ru_maxrss never goes down).
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ground_truth_store import open_ground_truth
+
+WORDS = "a the dog cat man woman bike street beach red small walking sitting near with on under".split()
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_synthetic(path: str, images: int, refs: int, seed: int = 0):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        for i in range(images):
+            captions = [{"caption": " ".join(rng.choices(WORDS, k=10))} for _ in range(refs)]
+            f.write(f"{',' if i else ''}{json.dumps(f'{i:012d}.jpg')}: {json.dumps(captions)}\n")
+        f.write("}\n")
+
+
+def _time_lookups(ground_truth, names):
+    latencies = []
+    for name in names:
+        start = time.perf_counter()
+        ground_truth[name]
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=200000)
+    parser.add_argument("--refs", type=int, default=5, help="reference captions per image")
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="gt_bench_")
+    try:
+        source = os.path.join(tmp, "data.json")
+        write_synthetic(source, args.images, args.refs)
+        names = [f"{random.randrange(args.images):012d}.jpg" for _ in range(args.lookups)]
+        report = {"images": args.images, "json_mb": os.path.getsize(source) / 2**20}
+
+        start = time.perf_counter()
+        open_ground_truth(source).close()
+        report["convert_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        store = open_ground_truth(source)
+        report["open_s"] = time.perf_counter() - start
+        report["store_mb"] = os.path.getsize(store.path) / 2**20
+        latencies = _time_lookups(store, names)
+        report["store_lookup_p50_us"] = _percentile(latencies, 0.5) * 1e6
+        report["store_lookup_p95_us"] = _percentile(latencies, 0.95) * 1e6
+        start = time.perf_counter()
+        count = sum(1 for _ in store.items())
+        report["store_iter_images_per_s"] = count / (time.perf_counter() - start)
+        report["store_peak_rss_mb"] = _peak_rss_mb()
+        store.close()
+
+        start = time.perf_counter()
+        with open(source, encoding="utf-8") as f:
+            loaded = json.load(f)
+        report["json_load_s"] = time.perf_counter() - start
+        latencies = _time_lookups(loaded, names)
+        report["json_lookup_p50_us"] = _percentile(latencies, 0.5) * 1e6
+        report["json_peak_rss_mb"] = _peak_rss_mb()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for key, value in report.items():
+        print(f"{key:<26} {value:>12.2f}" if isinstance(value, float) else f"{key:<26} {value:>12}")
+
+
+if __name__ == "__main__":
+    main()
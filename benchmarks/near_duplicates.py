@@ -0,0 +1,134 @@
+"""
+Near-duplicate index benchmark: build / query time and match quality.
+
+    python benchmarks/near_duplicates.py [--images-dir test_images_eval] [--synthetic 100000]
+
+The originals are indexed into a temporary file, then augmented copies
+(re-encodes, resizes, crops, brightness) are looked up. Reported: hash
+and insert time, recall per augmentation at NEAR_DUP_THRESHOLD with the
+Hamming distances observed, false matches between distinct originals,
+and query latency once the index is padded with `--synthetic` random
+hashes.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image, ImageEnhance
+
+
+def _jpeg(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+
+
+def _crop(image, keep):
+    w, h = image.size
+    dx, dy = int(w * (1 - keep) / 2), int(h * (1 - keep) / 2)
+    return image.crop((dx, dy, w - dx, h - dy))
+
+
+AUGMENTATIONS = {
+    "jpeg_q30": lambda im: _jpeg(im, 30),
+    "resize_50": lambda im: im.resize((im.width // 2, im.height // 2)),
+    "resize_25_jpeg": lambda im: _jpeg(im.resize((im.width // 4, im.height // 4)), 60),
+    "png_reencode": lambda im: Image.open(io.BytesIO(_png(im))).convert("RGB"),
+    "crop_90": lambda im: _crop(im, 0.9),
+    "crop_75": lambda im: _crop(im, 0.75),
+    "crop_75_resize_50": lambda im: _crop(im, 0.75).resize((im.width * 3 // 8, im.height * 3 // 8)),
+    "brightness_120": lambda im: ImageEnhance.Brightness(im).enhance(1.2),
+}
+
+
+def _png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images-dir", default=os.path.join(ROOT, "test_images_eval"))
+    parser.add_argument("--synthetic", type=int, default=100000,
+                        help="random hashes added to measure query time at scale")
+    parser.add_argument("--save-augmented", default=None, help="also write the augmented copies here")
+    args = parser.parse_args(argv)
+
+    from image_index import NearDuplicateIndex, perceptual_hash
+    from image_ingest import load_image
+
+    names = sorted(n for n in os.listdir(args.images_dir) if n.lower().endswith((".jpg", ".jpeg", ".png")))
+    originals = {n: load_image(os.path.join(args.images_dir, n)) for n in names}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = NearDuplicateIndex(os.path.join(tmp, "index.bin"))
+
+        # Build (as the pipeline does: every crop variant of each image)
+        build_s = []
+        for image in originals.values():
+            start = time.perf_counter()
+            index.add_image(image)
+            build_s.append(time.perf_counter() - start)
+        print(f"build: {len(originals)} images ({len(index)} records), "
+              f"{1000 * sum(build_s) / len(build_s):.2f} ms/img")
+        print(f"threshold {index.threshold} -> max {index.max_distance} differing bits\n")
+
+        # Augmented copies
+        print(f"{'augmentation':<18} {'recall':>7} {'mean dist':>10} {'max dist':>9}")
+        for aug_name, augment in AUGMENTATIONS.items():
+            hits, distances = 0, []
+            for name, image in originals.items():
+                copy = augment(image.image)
+                if args.save_augmented:
+                    os.makedirs(args.save_augmented, exist_ok=True)
+                    copy.save(os.path.join(args.save_augmented, f"{aug_name}_{os.path.splitext(name)[0]}.png"))
+                match = index.query(perceptual_hash(copy), max_distance=64)
+                distances.append(match["distance"])
+                hits += match["content_hash"] == image.content_hash and match["distance"] <= index.max_distance
+            print(f"{aug_name:<18} {hits / len(originals):>7.2f} "
+                  f"{sum(distances) / len(distances):>10.1f} {max(distances):>9}")
+
+        # Distinct originals must not match each other
+        phashes = {n: perceptual_hash(im.image) for n, im in originals.items()}
+        records = index._records()
+        closest, false_matches = 64, 0
+        for name, phash in phashes.items():
+            own = originals[name].content_hash
+            others = [i for i in range(len(records)) if records["key"][i].tobytes().hex() != own]
+            distance = min(bin(phash ^ int(records["phash"][i])).count("1") for i in others)
+            closest = min(closest, distance)
+            false_matches += distance <= index.max_distance
+        print(f"\ndistinct originals: closest {closest} bits, {false_matches} false matches")
+
+        # Query latency at scale
+        rng = random.Random(0)
+        index.add_many(
+            [rng.getrandbits(64) for _ in range(args.synthetic)],
+            ["%064x" % rng.getrandbits(256) for _ in range(args.synthetic)]
+        )
+        query_s = []
+        queries = list(phashes.values()) * max(1, 200 // len(phashes))
+        index.query(queries[0])  # map the file
+        for phash in queries:
+            start = time.perf_counter()
+            index.query(phash)
+            query_s.append(time.perf_counter() - start)
+        print(f"query over {len(index)} hashes: p50 {1e6 * _percentile(query_s, 0.5):.0f} us, "
+              f"p99 {1e6 * _percentile(query_s, 0.99):.0f} us")
+
+
+if __name__ == "__main__":
+    main()
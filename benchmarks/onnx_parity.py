@@ -0,0 +1,105 @@
+"""
+ONNX Runtime backend check: caption parity and latency vs PyTorch.
+
+    python benchmarks/onnx_parity.py [--models "BLIP Base" GIT] [--min-match 0.9]
+
+Every eval image is captioned by each model with both backends (fp32,
+greedy). Reported per model: ONNX load time (the first run includes the
+export into ONNX_CACHE_DIR), exact-match rate against the PyTorch
+captions with the differing ones listed, per-image p50 latency and
+batched throughput. Exits with status 1 when a model's match rate is
+below `--min-match`.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _run_backend(captioner, images: list, batch_size: int) -> dict:
+    captioner.caption_batch(images[:1])  # first-call overhead
+    captions, per_image = [], []
+    for image in images:
+        start = time.perf_counter()
+        captions.append(captioner.caption(image))
+        per_image.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    batched = captioner.caption_batch(images, max_batch_size=batch_size)
+    batch_s = time.perf_counter() - start
+
+    per_image.sort()
+    return {
+        "captions": captions,
+        "batch_consistent": batched == captions,
+        "p50_s": per_image[len(per_image) // 2],
+        "mean_s": sum(per_image) / len(per_image),
+        "batch_images_per_s": len(images) / batch_s,
+    }
+
+
+def main(argv=None):
+    from caption_models import CAPTIONERS, DEFAULT_MAX_BATCH_SIZE
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--models", nargs="+", default=list(CAPTIONERS))
+    parser.add_argument("--images-dir", default=os.path.join(ROOT, "test_images_eval"))
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--min-match", type=float, default=0.9, help="required exact-match rate")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    from image_ingest import load_image
+
+    names = sorted(n for n in os.listdir(args.images_dir) if n.lower().endswith((".jpg", ".jpeg", ".png")))
+    images = [load_image(os.path.join(args.images_dir, n)) for n in names]
+
+    report, failed = {}, []
+    for model in args.models:
+        getter = CAPTIONERS[model]
+        torch_stats = _run_backend(getter(precision="fp32", backend="torch"), images, args.batch_size)
+
+        start = time.perf_counter()
+        onnx_captioner = getter(backend="onnx")
+        load_s = time.perf_counter() - start
+        onnx_stats = _run_backend(onnx_captioner, images, args.batch_size)
+
+        mismatches = {
+            name: {"torch": t, "onnx": o}
+            for name, t, o in zip(names, torch_stats["captions"], onnx_stats["captions"]) if t != o
+        }
+        match = 1 - len(mismatches) / len(names)
+        report[model] = {
+            "onnx_load_s": load_s,
+            "exact_match": match,
+            "mismatches": mismatches,
+            "torch": {k: v for k, v in torch_stats.items() if k != "captions"},
+            "onnx": {k: v for k, v in onnx_stats.items() if k != "captions"},
+        }
+        if match < args.min_match:
+            failed.append(model)
+
+    print(f"{'model':<10} {'load s':>7} {'match':>6} {'torch ms':>9} {'onnx ms':>8} "
+          f"{'speedup':>8} {'torch img/s':>12} {'onnx img/s':>11}")
+    for model, r in report.items():
+        print(f"{model:<10} {r['onnx_load_s']:>7.1f} {r['exact_match']:>6.2f} "
+              f"{r['torch']['p50_s'] * 1000:>9.1f} {r['onnx']['p50_s'] * 1000:>8.1f} "
+              f"{r['torch']['p50_s'] / r['onnx']['p50_s']:>7.2f}x "
+              f"{r['torch']['batch_images_per_s']:>12.2f} {r['onnx']['batch_images_per_s']:>11.2f}")
+        for name, pair in r["mismatches"].items():
+            print(f"    {name}: torch {pair['torch']!r} / onnx {pair['onnx']!r}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if failed:
+        print(f"\nparity below {args.min_match:.0%}: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Precision benchmark: latency, peak RSS and caption drift per mode.
+
+    python benchmarks/precision.py [--modes fp32 bf16 int8] [--images-dir test_images_eval]
+
+Each mode runs in its own interpreter so peak RSS is not polluted by the
+other modes. Drift is scored with the repo's metrics, using the fp32
+captions as the single reference; quality against data.json is reported
+as corpus metrics for every mode.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run_mode(precision: str, images_dir: str) -> dict:
+    """Worker: caption every image at `precision` and report stats."""
+    from caption_models import CAPTIONERS, DEFAULT_MAX_BATCH_SIZE
+    from image_ingest import load_image
+
+    names = sorted(n for n in os.listdir(images_dir) if n.lower().endswith((".jpg", ".jpeg", ".png")))
+    images = [load_image(os.path.join(images_dir, n)) for n in names]
+
+    report = {"precision": precision, "models": {}, "captions": {n: {} for n in names}}
+    for model_name, getter in CAPTIONERS.items():
+        start = time.perf_counter()
+        captioner = getter(precision)
+        load_s = time.perf_counter() - start
+
+        captioner.caption_batch(images[:1])  # first-call overhead
+        per_image = []
+        for name, image in zip(names, images):
+            start = time.perf_counter()
+            report["captions"][name][model_name] = captioner.caption(image)
+            per_image.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        captioner.caption_batch(images, max_batch_size=DEFAULT_MAX_BATCH_SIZE)
+        batch_s = time.perf_counter() - start
+
+        per_image.sort()
+        report["models"][model_name] = {
+            "effective_precision": captioner.precision,
+            "load_s": load_s,
+            "p50_s": per_image[len(per_image) // 2],
+            "mean_s": sum(per_image) / len(per_image),
+            "batch_images_per_s": len(images) / batch_s,
+        }
+
+    # ru_maxrss is in KiB on Linux
+    report["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return report
+
+
+def drift(reference: dict, candidate: dict) -> dict:
+    """Per-model metrics of `candidate` captions against fp32 captions."""
+    from evaluation import EvaluationEngine, corpus_scores
+
+    out = {}
+    models = next(iter(reference.values())).keys()
+    for model in models:
+        fp32 = {img: [{"caption": caps[model]}] for img, caps in reference.items()}
+        predictions = {img: caps[model] for img, caps in candidate.items()}
+        scores = corpus_scores(fp32, predictions, engine=EvaluationEngine(fp32))
+        scores["exact_match"] = sum(
+            predictions[img] == reference[img][model] for img in predictions
+        ) / len(predictions)
+        out[model] = scores
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modes", nargs="+", default=["fp32", "bf16", "int8"])
+    parser.add_argument("--images-dir", default=os.path.join(ROOT, "test_images_eval"))
+    parser.add_argument("--ground-truth", default=os.path.join(ROOT, "data.json"))
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_mode(args.worker, args.images_dir)))
+        return
+
+    modes = ["fp32"] + [m for m in args.modes if m != "fp32"]
+    reports = {}
+    for mode in modes:
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", mode, "--images-dir", args.images_dir],
+            check=True, capture_output=True, text=True
+        ).stdout
+        reports[mode] = json.loads(out.strip().splitlines()[-1])
+
+    from evaluation import load_ground_truth, corpus_scores, EvaluationEngine
+    ground_truth = load_ground_truth(args.ground_truth)
+    engine = EvaluationEngine(ground_truth)
+
+    summary = {}
+    for mode, report in reports.items():
+        captions = report["captions"]
+        models = next(iter(captions.values())).keys()
+        summary[mode] = {
+            "peak_rss_mb": report["peak_rss_mb"],
+            "models": report["models"],
+            "drift_vs_fp32": drift(reports["fp32"]["captions"], captions),
+            "quality": {
+                m: corpus_scores(ground_truth, {img: c[m] for img, c in captions.items()}, engine=engine)
+                for m in models
+            },
+        }
+
+    print(f"{'mode':<6} {'model':<10} {'p50 ms':>8} {'img/s':>7} {'RSS MB':>8} {'BLEU-4 vs fp32':>15} {'exact':>6}")
+    for mode, s in summary.items():
+        for model, stats in s["models"].items():
+            d = s["drift_vs_fp32"][model]
+            print(f"{mode:<6} {model:<10} {stats['p50_s'] * 1000:>8.1f} "
+                  f"{stats['batch_images_per_s']:>7.2f} {s['peak_rss_mb']:>8.0f} "
+                  f"{d['BLEU-4']:>15.3f} {d['exact_match']:>6.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "captions": {m: r["captions"] for m, r in reports.items()}}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Startup benchmark: import time and time-to-first-caption.
+
+    python benchmarks/startup.py [--image test_images_eval/img1.jpg]
+
+Every measurement runs in a fresh interpreter so module and model caches
+start cold (the Hugging Face download cache is *not* cleared).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT = """
+import json, time
+t0 = time.perf_counter()
+import pipeline
+print(json.dumps({"import_pipeline_s": time.perf_counter() - t0}))
+"""
+
+# Cold: first caption pays for every model load, one after another.
+_FIRST_CAPTION_COLD = """
+import json, time
+t0 = time.perf_counter()
+import pipeline
+from caption_models import generate_all_captions
+t1 = time.perf_counter()
+generate_all_captions(%(image)r)
+t2 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "first_caption_s": t2 - t1, "total_s": t2 - t0}))
+"""
+
+# Warm-up: models load in parallel from import time (as in app.py); the
+# first request arrives right away and waits only for what is missing.
+_FIRST_CAPTION_WARMUP = """
+import json, time
+t0 = time.perf_counter()
+import pipeline
+from warmup import start_warmup
+from caption_models import generate_all_captions
+warmup = start_warmup()
+t1 = time.perf_counter()
+generate_all_captions(%(image)r)
+t2 = time.perf_counter()
+warmup.wait()
+print(json.dumps({
+    "import_s": t1 - t0,
+    "first_caption_s": t2 - t1,
+    "total_s": t2 - t0,
+    "warmup_s": time.perf_counter() - t1,
+    "models": {k: v["seconds"] for k, v in warmup.status().items()},
+}))
+"""
+
+
+def run(code: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, check=True,
+        capture_output=True, text=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--image", default="test_images_eval/img1.jpg")
+    parser.add_argument("--repeat", type=int, default=3, help="import-time repetitions")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    imports = [run(_IMPORT)["import_pipeline_s"] for _ in range(args.repeat)]
+    results = {
+        "import_pipeline_s": min(imports),
+        "cold": run(_FIRST_CAPTION_COLD % {"image": args.image}),
+        "warmup": run(_FIRST_CAPTION_WARMUP % {"image": args.image}),
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
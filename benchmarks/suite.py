@@ -0,0 +1,252 @@
+"""
+Offline benchmark suite: every pipeline stage at several batch sizes.
+
+    python benchmarks/suite.py [--batch-sizes 1 8 32] [--repeats 5] \
+        [--output bench.json] [--baseline baseline.json --threshold 0.1]
+
+Gemini is replaced by the deterministic local stub (no jitter, no 429s,
+`--stub-latency` per call, no rate limit) and the result cache is off.
+Each batch size runs in its own interpreter so peak RSS is not polluted
+by the others; images are cycled from `--images-dir` to fill a batch.
+
+Timed stages: each captioner (`caption_batch`, as generate_all_captions
+does per model), `semantic_consensus`, `pick_best_tot_candidate`,
+`evaluate_all` and the whole pipeline (`run_captioning_pipeline`, or
+`run_captioning_pipeline_batch` for batches > 1). Reported per stage:
+p50 / p95 latency of one batch, images/s and how much the stage raised
+the process peak RSS (0 when it stays under the high-water mark left by
+earlier stages); the worker's peak RSS is reported once per batch size.
+The embedding cache is cleared before the consensus and the pipeline,
+so repeats do not turn into cache hits.
+
+With `--baseline`, a stage regresses when its p50 latency or peak RSS
+growth increases, or its throughput drops, by more than `--threshold`
+(relative; the growth must also exceed `--min-growth-mb`), and a batch
+size regresses when its worker peak RSS does; the script then exits
+with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Lower is better for every metric except throughput
+COMPARED_METRICS = {"p50_s": 1, "peak_rss_growth_mb": 1, "images_per_s": -1}
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _summarize(runs: list, batch_size: int) -> dict:
+    walls = [r["wall_s"] for r in runs]
+    return {
+        "runs": len(runs),
+        "p50_s": _percentile(walls, 0.5),
+        "p95_s": _percentile(walls, 0.95),
+        "mean_s": sum(walls) / len(walls),
+        "cpu_s": sum(r["cpu_s"] for r in runs) / len(runs),
+        "images_per_s": batch_size * len(runs) / sum(walls) if sum(walls) else 0.0,
+        # ru_maxrss is a process high-water mark: only its growth is per stage
+        "peak_rss_growth_mb": max(r["peak_rss_growth_mb"] for r in runs),
+    }
+
+
+# =========================================================
+# 🔹 WORKER (ONE BATCH SIZE PER PROCESS)
+# =========================================================
+def run_batch_size(batch_size: int, images_dir: str, ground_truth_path: str,
+                   repeats: int, stub_latency: float) -> dict:
+    from caption_models import CAPTIONERS
+    from consensus import semantic_consensus
+    from embeddings import get_embedding_service
+    from evaluation import evaluate_all, load_ground_truth
+    from gemini_fusion import GeminiClient, set_gemini_client
+    from gemini_stub import StubGenerativeModel
+    from image_ingest import load_image
+    from pipeline import run_captioning_pipeline, run_captioning_pipeline_batch
+    from profiling import measure, peak_rss_mb
+    from tot_selector import pick_best_tot_candidate
+
+    set_gemini_client(GeminiClient(model=StubGenerativeModel(latency=stub_latency)))
+    ground_truth = load_ground_truth(ground_truth_path)
+    service = get_embedding_service()
+
+    names = sorted(n for n in os.listdir(images_dir) if n.lower().endswith((".jpg", ".jpeg", ".png")))
+    names = [names[i % len(names)] for i in range(batch_size)]
+    images = [load_image(os.path.join(images_dir, n)) for n in names]
+
+    def run_pipeline():
+        if batch_size == 1:
+            return [run_captioning_pipeline(images[0], names[0], use_cache=False)]
+        return run_captioning_pipeline_batch(images, names, use_cache=False, max_batch_size=batch_size)
+
+    stages = {}
+
+    def timed(stage, fn, record):
+        result, stats = measure(fn)
+        if record:
+            stages.setdefault(stage, []).append(stats)
+        return result
+
+    # The first round loads the models and is not recorded
+    for i in range(repeats + 1):
+        record = i > 0
+        per_model = {
+            name: timed(f"captions.{name}",
+                        lambda: getter().caption_batch(images, max_batch_size=batch_size), record)
+            for name, getter in CAPTIONERS.items()
+        }
+        captions = [{name: per_model[name][j] for name in per_model} for j in range(batch_size)]
+
+        service._cache.clear()
+        consensus = timed("semantic_consensus", lambda: [semantic_consensus(c) for c in captions], record)
+        timed("pick_best_tot_candidate", lambda: [
+            pick_best_tot_candidate(c["best_caption"], list(caps.values()))
+            for c, caps in zip(consensus, captions)
+        ], record)
+        timed("evaluate_all", lambda: [
+            evaluate_all(ground_truth, name, caps) for name, caps in zip(names, captions)
+        ], record)
+
+        service._cache.clear()
+        timed("pipeline", run_pipeline, record)
+
+    return {
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {stage: _summarize(runs, batch_size) for stage, runs in stages.items()},
+    }
+
+
+# =========================================================
+# 🔹 BASELINE COMPARISON
+# =========================================================
+def compare(current: dict, baseline: dict, threshold: float, min_time_s: float = 0.001,
+            min_growth_mb: float = 16.0) -> list:
+    """
+    Regressions of `current` against `baseline` (both as written by
+    --output). Stages faster than `min_time_s` in the baseline are only
+    checked for memory: their timings are mostly noise. A stage's peak
+    RSS growth must also grow by more than `min_growth_mb`, since it is
+    often 0 in the baseline.
+    """
+    regressions = []
+
+    def check(batch_size, stage, metric, direction, base, value):
+        if metric == "peak_rss_growth_mb":
+            if value - base <= max(threshold * base, min_growth_mb):
+                return
+            change = (value - base) / base if base else float("inf")
+        else:
+            if not base:
+                return
+            change = (value - base) / base
+            if change * direction <= threshold:
+                return
+        regressions.append({
+            "batch_size": int(batch_size), "stage": stage, "metric": metric,
+            "baseline": base, "current": value, "change": change,
+        })
+
+    for batch_size, result in current["results"].items():
+        base_result = baseline["results"].get(batch_size)
+        if base_result is None:
+            continue
+        check(batch_size, "worker", "peak_rss_mb", 1, base_result["peak_rss_mb"], result["peak_rss_mb"])
+        for stage, stats in result["stages"].items():
+            base = base_result["stages"].get(stage)
+            if base is None:
+                continue
+            for metric, direction in COMPARED_METRICS.items():
+                if metric != "peak_rss_growth_mb" and base["p50_s"] < min_time_s:
+                    continue
+                check(batch_size, stage, metric, direction, base[metric], stats[metric])
+    return regressions
+
+
+def _meta(args) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "repeats": args.repeats,
+        "stub_latency_s": args.stub_latency,
+        "images_dir": os.path.relpath(args.images_dir, ROOT),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=5, help="recorded rounds per batch size")
+    parser.add_argument("--images-dir", default=os.path.join(ROOT, "test_images_eval"))
+    parser.add_argument("--ground-truth", default=os.path.join(ROOT, "data.json"))
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="seconds per stub Gemini call")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    parser.add_argument("--baseline", default=None, help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative regression")
+    parser.add_argument("--min-growth-mb", type=float, default=16.0,
+                        help="peak RSS growth of a stage below this is never a regression")
+    parser.add_argument("--worker", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_batch_size(
+            args.worker, args.images_dir, args.ground_truth, args.repeats, args.stub_latency
+        )))
+        return
+
+    # Offline and deterministic: stub Gemini without rate limiting
+    env = dict(os.environ, GEMINI_STUB="1", GEMINI_RATE_PER_SECOND="1000000", GEMINI_RATE_BURST="1000000")
+    env.pop("GEMINI_STUB_FIXTURES", None)
+    results = {}
+    for batch_size in args.batch_sizes:
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", str(batch_size), "--repeats", str(args.repeats),
+             "--images-dir", args.images_dir, "--ground-truth", args.ground_truth,
+             "--stub-latency", str(args.stub_latency)],
+            check=True, capture_output=True, text=True, env=env
+        ).stdout
+        results[str(batch_size)] = json.loads(out.strip().splitlines()[-1])
+
+    report = {"meta": _meta(args), "results": results}
+
+    print(f"{'batch':>5} {'stage':<26} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>8} {'+peak MB':>8}")
+    for batch_size, result in results.items():
+        for stage, s in result["stages"].items():
+            print(f"{batch_size:>5} {stage:<26} {s['p50_s'] * 1000:>9.2f} {s['p95_s'] * 1000:>9.2f} "
+                  f"{s['images_per_s']:>8.1f} {s['peak_rss_growth_mb']:>8.0f}")
+        print(f"{batch_size:>5} worker peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, min_growth_mb=args.min_growth_mb)
+        print(f"\nvs baseline {baseline['meta'].get('commit')} (threshold {args.threshold:.0%}): "
+              f"{len(regressions)} regression(s)")
+        for r in regressions:
+            print(f"  batch {r['batch_size']:>3} {r['stage']:<26} {r['metric']:<13} "
+                  f"{r['baseline']:.4g} -> {r['current']:.4g} ({r['change']:+.1%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from image_ingest import load_image
+
+# When set, app.py sends images to this server instead of loading models
+SERVER_URL = os.getenv("CAPTION_SERVER_URL")
+
+
+class ServerBusy(RuntimeError):
+    """The server rejected the request (503); retry after `retry_after` s."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def run_remote_pipeline(
+    server_url: str,
+    image,
+    image_name: str,
+    enable_self_correction: bool = True,
+    enable_tot: bool = True,
+    adaptive: bool = None,
+    timeout: float = 300
+) -> dict:
+    """Same result as run_captioning_pipeline, computed by server.py."""
+    image = load_image(image)
+    body = image.raw_bytes
+    if body is None:
+        import io
+        buffer = io.BytesIO()
+        image.image.save(buffer, format="PNG")
+        body = buffer.getvalue()
+
+    params = {
+        "image_name": image_name,
+        "tot": int(enable_tot),
+        "self_correction": int(enable_self_correction),
+    }
+    if adaptive is not None:
+        params["adaptive"] = int(adaptive)
+    query = urllib.parse.urlencode(params)
+    request = urllib.request.Request(
+        f"{server_url.rstrip('/')}/caption?{query}",
+        data=body,
+        method="POST",
+        headers={"content-type": "application/octet-stream"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as exc:
+        detail = exc.read().decode("utf-8", "replace")
+        if exc.code == 503:
+            raise ServerBusy(detail, float(exc.headers.get("retry-after", 1))) from None
+        raise RuntimeError(f"caption server error {exc.code}: {detail}") from None
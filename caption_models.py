@@ -1,128 +1,726 @@
-import torch
-from PIL import Image
-
-from transformers import (
-    BlipProcessor,
-    BlipForConditionalGeneration,
-    VisionEncoderDecoderModel,
-    ViTImageProcessor,
-    AutoTokenizer,
-    AutoProcessor,
-    AutoModelForCausalLM
-)
+import atexit
+import functools
+import importlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# torch / transformers are imported when a model is first built, so that
+# importing this module (and pipeline) stays cheap.
+from image_ingest import load_image, preprocess
+from model_registry import get_model_registry
+from profiling import measure
+
+# Largest number of images sent through one `generate` call.
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("CAPTION_MAX_BATCH_SIZE", "8"))
+
+
+def _device() -> str:
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+# =========================================================
+# 🔹 PRECISION MODES
+# =========================================================
+# "fp32": default weights
+# "bf16": bfloat16 weights + inputs (falls back to fp32 where unsupported)
+# "int8": dynamic int8 quantization of nn.Linear layers (CPU only)
+PRECISIONS = ("fp32", "bf16", "int8")
+
+
+def _default_precision(env_suffix: str) -> str:
+    # Per-model override (e.g. CAPTION_PRECISION_GIT=int8), then global.
+    return os.getenv(f"CAPTION_PRECISION_{env_suffix}") or os.getenv("CAPTION_PRECISION", "fp32")
+
+
+def _bf16_supported(device: str) -> bool:
+    import torch
+    if device == "cuda":
+        return torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def _apply_precision(model, precision: str, device: str):
+    """
+    Convert a freshly loaded model to `precision`.
+
+    Returns:
+        (model, effective_precision)
+    """
+    import torch
+
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, expected one of {PRECISIONS}")
+
+    if precision == "bf16":
+        if not _bf16_supported(device):
+            warnings.warn(f"bf16 is not supported on this {device}, using fp32")
+            return model, "fp32"
+        return model.to(torch.bfloat16), "bf16"
+
+    if precision == "int8":
+        if device != "cpu":
+            raise ValueError("int8 dynamic quantization is only available on CPU")
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        ), "int8"
+
+    return model, "fp32"
+
+
+def _batched(items: list, size: int):
+    if size < 1:
+        raise ValueError("max_batch_size must be >= 1")
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# =========================================================
+# 🔹 DECODING STRATEGIES
+# =========================================================
+# Named `generate()` settings, applied on top of each captioner's own
+# defaults (`generate_kwargs`). "num_return_sequences" candidates come
+# back per image and strategy.
+DECODING_STRATEGIES = {
+    "greedy": {},
+    "beam": {"num_beams": 4, "num_return_sequences": 3},
+    "sample": {"do_sample": True, "top_p": 0.9, "temperature": 0.7, "num_return_sequences": 3},
+}
+
+
+def decoding_config(strategies=None) -> dict:
+    """
+    Normalize a decoding config to {strategy_name: generate_kwargs}.
+
+    Args:
+        strategies: None (greedy only), a list of DECODING_STRATEGIES
+            names, or a dict {name: generate_kwargs} for custom settings.
+    """
+    if strategies is None:
+        return {"greedy": {}}
+    if isinstance(strategies, dict):
+        return {name: dict(kwargs) for name, kwargs in strategies.items()}
+    unknown = [name for name in strategies if name not in DECODING_STRATEGIES]
+    if unknown:
+        raise ValueError(f"Unknown decoding strategies: {unknown} (known: {list(DECODING_STRATEGIES)})")
+    return {name: dict(DECODING_STRATEGIES[name]) for name in strategies}
+
+
+def _eos_token_id(generation_config):
+    eos = generation_config.eos_token_id
+    return eos[0] if isinstance(eos, (list, tuple)) else eos
+
+
+def _scored_generate(model, generate_kwargs: dict, eos_token_id: int, **inputs):
+    """
+    `model.generate` returning the sequences and, per sequence, the sum
+    of its token log-probabilities (up to and including EOS) and the
+    number of tokens scored.
+    """
+    import torch
+
+    out = model.generate(**inputs, **generate_kwargs, output_scores=True, return_dict_in_generate=True)
+    beams = generate_kwargs.get("num_beams", 1) > 1
+    # Beam scores are already log-softmaxed; greedy / sampling scores are logits
+    scores = model.compute_transition_scores(
+        out.sequences, out.scores, out.beam_indices if beams else None, normalize_logits=not beams
+    )
+    generated = out.sequences[:, -scores.shape[1]:]
+    is_eos = generated == eos_token_id
+    seen = is_eos.int().cumsum(dim=1)
+    mask = (seen == 0) | ((seen == 1) & is_eos)  # tokens after EOS are padding
+    log_probs = torch.where(mask, scores.float(), torch.zeros_like(scores, dtype=torch.float32)).sum(dim=1)
+    return out.sequences, log_probs.tolist(), mask.sum(dim=1).tolist()
+
+
+# =========================================================
+# 🔹 BASE CAPTIONER (SINGLE + BATCHED API)
+# =========================================================
+class _Captioner:
+    """
+    Shared caption / caption_batch logic. Subclasses set
+    `self.image_processor` and implement `_generate(pixel_values)`, which
+    captions a whole batch in one forward pass (all processors resize to
+    a fixed size, so the pixel tensors stack without extra padding).
+
+    Images can be paths, bytes, PIL images or `PreparedImage`s; pass
+    PreparedImages to share one decode (and resize) across captioners.
+
+    `caption_candidates` decodes several strategies from one vision
+    encoder pass: subclasses implement `_encode(pixel_values)` and
+    `_decode(encoded, generate_kwargs)` -> (captions, log_probs, lengths).
+    """
+
+    image_processor = None
+    precision = "fp32"
+    # Default generate() settings (greedy)
+    generate_kwargs = {"max_new_tokens": 40}
+
+    def _set_model(self, model, precision: str):
+        import torch
+        self.model, self.precision = _apply_precision(model.eval(), precision, self.device)
+        self.dtype = torch.bfloat16 if self.precision == "bf16" else torch.float32
+
+    def _generate(self, pixel_values) -> list[str]:
+        raise NotImplementedError
+
+    def caption(self, image) -> str:
+        return self.caption_batch([image])[0]
+
+    def caption_batch(self, images: list, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE) -> list[str]:
+        """
+        Caption several images, `max_batch_size` at a time.
+
+        Returns:
+            list[str]: one caption per image, in input order.
+        """
+        import torch
+
+        captions = []
+        for chunk in _batched(list(images), max_batch_size):
+            prepared = [load_image(img) for img in chunk]
+            pixel_values = preprocess(self.image_processor, prepared).to(self.device, dtype=self.dtype)
+            with torch.inference_mode():
+                captions.extend(self._generate(pixel_values))
+        return captions
+
+    def _encode(self, pixel_values):
+        # No reusable encoder output: every strategy re-encodes the pixels
+        return pixel_values
+
+    def _decode(self, encoded, generate_kwargs: dict):
+        raise NotImplementedError
+
+    def caption_candidates(
+        self,
+        images: list,
+        strategies=None,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE
+    ) -> list[list[dict]]:
+        """
+        Caption each image with several decoding strategies, running the
+        vision encoder once per image for all of them.
+
+        Args:
+            strategies: see `decoding_config` (default: greedy only).
+
+        Returns:
+            list[list[dict]]: per image, its distinct candidates
+            {"caption", "strategy", "log_prob", "mean_log_prob"}, most
+            likely first (mean_log_prob = log_prob / tokens).
+        """
+        import torch
+
+        strategies = decoding_config(strategies)
+        results = []
+        for chunk in _batched(list(images), max_batch_size):
+            prepared = [load_image(img) for img in chunk]
+            pixel_values = preprocess(self.image_processor, prepared).to(self.device, dtype=self.dtype)
+            per_image = [{} for _ in chunk]
+            with torch.inference_mode():
+                encoded = self._encode(pixel_values)
+                for name, kwargs in strategies.items():
+                    kwargs = {**self.generate_kwargs, **kwargs}
+                    n = kwargs.get("num_return_sequences", 1)
+                    for i, (text, log_prob, length) in enumerate(zip(*self._decode(encoded, kwargs))):
+                        text = text.strip()
+                        candidates = per_image[i // n]
+                        # Keep the most likely occurrence of a repeated caption
+                        if text in candidates and candidates[text]["log_prob"] >= log_prob:
+                            continue
+                        candidates[text] = {
+                            "caption": text,
+                            "strategy": name,
+                            "log_prob": log_prob,
+                            "mean_log_prob": log_prob / max(length, 1),
+                        }
+            results.extend(
+                sorted(c.values(), key=lambda c: c["mean_log_prob"], reverse=True) for c in per_image
+            )
+        return results
+
 
 # =========================================================
 # 🔹 BLIP BASE
 # =========================================================
-class BlipBaseCaptioner:
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.processor = BlipProcessor.from_pretrained(
-            "Salesforce/blip-image-captioning-base"
-        )
-        self.model = BlipForConditionalGeneration.from_pretrained(
-            "Salesforce/blip-image-captioning-base"
-        ).to(self.device)
+class BlipBaseCaptioner(_Captioner):
+    def __init__(self, precision: str = "fp32", checkpoint: str = "Salesforce/blip-image-captioning-base"):
+        from transformers import BlipProcessor, BlipForConditionalGeneration
+
+        self.device = _device()
+        self.processor = BlipProcessor.from_pretrained(checkpoint)
+        self._set_model(BlipForConditionalGeneration.from_pretrained(
+            checkpoint
+        ).to(self.device), precision)
+        self.image_processor = self.processor.image_processor
 
-    def caption(self, image_path: str) -> str:
-        image = Image.open(image_path).convert("RGB")
-        inputs = self.processor(images=image, return_tensors="pt").to(self.device)
-        output = self.model.generate(**inputs, max_new_tokens=40)
-        return self.processor.decode(output[0], skip_special_tokens=True)
+    def _generate(self, pixel_values) -> list[str]:
+        output = self.model.generate(pixel_values=pixel_values, **self.generate_kwargs)
+        return self.processor.batch_decode(output, skip_special_tokens=True)
+
+    def _encode(self, pixel_values):
+        return self.model.vision_model(pixel_values=pixel_values)[0]
+
+    def _decode(self, encoded, generate_kwargs: dict):
+        # What BlipForConditionalGeneration.generate does after its own
+        # vision pass: decode from [BOS] with cross-attention on the image
+        import torch
+
+        text_config = self.model.config.text_config
+        input_ids = torch.full(
+            (encoded.shape[0], 1), text_config.bos_token_id, dtype=torch.long, device=encoded.device
+        )
+        sequences, log_probs, lengths = _scored_generate(
+            self.model.text_decoder,
+            {**generate_kwargs, "eos_token_id": text_config.sep_token_id, "pad_token_id": text_config.pad_token_id},
+            text_config.sep_token_id,
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            encoder_hidden_states=encoded,
+            encoder_attention_mask=torch.ones(encoded.shape[:-1], dtype=torch.long, device=encoded.device),
+        )
+        return self.processor.batch_decode(sequences, skip_special_tokens=True), log_probs, lengths
 
 
 # =========================================================
 # 🔹 ViT-GPT2
 # =========================================================
-class VitGpt2Captioner:
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+class VitGpt2Captioner(_Captioner):
+    # Note: GPT-2 uses Conv1D rather than nn.Linear, so "int8" only
+    # quantizes the ViT encoder and the cross-attention projections.
+    generate_kwargs = {"max_length": 30}
 
-        self.model = VisionEncoderDecoderModel.from_pretrained(
-            "nlpconnect/vit-gpt2-image-captioning"
-        ).to(self.device)
+    def __init__(self, precision: str = "fp32", checkpoint: str = "nlpconnect/vit-gpt2-image-captioning"):
+        from transformers import VisionEncoderDecoderModel, ViTImageProcessor, AutoTokenizer
 
-        self.processor = ViTImageProcessor.from_pretrained(
-            "nlpconnect/vit-gpt2-image-captioning"
-        )
+        self.device = _device()
 
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            "nlpconnect/vit-gpt2-image-captioning"
-        )
+        self._set_model(VisionEncoderDecoderModel.from_pretrained(
+            checkpoint
+        ).to(self.device), precision)
+
+        self.processor = ViTImageProcessor.from_pretrained(checkpoint)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(checkpoint)
+        self.image_processor = self.processor
+
+    def _generate(self, pixel_values) -> list[str]:
+        output_ids = self.model.generate(pixel_values, **self.generate_kwargs)
+        return self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)
 
-    def caption(self, image_path: str) -> str:
-        image = Image.open(image_path).convert("RGB")
-        pixel_values = self.processor(
-            images=image, return_tensors="pt"
-        ).pixel_values.to(self.device)
+    def _encode(self, pixel_values):
+        return self.model.encoder(pixel_values=pixel_values).last_hidden_state
 
-        output_ids = self.model.generate(pixel_values, max_length=30)
-        return self.tokenizer.decode(output_ids[0], skip_special_tokens=True)
+    def _decode(self, encoded, generate_kwargs: dict):
+        from transformers.modeling_outputs import BaseModelOutput
+
+        # generate() expands encoder_outputs in place for beams /
+        # num_return_sequences, so each strategy gets its own wrapper
+        sequences, log_probs, lengths = _scored_generate(
+            self.model, generate_kwargs, _eos_token_id(self.model.generation_config),
+            encoder_outputs=BaseModelOutput(last_hidden_state=encoded),
+        )
+        return self.tokenizer.batch_decode(sequences, skip_special_tokens=True), log_probs, lengths
 
 
 # =========================================================
 # 🔹 GIT (microsoft/git-base)
 # =========================================================
-class GitCaptioner:
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.processor = AutoProcessor.from_pretrained("microsoft/git-base")
-        self.model = AutoModelForCausalLM.from_pretrained(
-            "microsoft/git-base"
-        ).to(self.device)
+class GitCaptioner(_Captioner):
+    # GIT feeds the image features as a prefix of its own decoder and has
+    # no hook for precomputed ones, so each strategy re-encodes the pixels.
+    def __init__(self, precision: str = "fp32", checkpoint: str = "microsoft/git-base"):
+        from transformers import AutoProcessor, AutoModelForCausalLM
+
+        self.device = _device()
+        self.processor = AutoProcessor.from_pretrained(checkpoint)
+        self._set_model(AutoModelForCausalLM.from_pretrained(
+            checkpoint
+        ).to(self.device), precision)
+        self.image_processor = self.processor.image_processor
+
+    def _generate(self, pixel_values) -> list[str]:
+        output = self.model.generate(pixel_values=pixel_values, **self.generate_kwargs)
+        return self.processor.batch_decode(output, skip_special_tokens=True)
+
+    def _decode(self, encoded, generate_kwargs: dict):
+        sequences, log_probs, lengths = _scored_generate(
+            self.model, generate_kwargs, _eos_token_id(self.model.generation_config),
+            pixel_values=encoded,
+        )
+        return self.processor.batch_decode(sequences, skip_special_tokens=True), log_probs, lengths
+
+
+# =========================================================
+# 🔹 CAPTIONER REGISTRY (LOADED ON DEMAND, EVICTED UNDER A RAM BUDGET)
+# =========================================================
+# Models live in model_registry: one instance per precision mode, loaded
+# on first use and evicted (least recently used first) when the resident
+# models exceed MODEL_MEMORY_BUDGET_MB. The registry serializes loads,
+# so the warm-up thread and a request never build the same model twice.
+# Default precision: CAPTION_PRECISION_<MODEL> or CAPTION_PRECISION (fp32).
+# Default backend: CAPTION_BACKEND_<MODEL> or CAPTION_BACKEND ("torch";
+# "onnx" runs the exported graphs with ONNX Runtime, see onnx_backend).
+BACKENDS = ("torch", "onnx")
+
+# Display name -> getter(precision=None, backend=None), in the order
+# captions are reported.
+CAPTIONERS = {}
+
+# Display name -> suffix of its CAPTION_PRECISION_<SUFFIX> /
+# CAPTION_BACKEND_<SUFFIX> overrides
+_PRECISION_ENV = {}
+
+# Display name -> factory of its ONNX Runtime captioner
+_ONNX_FACTORIES = {}
+
+# Display name -> checkpoint / factory of captioners added by config
+_CAPTIONER_SOURCES = {}
+
+# "type" values accepted in CAPTION_MODELS_CONFIG
+CAPTIONER_TYPES = {
+    "blip": BlipBaseCaptioner,
+    "vit-gpt2": VitGpt2Captioner,
+    "git": GitCaptioner,
+}
+
+
+def _default_backend(env_suffix: str) -> str:
+    return os.getenv(f"CAPTION_BACKEND_{env_suffix}") or os.getenv("CAPTION_BACKEND", "torch")
+
+
+def _onnx_captioner(kind: str, **kwargs):
+    from onnx_backend import ONNX_CAPTIONERS
+    return ONNX_CAPTIONERS[kind](**kwargs)
+
+
+def register_captioner(name: str, factory, env_suffix: str = None, source=None, onnx_factory=None):
+    """
+    Add a captioner to the pipeline.
+
+    Args:
+        name: display name, used as key in every captions dict.
+        factory: `factory(precision)` builds the captioner (a _Captioner).
+        env_suffix: its CAPTION_PRECISION_<SUFFIX> / CAPTION_BACKEND_<SUFFIX>
+            overrides (default: derived from the name).
+        source: checkpoint / factory description, part of captioner_config.
+        onnx_factory: `onnx_factory()` builds its ONNX Runtime captioner,
+            if it has one.
+
+    Returns:
+        the getter, also stored in CAPTIONERS[name].
+    """
+    # The ONNX captioner lives in the registry as variant "onnx"
+    get_model_registry().register(
+        name, lambda variant: onnx_factory() if variant == "onnx" else factory(variant)
+    )
+    _PRECISION_ENV[name] = env_suffix or re.sub(r"[^A-Z0-9]+", "_", name.upper()).strip("_")
+    _ONNX_FACTORIES[name] = onnx_factory
+    if source is not None:
+        _CAPTIONER_SOURCES[name] = source
+
+    def getter(precision: str = None, backend: str = None):
+        backend = backend or _default_backend(_PRECISION_ENV[name])
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        if backend == "onnx":
+            if onnx_factory is None:
+                raise ValueError(f"{name} has no ONNX backend")
+            return get_model_registry().get(name, "onnx")
+        return get_model_registry().get(name, precision or _default_precision(_PRECISION_ENV[name]))
+
+    CAPTIONERS[name] = getter
+    return getter
+
+
+def register_captioners_from_config(path: str):
+    """
+    Register the captioners listed in a JSON file, e.g.:
+
+        [
+            {"name": "BLIP Large", "type": "blip",
+             "checkpoint": "Salesforce/blip-image-captioning-large"},
+            {"name": "My model", "factory": "my_package.captioners:build"}
+        ]
+
+    "type" is one of CAPTIONER_TYPES; "factory" is a "module:callable"
+    taking the precision. "env_suffix" is optional.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    for entry in entries:
+        if "factory" in entry:
+            module_name, _, attr = entry["factory"].partition(":")
+            factory = getattr(importlib.import_module(module_name), attr)
+            onnx_factory = None
+            source = entry["factory"]
+        else:
+            cls = CAPTIONER_TYPES[entry["type"]]
+            factory = functools.partial(cls, checkpoint=entry["checkpoint"])
+            onnx_factory = functools.partial(_onnx_captioner, entry["type"], checkpoint=entry["checkpoint"])
+            source = f"{entry['type']}:{entry['checkpoint']}"
+        register_captioner(entry["name"], factory, entry.get("env_suffix"), source, onnx_factory)
+
+
+get_blip_base = register_captioner(
+    "BLIP Base", BlipBaseCaptioner, "BLIP", onnx_factory=functools.partial(_onnx_captioner, "blip")
+)
+get_vit_gpt2 = register_captioner(
+    "ViT-GPT2", VitGpt2Captioner, "VIT_GPT2", onnx_factory=functools.partial(_onnx_captioner, "vit-gpt2")
+)
+get_git = register_captioner(
+    "GIT", GitCaptioner, "GIT", onnx_factory=functools.partial(_onnx_captioner, "git")
+)
+
+# Extra captioners (also picked up by spawned worker processes)
+if os.getenv("CAPTION_MODELS_CONFIG"):
+    register_captioners_from_config(os.getenv("CAPTION_MODELS_CONFIG"))
 
-    def caption(self, image_path: str) -> str:
-        image = Image.open(image_path).convert("RGB")
-        inputs = self.processor(images=image, return_tensors="pt").to(self.device)
-        output = self.model.generate(**inputs, max_new_tokens=40)
-        return self.processor.decode(output[0], skip_special_tokens=True)
+
+def captioner_config() -> dict:
+    """Everything that changes the captions, e.g. for cache keys."""
+    config = {}
+    for name in CAPTIONERS:
+        config[name] = {"precision": _default_precision(_PRECISION_ENV[name])}
+        if _ONNX_FACTORIES[name] is not None and _default_backend(_PRECISION_ENV[name]) == "onnx":
+            config[name] = {"backend": "onnx"}
+        if name in _CAPTIONER_SOURCES:
+            config[name]["source"] = _CAPTIONER_SOURCES[name]
+    return config
+
+
+def model_stats() -> dict:
+    """Load time, resident size and usage of every model loaded so far."""
+    registry = get_model_registry()
+    return {**registry.summary(), "models": registry.stats()}
 
 
 # =========================================================
-# 🔹 SINGLETONS (MODELS LOADED ONCE)
+# 🔹 EXECUTION MODES (SEQUENTIAL / THREADS / PROCESSES)
 # =========================================================
-_blip_instance = None
-_vit_gpt2_instance = None
-_git_instance = None
+# "sequential": one model after another (lowest memory)
+# "threads":    all models at once in this process, intra-op threads split
+# "processes":  one resident worker process per model
+EXECUTION_MODES = ("sequential", "threads", "processes")
+DEFAULT_EXECUTION_MODE = os.getenv("CAPTION_EXECUTION_MODE", "sequential")
+
+_thread_pool = None
+_process_pools = {}
+# Pipelines run in several threads (server, job queue): create each pool once
+_pools_lock = threading.Lock()
+
 
+def _threads_per_model() -> int:
+    return max(1, (os.cpu_count() or 1) // len(CAPTIONERS))
 
-def get_blip_base():
-    global _blip_instance
-    if _blip_instance is None:
-        _blip_instance = BlipBaseCaptioner()
-    return _blip_instance
 
+def _timed_caption_batch(name: str, images: list, max_batch_size: int, num_threads: int = None):
+    # torch.set_num_threads only affects the calling thread's OpenMP
+    # team, so each pool thread gets its own share of the cores.
+    # CPU time: in "threads" mode the other models share this process, so
+    # only this thread's CPU time is attributable (intra-op helper threads
+    # are missed); otherwise the whole process' CPU time is.
+    cpu_clock = time.process_time
+    if num_threads:
+        import torch
+        torch.set_num_threads(num_threads)
+        cpu_clock = time.thread_time
+    return measure(
+        lambda: CAPTIONERS[name]().caption_batch(images, max_batch_size=max_batch_size),
+        cpu_clock=cpu_clock
+    )
 
-def get_vit_gpt2():
-    global _vit_gpt2_instance
-    if _vit_gpt2_instance is None:
-        _vit_gpt2_instance = VitGpt2Captioner()
-    return _vit_gpt2_instance
 
+def _get_thread_pool():
+    global _thread_pool
+    with _pools_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=len(CAPTIONERS), thread_name_prefix="captioner"
+            )
+        return _thread_pool
 
-def get_git():
-    global _git_instance
-    if _git_instance is None:
-        _git_instance = GitCaptioner()
-    return _git_instance
+
+def _init_process_worker(name: str, num_threads: int):
+    import torch
+    torch.set_num_threads(num_threads)
+    CAPTIONERS[name]()  # keep the model resident in this worker
+
+
+def _get_process_pool(name: str):
+    with _pools_lock:
+        if name not in _process_pools:
+            _process_pools[name] = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+                initargs=(name, _threads_per_model()),
+            )
+        return _process_pools[name]
+
+
+def shutdown_workers():
+    """Stop the captioner thread / process pools (no-op if never started)."""
+    global _thread_pool
+    with _pools_lock:
+        if _thread_pool is not None:
+            _thread_pool.shutdown(wait=False)
+            _thread_pool = None
+        for pool in _process_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _process_pools.clear()
+
+
+atexit.register(shutdown_workers)
+
+
+def _iter_captioners(images: list, max_batch_size: int, execution_mode: str = None, models=None):
+    """
+    Yield (model_name, captions, stats) as each model finishes (see
+    profiling.measure). `models` restricts the run to a subset of CAPTIONERS.
+    """
+    mode = execution_mode or DEFAULT_EXECUTION_MODE
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode {mode!r}, expected one of {EXECUTION_MODES}")
+    names = list(CAPTIONERS) if models is None else [name for name in CAPTIONERS if name in models]
+
+    if mode == "sequential":
+        for name in names:
+            yield (name, *_timed_caption_batch(name, images, max_batch_size))
+        return
+
+    if mode == "threads":
+        pool = _get_thread_pool()
+        futures = {
+            pool.submit(_timed_caption_batch, name, images, max_batch_size, _threads_per_model()): name
+            for name in names
+        }
+    else:
+        # Ship encoded bytes when we have them: much smaller than pixels
+        payload = [img.raw_bytes if img.raw_bytes is not None else img.image for img in images]
+        futures = {
+            _get_process_pool(name).submit(_timed_caption_batch, name, payload, max_batch_size): name
+            for name in names
+        }
+
+    for future in as_completed(futures):
+        yield (futures[future], *future.result())
+
+
+def _run_captioners(images: list, max_batch_size: int, execution_mode: str = None):
+    outputs = {
+        name: (captions, stats)
+        for name, captions, stats in _iter_captioners(images, max_batch_size, execution_mode)
+    }
+    # Report in CAPTIONERS order, whatever the completion order was
+    captions = {name: outputs[name][0] for name in CAPTIONERS}
+    timings = {name: outputs[name][1]["wall_s"] for name in CAPTIONERS}
+    return captions, timings
 
 
 # =========================================================
 # 🔹 MAIN MULTI-MODEL API
 # =========================================================
-def generate_all_captions(image_path: str) -> dict:
+def generate_all_captions(image, execution_mode: str = None, return_timings: bool = False):
     """
     Generate captions using all available vision–language models.
 
+    The image (path, bytes, PIL image or PreparedImage) is decoded once
+    and shared by every model. `execution_mode` overrides
+    CAPTION_EXECUTION_MODE ("sequential", "threads" or "processes").
+
     Returns:
         dict: {
             "BLIP Base": "...",
             "ViT-GPT2": "...",
             "GIT": "..."
         }
+        or (captions, timings) when `return_timings` is set, where
+        timings maps each model to its wall time in seconds.
     """
-    return {
-        "BLIP Base": get_blip_base().caption(image_path),
-        "ViT-GPT2": get_vit_gpt2().caption(image_path),
-        "GIT": get_git().caption(image_path)
-    }
+    image = load_image(image)
+    captions, timings = _run_captioners([image], max_batch_size=1, execution_mode=execution_mode)
+    captions = {name: values[0] for name, values in captions.items()}
+    if return_timings:
+        return captions, timings
+    return captions
+
+
+def iter_captions(image, execution_mode: str = None, models=None):
+    """
+    Streaming version of `generate_all_captions`: yields
+    (model_name, caption, stats) as soon as each model is done, so with
+    "threads" / "processes" the fastest model comes first. `stats` holds
+    wall_s, cpu_s and memory figures (see profiling.measure).
+    `models` restricts the run to those captioner names.
+    """
+    image = load_image(image)
+    for name, captions, stats in _iter_captioners([image], 1, execution_mode, models):
+        yield name, captions[0], stats
+
+
+def generate_all_captions_batch(
+    images: list,
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    execution_mode: str = None,
+    return_timings: bool = False
+):
+    """
+    Batched version of `generate_all_captions`.
+
+    Each model captions the images `max_batch_size` at a time, which
+    amortizes the per-call `generate` overhead on CPU.
+
+    Returns:
+        list[dict]: one {model_name: caption} dict per image, in input order,
+        or (results, timings) when `return_timings` is set, where timings
+        maps each model to its wall time for the whole batch.
+    """
+    images = [load_image(img) for img in images]
+    captions, timings = _run_captioners(images, max_batch_size, execution_mode=execution_mode)
+    results = [{} for _ in images]
+    for name, values in captions.items():
+        for result, caption in zip(results, values):
+            result[name] = caption
+    if return_timings:
+        return results, timings
+    return results
+
+
+def generate_caption_candidates(
+    images: list,
+    strategies=None,
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    models=None
+) -> list[dict]:
+    """
+    Several candidate captions per model and image, with their
+    log-probabilities (see `_Captioner.caption_candidates`). Models run
+    one after another, always on the PyTorch backend (the ONNX one only
+    decodes greedily), whatever CAPTION_BACKEND says.
+
+    Args:
+        strategies: see `decoding_config`.
+        models: model names to run (default: all).
+
+    Returns:
+        list[dict]: per image, {model_name: [candidate, ...]}.
+    """
+    images = [load_image(img) for img in images]
+    results = [{} for _ in images]
+    for name in models or list(CAPTIONERS):
+        candidates = CAPTIONERS[name](backend="torch").caption_candidates(
+            images, strategies=strategies, max_batch_size=max_batch_size
+        )
+        for result, values in zip(results, candidates):
+            result[name] = values
+    return results
@@ -1,25 +1,19 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+
+from embeddings import get_embedding_service
 
 
 # =========================================================
-# 🔹 LOAD EMBEDDING MODEL (ONCE)
+# 🔹 EMBEDDING MODEL (SHARED WITH tot_selector)
 # =========================================================
-_embedding_model = None
-
-
 def get_embedding_model():
-    global _embedding_model
-    if _embedding_model is None:
-        _embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
-    return _embedding_model
+    return get_embedding_service().model
 
 
 # =========================================================
 # 🔹 SEMANTIC CONSENSUS
 # =========================================================
-def semantic_consensus(captions: dict) -> dict:
+def semantic_consensus(captions: dict, confidences: dict = None) -> dict:
     """
     Compute a semantic consensus among multiple captions.
 
@@ -29,6 +23,8 @@ def semantic_consensus(captions: dict) -> dict:
             "ViT-GPT2": "...",
             "GIT": "..."
         }
+        confidences (dict, optional): weight of each caption's vote
+            (e.g. its model probability); uniform by default.
 
     Returns:
         dict: {
@@ -39,17 +35,26 @@ def semantic_consensus(captions: dict) -> dict:
         }
     """
 
+    embeddings = get_embedding_service().encode(list(captions.values()))
+    return consensus_from_embeddings(captions, embeddings, confidences)
+
+
+def consensus_from_embeddings(captions: dict, embeddings: np.ndarray, confidences: dict = None) -> dict:
+    """`semantic_consensus` from already computed caption embeddings."""
     model_names = list(captions.keys())
     texts = list(captions.values())
+    service = get_embedding_service()
 
-    model = get_embedding_model()
-    embeddings = model.encode(texts)
-
-    # Similarity matrix
-    sim_matrix = cosine_similarity(embeddings)
+    # Similarity matrix (unit-norm embeddings -> cosine = dot product)
+    sim_matrix = service.similarity(embeddings, embeddings)
 
-    # Mean similarity score for each caption
-    mean_scores = sim_matrix.mean(axis=1)
+    # Mean similarity score for each caption (weighted by the confidence
+    # of the captions it agrees with)
+    if confidences:
+        weights = np.array([confidences[name] for name in model_names], dtype=np.float64)
+        mean_scores = sim_matrix @ weights / weights.sum()
+    else:
+        mean_scores = sim_matrix.mean(axis=1)
 
     best_index = int(np.argmax(mean_scores))
 
@@ -62,3 +67,31 @@ def semantic_consensus(captions: dict) -> dict:
         },
         "similarity_matrix": sim_matrix.tolist()
     }
+
+
+# =========================================================
+# 🔹 CONSENSUS OVER DECODING CANDIDATES
+# =========================================================
+def candidate_consensus(candidates: dict) -> dict:
+    """
+    Consensus over several candidates per model (see
+    caption_models.generate_caption_candidates), each weighted by its
+    per-token probability exp(mean_log_prob).
+
+    Args:
+        candidates (dict): {model_name: [{"caption", "strategy",
+            "mean_log_prob", ...}, ...]}
+
+    Returns:
+        dict: as `semantic_consensus`, keyed by "model (strategy #i)",
+        plus "confidences".
+    """
+    captions, confidences = {}, {}
+    for model_name, values in candidates.items():
+        for i, candidate in enumerate(values, start=1):
+            label = f"{model_name} ({candidate['strategy']} #{i})"
+            captions[label] = candidate["caption"]
+            confidences[label] = float(np.exp(candidate["mean_log_prob"]))
+    result = semantic_consensus(captions, confidences)
+    result["confidences"] = confidences
+    return result
@@ -0,0 +1,94 @@
+import os
+
+
+# =========================================================
+# 🔹 SETTINGS
+# =========================================================
+# Adaptive mode: stop spending compute once the models already agree.
+ADAPTIVE = os.getenv("CAPTION_ADAPTIVE", "0") == "1"
+
+# Captioners run in two waves: the first ones always, the rest only
+# when the first wave disagrees.
+MODEL_ORDER = tuple(
+    name.strip()
+    for name in os.getenv("ADAPTIVE_MODEL_ORDER", "BLIP Base,GIT,ViT-GPT2").split(",")
+    if name.strip()
+)
+FIRST_WAVE = int(os.getenv("ADAPTIVE_FIRST_WAVE", "2"))
+
+# Agreement = mean pairwise cosine similarity between the captions
+SKIP_MODELS_THRESHOLD = float(os.getenv("ADAPTIVE_SKIP_MODELS_THRESHOLD", "0.85"))
+CONSENSUS_THRESHOLD = float(os.getenv("ADAPTIVE_CONSENSUS_THRESHOLD", "0.9"))
+FUSION_ONLY_THRESHOLD = float(os.getenv("ADAPTIVE_FUSION_ONLY_THRESHOLD", "0.75"))
+
+
+def thresholds() -> dict:
+    return {
+        "skip_models": SKIP_MODELS_THRESHOLD,
+        "consensus": CONSENSUS_THRESHOLD,
+        "fusion_only": FUSION_ONLY_THRESHOLD,
+    }
+
+
+def config() -> dict:
+    """Everything that changes adaptive decisions (used in cache keys)."""
+    return {"order": list(MODEL_ORDER), "first_wave": FIRST_WAVE, **thresholds()}
+
+
+# =========================================================
+# 🔹 DECISIONS
+# =========================================================
+def model_waves(available) -> list:
+    """
+    Split the available captioners into [first_wave, rest]. Models missing
+    from MODEL_ORDER go to the second wave, in their usual order.
+    """
+    ordered = [name for name in MODEL_ORDER if name in available]
+    ordered += [name for name in available if name not in ordered]
+    return [ordered[:FIRST_WAVE], ordered[FIRST_WAVE:]]
+
+
+def agreement(consensus: dict) -> float:
+    """
+    Mean pairwise similarity between the captions of a consensus
+    (the diagonal, always 1.0, is left out).
+    """
+    matrix = consensus["similarity_matrix"]
+    n = len(matrix)
+    if n < 2:
+        return 1.0
+    total = sum(matrix[i][j] for i in range(n) for j in range(n) if i != j)
+    return float(total / (n * (n - 1)))
+
+
+def should_skip_models(score: float) -> bool:
+    return score >= SKIP_MODELS_THRESHOLD
+
+
+def gemini_plan(score: float, enable_tot: bool, enable_self_correction: bool) -> dict:
+    """
+    Choose how much Gemini work an image needs:
+
+        "consensus"  agreement >= CONSENSUS_THRESHOLD: keep the consensus
+                     caption as is (no Gemini call)
+        "fusion"     agreement >= FUSION_ONLY_THRESHOLD: one simple fusion
+                     call, no ToT and no self-correction
+        "full"       the requested ToT / self-correction path
+
+    Returns:
+        dict: {"mode", "tot", "self_correction", "calls", "calls_saved"}
+    """
+    full_calls = (2 if enable_tot else 1) + (1 if enable_self_correction else 0)
+    if score >= CONSENSUS_THRESHOLD:
+        mode, tot, self_correction, calls = "consensus", False, False, 0
+    elif score >= FUSION_ONLY_THRESHOLD:
+        mode, tot, self_correction, calls = "fusion", False, False, 1
+    else:
+        mode, tot, self_correction, calls = "full", enable_tot, enable_self_correction, full_calls
+    return {
+        "mode": mode,
+        "tot": tot,
+        "self_correction": self_correction,
+        "calls": calls,
+        "calls_saved": full_calls - calls,
+    }
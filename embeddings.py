@@ -0,0 +1,103 @@
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from model_registry import get_model_registry
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+
+
+def _load_sentence_transformer(model_name: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def normalize_text(text: str) -> str:
+    # all-MiniLM-L6-v2 has an uncased tokenizer, so case folding and
+    # whitespace collapsing never change the embedding.
+    return " ".join(text.split()).lower()
+
+
+# =========================================================
+# 🔹 SHARED EMBEDDING SERVICE
+# =========================================================
+class EmbeddingService:
+    """
+    One SentenceTransformer shared by consensus and ToT selection.
+
+    `encode` returns L2-normalized float32 vectors, so cosine similarity
+    is a plain matrix product. Embeddings are kept in an LRU cache keyed
+    by normalized text, and all cache misses of a call are encoded in a
+    single batch. The SentenceTransformer itself lives in the model
+    registry, so it counts against MODEL_MEMORY_BUDGET_MB like the
+    captioners.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, cache_size: int = EMBEDDING_CACHE_SIZE):
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self._model = None  # set to use a model outside the registry
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        get_model_registry().register(
+            model_name, functools.partial(_load_sentence_transformer, model_name),
+            kind="embedding", replace=True
+        )
+
+    @property
+    def model(self):
+        if self._model is not None:
+            return self._model
+        return get_model_registry().get(self.model_name)
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: (len(texts), dim) float32, unit-norm rows.
+        """
+        keys = [normalize_text(t) for t in texts]
+
+        with self._lock:
+            found = {k: self._cache[k] for k in keys if k in self._cache}
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+
+        if missing:
+            vectors = self.model.encode(
+                missing, normalize_embeddings=True, convert_to_numpy=True
+            ).astype(np.float32, copy=False)
+            found.update(zip(missing, vectors))
+
+        with self._lock:
+            for key in keys:
+                self._cache[key] = found[key]
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        rows = [found[key] for key in keys]
+        return np.stack(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+    def prefetch(self, texts: list[str]):
+        """Warm the cache for every text a run will need, in one batch."""
+        self.encode(texts)
+
+    @staticmethod
+    def similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """Cosine similarity of unit-norm rows."""
+        return a @ b.T
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service() -> EmbeddingService:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService()
+        return _service
@@ -1,15 +1,23 @@
-import json
-from nltk import word_tokenize, pos_tag
-from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
-from nltk.translate.meteor_score import meteor_score
-from rouge_score import rouge_scorer
+import math
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from ground_truth_store import GROUND_TRUTH_PATH, open_ground_truth
+
+# nltk / rouge_score are imported on first use so that importing this
+# module (and pipeline) does not slow down app startup.
 
 # =============================
 # Ground truth loader
 # =============================
-def load_ground_truth(path="data.json"):
-    with open(path, encoding="utf-8") as f:
-        return json.load(f)
+def load_ground_truth(path=GROUND_TRUTH_PATH):
+    """
+    {image_name: [{"caption": ...}, ...]} for `path`, served from an
+    indexed on-disk store (see ground_truth_store.py): the JSON file is
+    converted once, then each lookup reads only that image's references.
+    """
+    return open_ground_truth(path)
 
 # =============================
 # SPICE-like
@@ -21,6 +29,7 @@ CONTENT_TAGS = {
 }
 
 def sentence_to_concept_set(sentence: str):
+    from nltk import word_tokenize, pos_tag
     tokens = word_tokenize(sentence.lower())
     tagged = pos_tag(tokens)
     return {word for (word, tag) in tagged if tag in CONTENT_TAGS}
@@ -47,10 +56,19 @@ def spice_like_for_one(refs, hypo):
 # =============================
 # BLEU / METEOR / ROUGE-L
 # =============================
-smooth = SmoothingFunction().method1
-rouge = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
+@lru_cache(maxsize=None)
+def _smoothing():
+    from nltk.translate.bleu_score import SmoothingFunction
+    return SmoothingFunction()
+
+@lru_cache(maxsize=None)
+def _rouge():
+    from rouge_score import rouge_scorer
+    return rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
 
 def compute_bleu_scores(refs, hypo):
+    from nltk.translate.bleu_score import sentence_bleu
+    smooth = _smoothing().method1
     refs_tok = [r.lower().split() for r in refs]
     hypo_tok = hypo.lower().split()
 
@@ -62,6 +80,7 @@ def compute_bleu_scores(refs, hypo):
     return bleu1, bleu2, bleu3, bleu4
 
 def compute_meteor(refs, hypo):
+    from nltk.translate.meteor_score import meteor_score
     refs_tok = [r.lower().split() for r in refs]
     hypo_tok = hypo.lower().split()
     return meteor_score(refs_tok, hypo_tok)
@@ -69,7 +88,7 @@ def compute_meteor(refs, hypo):
 def compute_rouge_l(refs, hypo):
     best = 0
     for ref in refs:
-        score = rouge.score(ref, hypo)['rougeL'].fmeasure
+        score = _rouge().score(ref, hypo)['rougeL'].fmeasure
         best = max(best, score)
     return best
 
@@ -99,3 +118,229 @@ def evaluate_all(ground_truth, img_name, captions_dict):
     captions_dict: {"BLIP Base": "...", "ViT-GPT2": "...", "BLIP-2": "...", "Gemini-Fusion": "..."}
     """
     return {k: evaluate_caption(ground_truth, img_name, v) for k, v in captions_dict.items()}
+
+BLEU_WEIGHTS = {
+    "BLEU-1": (1, 0, 0, 0),
+    "BLEU-2": (0.5, 0.5, 0, 0),
+    "BLEU-3": (0.33, 0.33, 0.33, 0),
+    "BLEU-4": (0.25, 0.25, 0.25, 0.25),
+}
+
+# =============================
+# Cached evaluation engine
+# =============================
+# Same numbers as evaluate_caption, but every reference is tokenized,
+# n-gram counted and POS-tagged once, and identical hypotheses are only
+# scored once.
+
+MAX_NGRAM = 4
+
+# Depending on the nltk version, modified_precision either keeps the raw
+# denominator or reduces the fraction (0/d -> 0/1), which changes what
+# method1 smoothing divides epsilon by. Probe once and mirror it.
+@lru_cache(maxsize=None)
+def _nltk_reduces_fractions():
+    from nltk.translate.bleu_score import modified_precision
+    return modified_precision([["a"]], ["b", "c"], 1).denominator != 2
+
+
+@lru_cache(maxsize=None)
+def _rouge_tokenizer():
+    from rouge_score import tokenizers
+    return tokenizers.DefaultTokenizer(use_stemmer=True)
+
+
+def _ngram_counts(tokens, n):
+    return Counter(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+
+
+@lru_cache(maxsize=16384)
+def _concepts(sentence: str) -> frozenset:
+    return frozenset(sentence_to_concept_set(sentence))
+
+
+def _lcs_length(a, b):
+    prev = [0] * (len(b) + 1)
+    for x in a:
+        cur = [0]
+        for j, y in enumerate(b, start=1):
+            cur.append(prev[j - 1] + 1 if x == y else max(prev[j], cur[j - 1]))
+        prev = cur
+    return prev[-1]
+
+
+class ReferenceSet:
+    """Everything the metrics need from one image's references, computed once."""
+
+    def __init__(self, captions):
+        self.captions = captions
+        self.tokens = [c.lower().split() for c in captions]
+        self.lengths = [len(t) for t in self.tokens]
+        # For each n, the max count of every n-gram over all references
+        self.max_counts = []
+        for n in range(1, MAX_NGRAM + 1):
+            merged = Counter()
+            for toks in self.tokens:
+                merged |= _ngram_counts(toks, n)
+            self.max_counts.append(merged)
+        self.concepts = [_concepts(c) for c in captions]
+        self.rouge_tokens = [_rouge_tokenizer().tokenize(c) for c in captions]
+
+    # -----------------------------
+    # metrics
+    # -----------------------------
+    def spice_like(self, hypo):
+        h_set = _concepts(hypo)
+        if not h_set:
+            return 0.0
+        best_f1 = 0.0
+        for r_set in self.concepts:
+            inter = len(h_set & r_set)
+            if inter == 0:
+                continue
+            prec = inter / len(h_set)
+            rec = inter / len(r_set)
+            f1 = 0 if prec + rec == 0 else 2 * prec * rec / (prec + rec)
+            best_f1 = max(best_f1, f1)
+        return best_f1
+
+    def bleu(self, hypo_tok):
+        """BLEU-1..4 from one set of clipped n-gram precisions (nltk method1 smoothing)."""
+        p_n = []
+        for n in range(1, MAX_NGRAM + 1):
+            counts = _ngram_counts(hypo_tok, n)
+            max_counts = self.max_counts[n - 1]
+            numerator = sum(min(c, max_counts[g]) for g, c in counts.items())
+            denominator = max(1, sum(counts.values()))
+            p_n.append((numerator, denominator))
+
+        if p_n[0][0] == 0:
+            return (0, 0, 0, 0)
+
+        smoothed = []
+        for numerator, denominator in p_n:
+            if numerator == 0:
+                if _nltk_reduces_fractions():
+                    denominator = 1
+                smoothed.append((numerator + _smoothing().epsilon) / denominator)
+            else:
+                smoothed.append(numerator / denominator)
+
+        hyp_len = len(hypo_tok)
+        ref_len = min(self.lengths, key=lambda r: (abs(r - hyp_len), r))
+        if hyp_len > ref_len:
+            bp = 1
+        elif hyp_len == 0:
+            bp = 0
+        else:
+            bp = math.exp(1 - ref_len / hyp_len)
+
+        return tuple(
+            bp * math.exp(math.fsum(w * math.log(p) for w, p in zip(weights, smoothed) if p > 0))
+            for weights in BLEU_WEIGHTS.values()
+        )
+
+    def meteor(self, hypo_tok):
+        from nltk.translate.meteor_score import meteor_score
+        return meteor_score(self.tokens, hypo_tok)
+
+    def rouge_l(self, hypo):
+        h_tok = _rouge_tokenizer().tokenize(hypo)
+        best = 0
+        for r_tok in self.rouge_tokens:
+            if not r_tok or not h_tok:
+                score = 0
+            else:
+                lcs = _lcs_length(r_tok, h_tok)
+                prec = lcs / len(h_tok)
+                rec = lcs / len(r_tok)
+                score = 2 * prec * rec / (prec + rec) if prec + rec > 0 else 0.0
+            best = max(best, score)
+        return best
+
+    def evaluate(self, hypo):
+        hypo_tok = hypo.lower().split()
+        bleu1, bleu2, bleu3, bleu4 = self.bleu(hypo_tok)
+        return {
+            "SPICE": self.spice_like(hypo),
+            "BLEU-1": bleu1,
+            "BLEU-2": bleu2,
+            "BLEU-3": bleu3,
+            "BLEU-4": bleu4,
+            "METEOR": self.meteor(hypo_tok),
+            "ROUGE-L": self.rouge_l(hypo)
+        }
+
+
+class EvaluationEngine:
+    """
+    Scores hypotheses against preprocessed references.
+
+    References are preprocessed lazily, per image, and kept in an LRU of
+    `max_cached_images` entries, so a large ground truth is never
+    preprocessed as a whole.
+    """
+
+    def __init__(self, ground_truth, max_cached_images=4096):
+        self.ground_truth = ground_truth
+        self.max_cached_images = max_cached_images
+        self._refs = OrderedDict()
+        # One engine is shared by the pipeline threads and the job queue
+        self._lock = threading.Lock()
+
+    def references(self, img_name) -> ReferenceSet:
+        with self._lock:
+            refs = self._refs.get(img_name)
+            if refs is not None:
+                self._refs.move_to_end(img_name)
+                return refs
+        # Preprocessed outside the lock; a concurrent miss keeps the first one
+        refs = ReferenceSet([r["caption"] for r in self.ground_truth[img_name]])
+        with self._lock:
+            refs = self._refs.setdefault(img_name, refs)
+            self._refs.move_to_end(img_name)
+            while len(self._refs) > self.max_cached_images:
+                self._refs.popitem(last=False)
+        return refs
+
+    def evaluate_caption(self, img_name, predicted_caption):
+        return self.references(img_name).evaluate(predicted_caption)
+
+    def evaluate_all(self, img_name, captions_dict):
+        """Same output as evaluate_all(); identical captions are scored once."""
+        refs = self.references(img_name)
+        unique = {c: refs.evaluate(c) for c in set(captions_dict.values())}
+        return {k: dict(unique[v]) for k, v in captions_dict.items()}
+
+# =============================
+# Corpus-level aggregates
+# =============================
+def corpus_scores(ground_truth, predictions, engine=None):
+    """
+    predictions: {img_name: caption} for one system.
+
+    BLEU is true corpus BLEU (n-gram counts pooled over all images);
+    SPICE / METEOR / ROUGE-L are means of the per-image scores.
+    """
+    names = [n for n in predictions if n in ground_truth]
+    if not names:
+        return None
+    from nltk.translate.bleu_score import corpus_bleu
+    engine = engine or EvaluationEngine(ground_truth)
+
+    refs_tok, hyps_tok = [], []
+    per_image = []
+    for name in names:
+        refs = engine.references(name)
+        refs_tok.append(refs.tokens)
+        hyps_tok.append(predictions[name].lower().split())
+        per_image.append(refs.evaluate(predictions[name]))
+
+    scores = {
+        metric: corpus_bleu(refs_tok, hyps_tok, weights=w, smoothing_function=_smoothing().method1)
+        for metric, w in BLEU_WEIGHTS.items()
+    }
+    for metric in ("SPICE", "METEOR", "ROUGE-L"):
+        scores[metric] = sum(s[metric] for s in per_image) / len(per_image)
+    scores["images"] = len(names)
+    return scores
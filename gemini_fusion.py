@@ -1,5 +1,38 @@
+import asyncio
+import json
 import os
-import google.generativeai as genai
+import random
+import re
+import threading
+import time
+
+GEMINI_MODEL = "gemini-2.5-flash"
+# Bump whenever a prompt below changes, so cached Gemini outputs are not reused.
+PROMPT_VERSION = 1
+
+# Client limits (overridable through the environment)
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+RATE_PER_SECOND = float(os.getenv("GEMINI_RATE_PER_SECOND", "4"))
+RATE_BURST = int(os.getenv("GEMINI_RATE_BURST", "4"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "4"))
+CALL_TIMEOUT = float(os.getenv("GEMINI_CALL_TIMEOUT", "30"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 16.0
+
+# HTTP statuses worth retrying (rate limit, transient server errors)
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+# "multi": ToT branches + self-correction as separate calls (3 round trips)
+# "combined": a single structured-output call (see reason_in_one_call)
+REASONING_MODES = ("multi", "combined")
+DEFAULT_REASONING_MODE = os.getenv("GEMINI_REASONING_MODE", "multi")
+
+# Bulk requests (many images per prompt, see fuse_captions_batch)
+BATCH_MAX_TOKENS = int(os.getenv("GEMINI_BATCH_MAX_TOKENS", "4000"))
+BATCH_MAX_ITEMS = int(os.getenv("GEMINI_BATCH_MAX_ITEMS", "25"))
+BATCH_MAX_ROUNDS = int(os.getenv("GEMINI_BATCH_MAX_ROUNDS", "2"))
+# Room left in the budget for each item's answer
+BATCH_ANSWER_TOKENS = 40
 
 
 def configure_gemini(api_key=None):
@@ -8,18 +41,216 @@ def configure_gemini(api_key=None):
         api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise ValueError("Gemini API key not provided. Set GEMINI_API_KEY.")
+    import google.generativeai as genai  # heavy (grpc), imported on first use
     genai.configure(api_key=api_key)
 
 
+# =========================================================
+# 🔹 RATE LIMITING
+# =========================================================
+class TokenBucket:
+    """Token-bucket limiter: `rate` requests/second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+
+    async def acquire(self):
+        # Only ever awaited on the client's own event loop, so the
+        # check-and-take below cannot interleave with another coroutine.
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    return getattr(exc, "code", None) in RETRYABLE_CODES
+
+
+# =========================================================
+# 🔹 ASYNC GEMINI CLIENT
+# =========================================================
+class GeminiClient:
+    """
+    Reusable Gemini client.
+
+    The GenerativeModel is configured and built once. Calls run on a
+    private background event loop so the sync helpers below work from
+    Streamlit (or any thread) while concurrency is bounded by a
+    semaphore and a token bucket. Failed calls are retried with
+    exponential backoff and full jitter; each attempt has a timeout.
+
+    `model` can be any object exposing `generate_content` (and optionally
+    `generate_content_async`), e.g. gemini_stub.StubGenerativeModel.
+    """
+
+    def __init__(
+        self,
+        model=None,
+        api_key=None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        rate_per_second: float = RATE_PER_SECOND,
+        rate_burst: int = RATE_BURST,
+        max_retries: int = MAX_RETRIES,
+        timeout: float = CALL_TIMEOUT
+    ):
+        self._model = model
+        self._api_key = api_key
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_per_second, rate_burst)
+        self._loop = None
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+                configure_gemini(self._api_key)
+                self._model = genai.GenerativeModel(GEMINI_MODEL)
+            return self._model
+
+    # -----------------------------
+    # event loop plumbing
+    # -----------------------------
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name="gemini-client", daemon=True
+                ).start()
+            return self._loop
+
+    def run(self, coro):
+        """Run a coroutine on the client loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+    async def _on_client_loop(self, coro):
+        loop = self._get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    # -----------------------------
+    # requests
+    # -----------------------------
+    async def _send(self, prompt: str, **kwargs):
+        model = self.model
+        if hasattr(model, "generate_content_async"):
+            return await model.generate_content_async(prompt, **kwargs)
+        return await asyncio.to_thread(model.generate_content, prompt, **kwargs)
+
+    async def _generate(self, prompt: str, **kwargs) -> str:
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            try:
+                async with self._semaphore:
+                    response = await asyncio.wait_for(
+                        self._send(prompt, **kwargs), timeout=self.timeout
+                    )
+                return response.text.strip()
+            except Exception as exc:
+                if attempt == self.max_retries or not _is_retryable(exc):
+                    raise
+                self.retries += 1
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+                await asyncio.sleep(random.uniform(0, delay))
+
+    async def agenerate(self, prompt: str, **kwargs) -> str:
+        return await self._on_client_loop(self._generate(prompt, **kwargs))
+
+    async def agenerate_many(self, prompts: list[str], return_exceptions: bool = False, **kwargs) -> list[str]:
+        async def _all():
+            return await asyncio.gather(
+                *(self._generate(p, **kwargs) for p in prompts),
+                return_exceptions=return_exceptions
+            )
+        return list(await self._on_client_loop(_all()))
+
+    def generate(self, prompt: str, **kwargs) -> str:
+        return self.run(self._generate(prompt, **kwargs))
+
+    def generate_many(self, prompts: list[str], return_exceptions: bool = False,
+                      return_timings: bool = False, **kwargs) -> list[str]:
+        """
+        Send several prompts concurrently; answers come back in order.
+        With `return_exceptions`, a failed prompt yields its exception
+        instead of failing the whole group. With `return_timings`, returns
+        (answers, seconds) where seconds[i] is the wall time of prompt i,
+        retries and waits for a concurrency slot included.
+        """
+        seconds = [0.0] * len(prompts)
+
+        async def _timed(i, prompt):
+            start = time.perf_counter()
+            try:
+                return await self._generate(prompt, **kwargs)
+            finally:
+                seconds[i] = time.perf_counter() - start
+
+        async def _all():
+            return await asyncio.gather(
+                *(_timed(i, p) for i, p in enumerate(prompts)),
+                return_exceptions=return_exceptions
+            )
+        answers = list(self.run(_all()))
+        return (answers, seconds) if return_timings else answers
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_gemini_client(api_key=None) -> GeminiClient:
+    """
+    Shared client per API key. With GEMINI_STUB=1 the client talks to the
+    offline stub in gemini_stub instead of the real API.
+    """
+    with _clients_lock:
+        if api_key not in _clients:
+            model = None
+            if os.getenv("GEMINI_STUB") == "1":
+                from gemini_stub import FixtureResponder, StubGenerativeModel, echo_consensus
+                fixtures = os.getenv("GEMINI_STUB_FIXTURES")
+                model = StubGenerativeModel(
+                    responder=FixtureResponder(fixtures) if fixtures else echo_consensus
+                )
+            _clients[api_key] = GeminiClient(model=model, api_key=api_key)
+        return _clients[api_key]
+
+
+def set_gemini_client(client: GeminiClient, api_key=None):
+    """Install `client` (e.g. one wrapping the offline stub) for `api_key`."""
+    with _clients_lock:
+        _clients[api_key] = client
+
+
 def _call_gemini(prompt: str, api_key=None) -> str:
-    configure_gemini(api_key)
-    model = genai.GenerativeModel("gemini-2.5-flash")
-    response = model.generate_content(prompt)
-    return response.text.strip()
+    return get_gemini_client(api_key).generate(prompt)
 
 
-def fuse_captions_with_gemini(captions: dict, consensus_caption: str, api_key=None) -> str:
-    prompt = (
+# =========================================================
+# 🔹 PROMPTS
+# =========================================================
+def _fusion_prompt(captions: dict, consensus_caption: str) -> str:
+    return (
         "You are an expert image captioning system.\n\n"
         "Here are captions generated by independent vision models:\n"
         + "\n".join([f"- {k}: \"{v}\"" for k, v in captions.items()])
@@ -32,11 +263,10 @@ def fuse_captions_with_gemini(captions: dict, consensus_caption: str, api_key=No
         "- Output ONLY the final caption\n\n"
         "Final caption:"
     )
-    return _call_gemini(prompt, api_key=api_key)
 
 
-def self_correct_caption(caption: str, api_key=None) -> str:
-    prompt = (
+def _self_correction_prompt(caption: str) -> str:
+    return (
         "You are reviewing an image caption:\n\n"
         f"\"{caption}\"\n\n"
         "Check for:\n"
@@ -47,19 +277,18 @@ def self_correct_caption(caption: str, api_key=None) -> str:
         "Otherwise, return a corrected improved version.\n\n"
         "Return ONLY the caption in ENGLISH."
     )
-    return _call_gemini(prompt, api_key=api_key)
 
 
-def fuse_with_tree_of_thoughts(captions: dict, consensus_caption: str, api_key=None) -> list[str]:
-    # 2 branches = ToT simple (concise vs slightly descriptive)
-    prompts = [
-        "Write a concise factual caption (one sentence).",
-        "Write a slightly more descriptive caption, still factual (one sentence)."
-    ]
+# 2 branches = ToT simple (concise vs slightly descriptive)
+TOT_BRANCHES = [
+    "Write a concise factual caption (one sentence).",
+    "Write a slightly more descriptive caption, still factual (one sentence)."
+]
 
-    candidates = []
-    for p in prompts:
-        prompt = (
+
+def _tot_prompts(captions: dict, consensus_caption: str) -> list[str]:
+    return [
+        (
             f"{p}\n\n"
             "Independent captions:\n"
             + "\n".join([f"- {k}: \"{v}\"" for k, v in captions.items()])
@@ -70,6 +299,361 @@ def fuse_with_tree_of_thoughts(captions: dict, consensus_caption: str, api_key=N
             "- Output only the caption\n\n"
             "Caption:"
         )
-        candidates.append(_call_gemini(prompt, api_key=api_key))
+        for p in TOT_BRANCHES
+    ]
+
+
+def _combined_prompt(captions: dict, consensus_caption: str) -> str:
+    branches = "\n".join(f"{i}. {p}" for i, p in enumerate(TOT_BRANCHES, start=1))
+    shape = json.dumps({
+        "candidates": [f"<caption {i}>" for i in range(1, len(TOT_BRANCHES) + 1)],
+        "corrected": [f"<reviewed caption {i}>" for i in range(1, len(TOT_BRANCHES) + 1)],
+    })
+    return (
+        "You are an expert image captioning system.\n\n"
+        "Independent captions:\n"
+        + "\n".join([f"- {k}: \"{v}\"" for k, v in captions.items()])
+        + f"\n\nConsensus caption: \"{consensus_caption}\"\n\n"
+        "Step 1: write one caption for each instruction:\n"
+        f"{branches}\n\n"
+        "Step 2: review each caption for contradictions, repetition and unclear "
+        "phrasing. Keep it unchanged if it's already good, otherwise correct it.\n\n"
+        "Rules:\n"
+        "- Do NOT add new objects not supported by the captions\n"
+        "- English only\n"
+        "- Answer with JSON only, in this exact shape:\n"
+        f"{shape}"
+    )
+
+
+# =========================================================
+# 🔹 COMBINED RESPONSE PARSING
+# =========================================================
+class CombinedResponseError(ValueError):
+    """The combined reasoning answer is not the JSON we asked for."""
+
+
+# Gemini sometimes wraps JSON in ```json fences or a sentence: keep the object
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+# Ask the API for JSON directly (ignored by the offline stub)
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+
+def parse_combined_response(text: str, branches: int = None) -> dict:
+    """
+    Parse and validate the answer to `_combined_prompt`.
+
+    Returns:
+        dict: {
+            "candidates": [one caption per ToT branch],
+            "corrected": [the self-corrected version of each candidate]
+        }
+
+    Raises:
+        CombinedResponseError: no JSON object, wrong shape, or empty captions.
+    """
+    branches = len(TOT_BRANCHES) if branches is None else branches
+    match = _JSON_OBJECT_RE.search(text or "")
+    if match is None:
+        raise CombinedResponseError("no JSON object in the response")
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError as exc:
+        raise CombinedResponseError(f"invalid JSON: {exc}") from None
+
+    parsed = {}
+    for field in ("candidates", "corrected"):
+        values = data.get(field)
+        if not isinstance(values, list) or len(values) != branches:
+            raise CombinedResponseError(f"{field!r} must be a list of {branches} captions")
+        if not all(isinstance(v, str) and v.strip() for v in values):
+            raise CombinedResponseError(f"{field!r} contains an empty or non-text caption")
+        parsed[field] = [v.strip() for v in values]
+    return parsed
+
+
+# =========================================================
+# 🔹 BULK REQUESTS (MANY IMAGES PER PROMPT)
+# =========================================================
+_BULK_FUSION_HEADER = (
+    "You are an expert image captioning system.\n\n"
+    "Each item below lists captions generated by independent vision models "
+    "for one image, plus their consensus caption (most reliable).\n\n"
+    "For EACH item:\n"
+    "- Fuse only consistent information from its captions\n"
+    "- Do NOT add new objects or details\n"
+    "- Keep it simple, accurate, natural\n"
+    "- Output MUST be in ENGLISH ONLY"
+)
 
-    return candidates
+_BULK_TOT_HEADER = (
+    "You are an expert image captioning system.\n\n"
+    "Each item below lists captions generated by independent vision models "
+    "for one image, their consensus caption (most reliable) and an "
+    "instruction.\n\n"
+    "For EACH item, write one caption following its instruction:\n"
+    "- Do NOT add new objects not supported by the captions\n"
+    "- Output MUST be in ENGLISH ONLY"
+)
+
+_BULK_SELF_CORRECTION_HEADER = (
+    "You are reviewing image captions, one per item below.\n\n"
+    "For EACH item, check for:\n"
+    "- contradictions\n"
+    "- repetition\n"
+    "- unclear phrasing\n\n"
+    "If it's already good, return it unchanged.\n"
+    "Otherwise, return a corrected improved version, in ENGLISH."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+def _fusion_item(captions: dict, consensus_caption: str) -> str:
+    return (
+        "\n".join([f"- {k}: \"{v}\"" for k, v in captions.items()])
+        + f"\nConsensus caption: \"{consensus_caption}\""
+    )
+
+
+def _bulk_prompt(header: str, blocks: list) -> str:
+    """`blocks` is a list of (item_id, text); answers are keyed by item ID."""
+    shape = json.dumps({item_id: "<caption>" for item_id, _ in blocks[:2]})
+    return (
+        f"{header}\n\n"
+        + "\n\n".join(f"[{item_id}]\n{text}" for item_id, text in blocks)
+        + "\n\nAnswer with JSON only, one caption per item ID, e.g.:\n"
+        f"{shape}"
+    )
+
+
+def _pack(blocks: list, header: str, max_tokens: int, max_items: int) -> list:
+    """Greedily split blocks into prompts under the token and item caps."""
+    base = estimate_tokens(header) + 50  # instructions + JSON example
+    chunks, current, size = [], [], base
+    for block in blocks:
+        cost = estimate_tokens(block[1]) + BATCH_ANSWER_TOKENS
+        if current and (size + cost > max_tokens or len(current) >= max_items):
+            chunks.append(current)
+            current, size = [], base
+        current.append(block)
+        size += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def parse_batch_response(text: str, item_ids: list) -> dict:
+    """
+    {item_id: caption} for every requested ID with a usable answer.
+    Missing, empty or unknown entries are dropped (never raises), so the
+    caller can re-issue just those items.
+    """
+    match = _JSON_OBJECT_RE.search(text or "")
+    if match is None:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    return {
+        item_id: data[item_id].strip()
+        for item_id in item_ids
+        if isinstance(data.get(item_id), str) and data[item_id].strip()
+    }
+
+
+def _run_bulk(header: str, blocks: list, single_prompts: list, api_key, max_tokens, max_items, max_rounds):
+    """
+    Answer every block through bulk prompts. Items whose answer could not
+    be parsed are re-issued (up to `max_rounds` rounds in total), then
+    sent one by one with their classic prompt as a last resort. An item
+    whose last-resort call fails too is answered with its exception; the
+    other items are unaffected.
+    """
+    client = get_gemini_client(api_key)
+    # Stable IDs: an item keeps its ID across rounds and prompts
+    ids = [f"img{i + 1}" for i in range(len(blocks))]
+    by_id = dict(zip(ids, blocks))
+    answers = {}
+    stats = {"items": len(ids), "requests": 0, "reissued": 0, "fallback": 0, "failed": 0, "request_s": []}
+
+    pending = ids
+    for round_index in range(max_rounds):
+        if not pending:
+            break
+        if round_index:
+            stats["reissued"] += len(pending)
+        chunks = _pack([(i, by_id[i]) for i in pending], header, max_tokens, max_items)
+        stats["requests"] += len(chunks)
+        texts, seconds = client.generate_many(
+            [_bulk_prompt(header, chunk) for chunk in chunks],
+            return_exceptions=True,
+            return_timings=True,
+            generation_config=JSON_GENERATION_CONFIG
+        )
+        stats["request_s"] += seconds
+        for chunk, text in zip(chunks, texts):
+            if not isinstance(text, Exception):
+                answers.update(parse_batch_response(text, [i for i, _ in chunk]))
+        pending = [i for i in ids if i not in answers]
+
+    if pending:
+        stats["fallback"] = len(pending)
+        stats["requests"] += len(pending)
+        singles, seconds = client.generate_many(
+            [single_prompts[ids.index(i)] for i in pending], return_exceptions=True, return_timings=True
+        )
+        stats["request_s"] += seconds
+        answers.update(zip(pending, singles))
+        stats["failed"] = sum(isinstance(a, Exception) for a in singles)
+
+    return [answers[i] for i in ids], stats
+
+
+# =========================================================
+# 🔹 PUBLIC API (SYNC)
+# =========================================================
+def fuse_captions_with_gemini(captions: dict, consensus_caption: str, api_key=None) -> str:
+    return _call_gemini(_fusion_prompt(captions, consensus_caption), api_key=api_key)
+
+
+def self_correct_caption(caption: str, api_key=None) -> str:
+    return _call_gemini(_self_correction_prompt(caption), api_key=api_key)
+
+
+def fuse_with_tree_of_thoughts(captions: dict, consensus_caption: str, api_key=None,
+                               return_timings: bool = False) -> list[str]:
+    # Branches are independent: send them concurrently.
+    # With `return_timings`: (candidates, seconds per branch call)
+    return get_gemini_client(api_key).generate_many(
+        _tot_prompts(captions, consensus_caption), return_timings=return_timings
+    )
+
+
+def fuse_captions_batch(
+    items: list,
+    api_key=None,
+    max_tokens: int = BATCH_MAX_TOKENS,
+    max_items: int = BATCH_MAX_ITEMS,
+    max_rounds: int = BATCH_MAX_ROUNDS,
+    return_stats: bool = False
+):
+    """
+    Bulk version of `fuse_captions_with_gemini` for offline jobs.
+
+    Args:
+        items (list): one (captions, consensus_caption) pair per image.
+
+    Returns:
+        list[str]: one fused caption per item, in order (the exception
+        for an item that could not be answered), or (captions, stats)
+        when `return_stats` is set, where stats counts items, requests,
+        re-issued, fallback and failed items, plus the wall time of each
+        request ("request_s").
+    """
+    captions, stats = _run_bulk(
+        _BULK_FUSION_HEADER,
+        [_fusion_item(c, consensus) for c, consensus in items],
+        [_fusion_prompt(c, consensus) for c, consensus in items],
+        api_key, max_tokens, max_items, max_rounds
+    )
+    return (captions, stats) if return_stats else captions
+
+
+def self_correct_captions_batch(
+    captions: list,
+    api_key=None,
+    max_tokens: int = BATCH_MAX_TOKENS,
+    max_items: int = BATCH_MAX_ITEMS,
+    max_rounds: int = BATCH_MAX_ROUNDS,
+    return_stats: bool = False
+):
+    """Bulk version of `self_correct_caption` (see fuse_captions_batch)."""
+    corrected, stats = _run_bulk(
+        _BULK_SELF_CORRECTION_HEADER,
+        [f"\"{c}\"" for c in captions],
+        [_self_correction_prompt(c) for c in captions],
+        api_key, max_tokens, max_items, max_rounds
+    )
+    return (corrected, stats) if return_stats else corrected
+
+
+def fuse_with_tree_of_thoughts_batch(
+    items: list,
+    api_key=None,
+    max_tokens: int = BATCH_MAX_TOKENS,
+    max_items: int = BATCH_MAX_ITEMS,
+    max_rounds: int = BATCH_MAX_ROUNDS,
+    return_stats: bool = False
+):
+    """
+    Bulk version of `fuse_with_tree_of_thoughts` for offline jobs: every
+    ToT branch of every (captions, consensus_caption) item is one bulk
+    item (its branch instruction + the captions), packed with the others
+    like fuse_captions_batch.
+
+    Returns:
+        list: one candidate list per item, in order (an item with a
+        failed branch gets that branch's exception instead), or
+        (candidates, stats) when `return_stats` is set.
+    """
+    answers, stats = _run_bulk(
+        _BULK_TOT_HEADER,
+        [
+            f"Instruction: {branch}\n{_fusion_item(c, consensus)}"
+            for c, consensus in items for branch in TOT_BRANCHES
+        ],
+        [p for c, consensus in items for p in _tot_prompts(c, consensus)],
+        api_key, max_tokens, max_items, max_rounds
+    )
+    n = len(TOT_BRANCHES)
+    groups = [answers[i * n:(i + 1) * n] for i in range(len(items))]
+    candidates = [
+        next((a for a in group if isinstance(a, Exception)), group)
+        for group in groups
+    ]
+    return (candidates, stats) if return_stats else candidates
+
+
+def reason_in_one_call(captions: dict, consensus_caption: str, api_key=None) -> dict:
+    """
+    ToT candidates and their self-corrected versions in a single call.
+    See parse_combined_response for the result; raises
+    CombinedResponseError when the answer cannot be used, so callers can
+    fall back to fuse_with_tree_of_thoughts + self_correct_caption.
+    """
+    text = get_gemini_client(api_key).generate(
+        _combined_prompt(captions, consensus_caption),
+        generation_config=JSON_GENERATION_CONFIG
+    )
+    return parse_combined_response(text)
+
+
+# =========================================================
+# 🔹 PUBLIC API (ASYNC)
+# =========================================================
+async def afuse_captions_with_gemini(captions: dict, consensus_caption: str, api_key=None) -> str:
+    return await get_gemini_client(api_key).agenerate(_fusion_prompt(captions, consensus_caption))
+
+
+async def aself_correct_caption(caption: str, api_key=None) -> str:
+    return await get_gemini_client(api_key).agenerate(_self_correction_prompt(caption))
+
+
+async def afuse_with_tree_of_thoughts(captions: dict, consensus_caption: str, api_key=None) -> list[str]:
+    return await get_gemini_client(api_key).agenerate_many(
+        _tot_prompts(captions, consensus_caption)
+    )
+
+
+async def areason_in_one_call(captions: dict, consensus_caption: str, api_key=None) -> dict:
+    text = await get_gemini_client(api_key).agenerate(
+        _combined_prompt(captions, consensus_caption),
+        generation_config=JSON_GENERATION_CONFIG
+    )
+    return parse_combined_response(text)
@@ -0,0 +1,125 @@
+"""
+Offline stand-in for `google.generativeai.GenerativeModel`.
+
+Mimics `generate_content` / `generate_content_async` latency and 429
+rate-limit errors, and answers deterministically so pipeline runs are
+reproducible without network access or an API key.
+
+    from gemini_fusion import GeminiClient, set_gemini_client
+    set_gemini_client(GeminiClient(model=StubGenerativeModel(error_rate=0.2)))
+
+Setting GEMINI_STUB=1 makes `get_gemini_client` do this automatically;
+with GEMINI_STUB_FIXTURES=fixtures/gemini_combined.json as well, combined
+reasoning calls replay those recorded answers (see FixtureResponder).
+"""
+import asyncio
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+_CONSENSUS_RE = re.compile(r'Consensus caption[^"]*"([^"]*)"')
+_QUOTED_RE = re.compile(r'"([^"]+)"')
+# The combined reasoning prompt spells out the JSON keys it expects
+_COMBINED_MARKER = '"corrected"'
+# Bulk prompts: "[img3]\n<item text>" blocks, answered by item ID
+_BULK_MARKER = "one caption per item ID"
+_BULK_ITEM_RE = re.compile(r"^\[(img\d+)\]\n(.*?)(?=\n\n)", re.MULTILINE | re.DOTALL)
+
+
+class StubRateLimitError(Exception):
+    """Same shape as google.api_core's ResourceExhausted (HTTP 429)."""
+    code = 429
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def echo_consensus(prompt: str) -> str:
+    """
+    Default responder: repeat the consensus (or first quoted) caption,
+    as JSON for combined reasoning and bulk prompts.
+    """
+    if _BULK_MARKER in prompt:
+        return json.dumps({
+            item_id: echo_consensus(text) for item_id, text in _BULK_ITEM_RE.findall(prompt)
+        })
+    match = _CONSENSUS_RE.search(prompt) or _QUOTED_RE.search(prompt)
+    caption = match.group(1) if match else "A photo."
+    if _COMBINED_MARKER in prompt:
+        return json.dumps({"candidates": [caption, caption], "corrected": [caption, caption]})
+    return caption
+
+
+class FixtureResponder:
+    """
+    Replay recorded answers to combined reasoning prompts, in order and
+    looping; other prompts get `fallback`. The fixture file is a JSON list
+    of {"name", "response", "valid"} records (see fixtures/).
+    """
+
+    def __init__(self, path: str, fallback=echo_consensus):
+        with open(path, "r", encoding="utf-8") as f:
+            self.fixtures = json.load(f)
+        self._responses = itertools.cycle([fx["response"] for fx in self.fixtures])
+        self._lock = threading.Lock()
+        self.fallback = fallback
+
+    def __call__(self, prompt: str) -> str:
+        if _COMBINED_MARKER not in prompt:
+            return self.fallback(prompt)
+        with self._lock:
+            return next(self._responses)
+
+
+class StubGenerativeModel:
+    def __init__(
+        self,
+        latency: float = 0.2,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        responder=echo_consensus,
+        seed: int = 0
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.responder = responder
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _start(self) -> tuple[float, bool]:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+    def _finish(self, prompt: str, fail: bool) -> StubResponse:
+        with self._lock:
+            self.in_flight -= 1
+        if fail:
+            raise StubRateLimitError("429 Resource has been exhausted (stub)")
+        return StubResponse(self.responder(prompt))
+
+    def generate_content(self, prompt: str, **kwargs) -> StubResponse:
+        delay, fail = self._start()
+        time.sleep(delay)
+        return self._finish(prompt, fail)
+
+    async def generate_content_async(self, prompt: str, **kwargs) -> StubResponse:
+        delay, fail = self._start()
+        await asyncio.sleep(delay)
+        return self._finish(prompt, fail)
@@ -0,0 +1,209 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections.abc import Mapping
+
+# Ground truth scored against by the pipeline (JSON, or a built store)
+GROUND_TRUTH_PATH = os.getenv("GROUND_TRUTH_PATH", "data.json")
+# Where the indexed store of a ground-truth JSON file is written
+# (default: next to it, data.json -> data.refs.sqlite)
+GROUND_TRUTH_STORE_DIR = os.getenv("GROUND_TRUTH_STORE_DIR")
+# Bump when the table layout changes: existing stores are rebuilt
+STORE_FORMAT = 1
+
+_READ_CHUNK = 1 << 16
+_PAGE_SIZE = 1000
+_WHITESPACE = re.compile(r"\s*")
+# Where a number / true / false / null value can end
+_SCALAR_END = re.compile(r"[\s,}\]]")
+
+
+# =========================================================
+# 🔹 STREAMING JSON READER
+# =========================================================
+def iter_json_object(f, chunk_size: int = _READ_CHUNK):
+    """
+    Yield the (key, value) pairs of the top-level JSON object in file `f`
+    without loading the whole file: only one value (the references of one
+    image) is decoded at a time.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    expect = "{"
+
+    def refill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        buf, pos = buf[pos:] + chunk, 0
+
+    while True:
+        pos = _WHITESPACE.match(buf, pos).end()
+        if pos == len(buf):
+            if eof:
+                raise ValueError("Truncated JSON object")
+            refill()
+            continue
+
+        char = buf[pos]
+        if expect in ("key", "value"):
+            if char not in "{[\"" and not eof and not _SCALAR_END.search(buf, pos):
+                # A scalar may be cut short by the chunk ("1." of "1.5"):
+                # wait until its delimiter is in the buffer
+                refill()
+                continue
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                refill()
+                continue
+            if expect == "key":
+                if not isinstance(obj, str):
+                    raise ValueError(f"Expected an image name, got {obj!r}")
+                key, expect = obj, ":"
+            else:
+                yield key, obj
+                expect = ","
+        elif expect == "{":
+            if char != "{":
+                raise ValueError("Ground truth JSON must be an object {image: [references]}")
+            pos, expect = pos + 1, "key_or_end"
+        elif expect == "key_or_end":
+            if char == "}":
+                return
+            expect = "key"
+        elif expect == ":":
+            if char != ":":
+                raise ValueError(f"Expected ':' after {key!r}")
+            pos, expect = pos + 1, "value"
+        elif expect == ",":
+            if char == "}":
+                return
+            if char != ",":
+                raise ValueError(f"Expected ',' or '}}' after the value of {key!r}")
+            pos, expect = pos + 1, "key"
+
+
+# =========================================================
+# 🔹 INDEXED GROUND TRUTH (SQLITE)
+# =========================================================
+class GroundTruthStore(Mapping):
+    """
+    Read-only {image_name: [{"caption": ...}, ...]} mapping over an
+    indexed SQLite file (one row per image, primary key on the name).
+
+    A lookup reads one row and nothing else; iteration pages through the
+    names in order, so memory stays flat whatever the number of images.
+    Drop-in for the dict returned by json.load(data.json).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self.meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        self._len = int(self.meta["images"])
+
+    def __getitem__(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT refs FROM refs WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return json.loads(row[0])
+
+    def __contains__(self, name):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM refs WHERE name = ?", (name,)).fetchone() is not None
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        # Keyset pagination: no cursor is held open between pages. The
+        # first page has no lower bound (an image may be named "").
+        query, params = "SELECT name FROM refs ORDER BY name LIMIT ?", ()
+        while True:
+            with self._lock:
+                page = [r[0] for r in self._conn.execute(query, params + (_PAGE_SIZE,))]
+            yield from page
+            if len(page) < _PAGE_SIZE:
+                return
+            query, params = "SELECT name FROM refs WHERE name > ? ORDER BY name LIMIT ?", (page[-1],)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _source_signature(source: str) -> dict:
+    stat = os.stat(source)
+    return {"source_size": str(stat.st_size), "source_mtime_ns": str(stat.st_mtime_ns),
+            "format": str(STORE_FORMAT)}
+
+
+def store_path_for(source: str) -> str:
+    base = os.path.splitext(os.path.basename(source))[0] + ".refs.sqlite"
+    return os.path.join(GROUND_TRUTH_STORE_DIR or os.path.dirname(os.path.abspath(source)), base)
+
+
+def build_ground_truth_store(source: str, path: str) -> str:
+    """
+    Convert a ground-truth JSON file into an indexed store at `path`,
+    streaming it (see iter_json_object). Written to a temporary file and
+    renamed, so readers never see a partial store.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    signature = _source_signature(source)
+
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("CREATE TABLE refs (name TEXT PRIMARY KEY, refs TEXT NOT NULL) WITHOUT ROWID")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        with open(source, encoding="utf-8") as f:
+            # Same as json.load for a repeated name: the last one wins
+            conn.executemany(
+                "INSERT OR REPLACE INTO refs (name, refs) VALUES (?, ?)",
+                ((name, json.dumps(refs, ensure_ascii=False)) for name, refs in iter_json_object(f))
+            )
+        signature["images"] = str(conn.execute("SELECT COUNT(*) FROM refs").fetchone()[0])
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", signature.items())
+        conn.commit()
+    finally:
+        conn.close()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    os.replace(tmp, path)
+    return path
+
+
+def open_ground_truth(source: str, path: str = None) -> GroundTruthStore:
+    """
+    GroundTruthStore for `source`: a store file (.sqlite) is opened as is;
+    a JSON file is converted on first use, and again whenever it changes.
+    """
+    if source.endswith(".sqlite"):
+        return GroundTruthStore(source)
+
+    path = path or store_path_for(source)
+    if os.path.exists(path):
+        store = GroundTruthStore(path)
+        signature = _source_signature(source)
+        if all(store.meta.get(k) == v for k, v in signature.items()):
+            return store
+        store.close()
+    return GroundTruthStore(build_ground_truth_store(source, path))
+
+
+if __name__ == "__main__":
+    import sys
+
+    store = open_ground_truth(sys.argv[1] if len(sys.argv) > 1 else GROUND_TRUTH_PATH)
+    print(f"{store.path}: {len(store)} images")
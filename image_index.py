@@ -0,0 +1,181 @@
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+# Reuse the cached results of near-duplicate images (re-encodes, resizes)
+NEAR_DUP_ENABLED = os.getenv("CAPTION_NEAR_DUP", "0") == "1"
+NEAR_DUP_INDEX_PATH = os.getenv("NEAR_DUP_INDEX_PATH", ".near_dup_index.bin")
+# Similarity = 1 - hamming_distance / HASH_BITS; 0.9 allows 6 differing bits
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.9"))
+# Matches tried, nearest first, when the nearest ones cannot be reused
+NEAR_DUP_MAX_CANDIDATES = int(os.getenv("NEAR_DUP_MAX_CANDIDATES", "8"))
+
+HASH_BITS = 64
+# Center crops indexed along with each image, so cropped copies match too
+CROP_VARIANTS = (1.0, 0.93, 0.86, 0.79, 0.72)
+# On-disk record: perceptual hash + sha256 content hash of the image
+RECORD = np.dtype([("phash", "<u8"), ("key", "u1", (32,))])
+
+
+# =========================================================
+# 🔹 PERCEPTUAL HASH (64-BIT DCT pHash)
+# =========================================================
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(32)
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """
+    64-bit pHash: low-frequency 8x8 DCT coefficients of the 32x32
+    grayscale image, thresholded at their median. Stable under
+    re-encoding, resizing and mild color changes (see CROP_VARIANTS for
+    crops).
+    """
+    gray = image.convert("L").resize((32, 32), Image.LANCZOS)
+    coeffs = _DCT @ np.asarray(gray, dtype=np.float64) @ _DCT.T
+    low = coeffs[:8, :8].flatten()
+    bits = low > np.median(low[1:])  # the DC term would skew the median
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def _center_crop(image: Image.Image, keep: float) -> Image.Image:
+    w, h = image.size
+    dx, dy = int(w * (1 - keep) / 2), int(h * (1 - keep) / 2)
+    return image.crop((dx, dy, w - dx, h - dy))
+
+
+def perceptual_hashes(image: Image.Image) -> list[int]:
+    """pHash of the image and of each of its CROP_VARIANTS center crops."""
+    gray = image.convert("L")
+    gray.thumbnail((256, 256))  # crops of a small copy hash the same, faster
+    return [perceptual_hash(_center_crop(gray, keep)) for keep in CROP_VARIANTS]
+
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def hamming_distances(hashes: np.ndarray, query: int) -> np.ndarray:
+    """Bit distance between `query` and every hash of a uint64 array."""
+    x = np.bitwise_xor(hashes, np.uint64(query))
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0: hardware popcount
+        return np.bitwise_count(x)
+    return _POPCOUNT8[np.ascontiguousarray(x).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+# =========================================================
+# 🔹 ON-DISK INDEX (APPEND-ONLY, MEMORY-MAPPED)
+# =========================================================
+class NearDuplicateIndex:
+    """
+    Perceptual hashes of every captioned image (one record per crop
+    variant), in an append-only binary file of fixed-size records.
+    Queries memory-map the file (remapped when it grows, e.g. after
+    another process appended) and scan it with a vectorized XOR +
+    popcount, so lookups stay well under a millisecond for hundreds of
+    thousands of images without loading anything else.
+    """
+
+    def __init__(self, path: str = NEAR_DUP_INDEX_PATH, threshold: float = NEAR_DUP_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._map = None
+        self._mapped_bytes = 0
+
+    @property
+    def max_distance(self) -> int:
+        return int((1 - self.threshold) * HASH_BITS + 1e-9)
+
+    def _records(self):
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        usable = size - size % RECORD.itemsize  # ignore a half-written record
+        with self._lock:
+            if usable != self._mapped_bytes:
+                self._map = np.memmap(
+                    self.path, dtype=RECORD, mode="r", shape=(usable // RECORD.itemsize,)
+                ) if usable else None
+                self._mapped_bytes = usable
+            return self._map
+
+    def __len__(self) -> int:
+        records = self._records()
+        return 0 if records is None else len(records)
+
+    def add_image(self, image):
+        """Index a PreparedImage under its content hash."""
+        hashes = perceptual_hashes(image.image)
+        self.add_many(hashes, [image.content_hash] * len(hashes))
+
+    def add(self, phash: int, content_hash: str):
+        self.add_many([phash], [content_hash])
+
+    def add_many(self, phashes: list, content_hashes: list):
+        records = np.zeros(len(phashes), dtype=RECORD)
+        records["phash"] = np.array(phashes, dtype=np.uint64)
+        records["key"] = np.frombuffer(
+            b"".join(bytes.fromhex(h) for h in content_hashes), dtype=np.uint8
+        ).reshape(-1, 32)
+        with self._lock, open(self.path, "ab") as f:
+            f.write(records.tobytes())
+
+    def query(self, phash: int, max_distance: int = None):
+        """
+        Nearest indexed image within `max_distance` bits (default: from
+        the similarity threshold).
+
+        Returns:
+            dict: {"content_hash", "distance", "similarity"} or None.
+        """
+        matches = self.query_all(phash, max_distance, limit=1)
+        return matches[0] if matches else None
+
+    def query_all(self, phash: int, max_distance: int = None, limit: int = None) -> list:
+        """
+        Every indexed image within `max_distance` bits, nearest first,
+        once per image (its closest crop variant), at most `limit`.
+
+        Returns:
+            list[dict]: {"content_hash", "distance", "similarity"} each.
+        """
+        records = self._records()
+        if records is None:
+            return []
+        max_distance = self.max_distance if max_distance is None else max_distance
+        distances = hamming_distances(records["phash"], phash)
+        within = np.flatnonzero(distances <= max_distance)
+        matches, seen = [], set()
+        for i in within[np.argsort(distances[within], kind="stable")]:
+            content_hash = records["key"][i].tobytes().hex()
+            if content_hash in seen:
+                continue
+            seen.add(content_hash)
+            distance = int(distances[i])
+            matches.append({
+                "content_hash": content_hash,
+                "distance": distance,
+                "similarity": 1 - distance / HASH_BITS,
+            })
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_near_dup_index() -> NearDuplicateIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NearDuplicateIndex()
+        return _index
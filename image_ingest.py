@@ -0,0 +1,132 @@
+import hashlib
+import io
+
+from PIL import Image
+
+
+# =========================================================
+# 🔹 PREPARED IMAGE (DECODED ONCE, SHARED BY ALL MODELS)
+# =========================================================
+class PreparedImage:
+    """
+    An RGB image decoded once, plus the resized copies the captioners
+    asked for. Resizes are cached per (size, resample) so models whose
+    processors target the same size share one resize.
+    """
+
+    def __init__(self, image: Image.Image, raw_bytes: bytes = None):
+        self.image = image
+        self.raw_bytes = raw_bytes
+        self._resized = {}
+        self._content_hash = None
+        self._perceptual_hash = None
+
+    @property
+    def content_hash(self) -> str:
+        """sha256 of the encoded bytes (or of the pixels for in-memory images)."""
+        if self._content_hash is None:
+            h = hashlib.sha256()
+            if self.raw_bytes is not None:
+                h.update(self.raw_bytes)
+            else:
+                h.update(f"{self.image.mode}:{self.image.size}".encode())
+                h.update(self.image.tobytes())
+            self._content_hash = h.hexdigest()
+        return self._content_hash
+
+    @property
+    def perceptual_hash(self) -> int:
+        """64-bit pHash, equal (or close) for re-encoded / resized copies."""
+        if self._perceptual_hash is None:
+            from image_index import perceptual_hash
+            self._perceptual_hash = perceptual_hash(self.image)
+        return self._perceptual_hash
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.image.size
+
+    def resized(self, size: tuple[int, int], resample) -> Image.Image:
+        key = (tuple(size), int(resample))
+        if key not in self._resized:
+            self._resized[key] = self.image.resize(key[0], resample=resample)
+        return self._resized[key]
+
+
+def load_image(source) -> PreparedImage:
+    """
+    Decode an image once.
+
+    Args:
+        source: a file path, raw encoded bytes, a file-like object
+            (e.g. a Streamlit upload), a PIL image or a PreparedImage.
+
+    Returns:
+        PreparedImage
+    """
+    if isinstance(source, PreparedImage):
+        return source
+    if isinstance(source, Image.Image):
+        return PreparedImage(source.convert("RGB"))
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        raw = bytes(source)
+    elif hasattr(source, "getvalue"):
+        raw = source.getvalue()
+    elif hasattr(source, "read"):
+        raw = source.read()
+    else:
+        with open(source, "rb") as f:
+            raw = f.read()
+
+    image = Image.open(io.BytesIO(raw)).convert("RGB")
+    return PreparedImage(image, raw_bytes=raw)
+
+
+# =========================================================
+# 🔹 PROCESSOR RESIZE TARGETS
+# =========================================================
+def resize_target(image_processor, image_size: tuple[int, int]):
+    """
+    Output (width, height) the Hugging Face `image_processor` would resize
+    an image of `image_size` to, or None when it can't be predicted (the
+    processor then keeps doing its own resize).
+    """
+    if not getattr(image_processor, "do_resize", True):
+        return None
+
+    size = getattr(image_processor, "size", None)
+    if not isinstance(size, dict):
+        return None
+
+    if "height" in size and "width" in size:
+        return size["width"], size["height"]
+
+    if set(size) == {"shortest_edge"}:
+        # Same rounding as transformers' get_resize_output_image_size
+        width, height = image_size
+        short = size["shortest_edge"]
+        if width <= height:
+            return short, int(short * height / width)
+        return int(short * width / height), short
+
+    return None
+
+
+def preprocess(image_processor, images: list[PreparedImage]):
+    """
+    Run `image_processor` on prepared images, reusing cached resizes.
+
+    Returns:
+        torch.Tensor: pixel_values
+    """
+    resized = []
+    for img in images:
+        target = resize_target(image_processor, img.size)
+        if target is None:
+            return image_processor(
+                [i.image for i in images], return_tensors="pt"
+            ).pixel_values
+        resized.append(img.resized(target, image_processor.resample))
+
+    return image_processor(resized, do_resize=False, return_tensors="pt").pixel_values
@@ -0,0 +1,192 @@
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from image_ingest import load_image
+
+# Pipelines running at once (shared by every Streamlit session)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# How long finished jobs stay pollable
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "600"))
+
+JOB_STATES = ("queued", "running", "done", "failed")
+
+
+class Job:
+    def __init__(self, key: tuple, session_id: str, image, image_name: str, options: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.session_id = session_id
+        self.image = image
+        self.image_name = image_name
+        self.options = options
+        self.state = "queued"
+        self.events = []
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed")
+
+
+# =========================================================
+# 🔹 BACKGROUND JOB QUEUE (FAIR ACROSS SESSIONS)
+# =========================================================
+class JobQueue:
+    """
+    Runs pipelines in background worker threads so a page never blocks
+    on one, and keeps their events for any page that polls or streams
+    them (a rerun re-attaches to its job by ID).
+
+    - submit() returns a job ID; an identical image (content hash, name
+      and options) already queued or running returns the same job.
+    - Workers take jobs round-robin across sessions: a burst of uploads
+      from one session does not delay another session's single upload.
+    - `runner(image, image_name, **options)` yields pipeline events (see
+      pipeline.iter_captioning_pipeline); the "done" event carries the
+      result.
+    """
+
+    def __init__(self, runner, workers: int = JOB_WORKERS, ttl_s: float = JOB_TTL_S):
+        self.runner = runner
+        self.workers = workers
+        self.ttl_s = ttl_s
+        self._jobs = {}
+        self._in_flight = {}  # dedup key -> job
+        self._queues = OrderedDict()  # session -> deque of jobs, round-robin order
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def submit(self, image, image_name: str, session_id: str = "default", **options) -> str:
+        image = load_image(image)
+        key = (image.content_hash, image_name, tuple(sorted(options.items())))
+        with self._cond:
+            self._expire()
+            job = self._in_flight.get(key)
+            if job is not None:
+                return job.id
+            job = Job(key, session_id, image, image_name, options)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+            self._queues.setdefault(session_id, deque()).append(job)
+            self._cond.notify_all()
+            return job.id
+
+    def _next_job(self):
+        # Caller holds the lock. First session in line gives one job and
+        # moves to the back.
+        for session_id in list(self._queues):
+            queue = self._queues.pop(session_id)
+            job = queue.popleft()
+            if queue:
+                self._queues[session_id] = queue
+            return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                job.state, job.started_at = "running", time.time()
+                self._cond.notify_all()
+            try:
+                for event in self.runner(job.image, job.image_name, **job.options):
+                    with self._cond:
+                        job.events.append(event)
+                        if event["stage"] == "done":
+                            job.result = event["result"]
+                        self._cond.notify_all()
+                state, error = ("done", None) if job.result is not None else ("failed", RuntimeError("no result"))
+            except Exception as exc:
+                state, error = "failed", exc
+            with self._cond:
+                job.state, job.error, job.finished_at = state, error, time.time()
+                job.image = None  # keep finished jobs light
+                self._in_flight.pop(job.key, None)
+                self._cond.notify_all()
+
+    def _expire(self):
+        # Caller holds the lock
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values() if j.finished and now - j.finished_at > self.ttl_s]:
+            del self._jobs[job_id]
+
+    def position(self, job_id: str) -> int:
+        """Jobs that will start before this one (0 once it is running)."""
+        with self._cond:
+            return self._position(job_id)
+
+    def _position(self, job_id: str) -> int:
+        # Replay the round-robin order of the current queues
+        order = itertools.zip_longest(*self._queues.values())
+        for position, job in enumerate(j for turn in order for j in turn if j is not None):
+            if job.id == job_id:
+                return position
+        return 0
+
+    def status(self, job_id: str) -> dict:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {
+                "id": job.id,
+                "state": job.state,
+                "position": self._position(job_id) if job.state == "queued" else 0,
+                "events": len(job.events),
+                "error": repr(job.error) if job.error else None,
+                "queued_s": (job.started_at or time.time()) - job.submitted_at,
+            }
+
+    def stream(self, job_id: str, start: int = 0, poll_s: float = 0.5):
+        """
+        Yield the job's events from index `start` as they arrive, until
+        it finishes. While it waits in the queue, yields
+        {"stage": "queued", "position": n} whenever n changes; a failure
+        ends with {"stage": "error", "error": exception}.
+        """
+        index, last_position = start, None
+        while True:
+            with self._cond:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    raise KeyError(f"Unknown or expired job {job_id!r}")
+                if index >= len(job.events) and not job.finished:
+                    self._cond.wait(timeout=poll_s)
+                new_events = job.events[index:]
+                finished, error = job.finished, job.error
+                position = self._position(job_id) if job.state == "queued" else None
+            if position is not None and position != last_position:
+                last_position = position
+                yield {"stage": "queued", "position": position}
+            for event in new_events:
+                yield event
+            index += len(new_events)
+            if finished and index >= len(job.events):
+                if error is not None:
+                    yield {"stage": "error", "error": error}
+                return
+
+    def stats(self) -> dict:
+        with self._cond:
+            counts = {state: 0 for state in JOB_STATES}
+            for job in self._jobs.values():
+                counts[job.state] += 1
+            return {"workers": self.workers, "sessions_waiting": len(self._queues), **counts}
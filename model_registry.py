@@ -0,0 +1,172 @@
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from profiling import rss_mb
+
+# RAM budget for resident models, in MB (0 = unlimited)
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+
+
+def model_size_mb(instance) -> float:
+    """
+    Resident size of a loaded model: bytes of every tensor in its
+    state_dict (packed int8 weights included). `instance` can be a torch
+    module or a wrapper exposing one as `.model` (e.g. a captioner).
+    """
+    module = instance if hasattr(instance, "state_dict") else getattr(instance, "model", None)
+    if module is None or not hasattr(module, "state_dict"):
+        return 0.0
+
+    def _bytes(value):
+        if hasattr(value, "element_size"):
+            return value.numel() * value.element_size()
+        if isinstance(value, (tuple, list)):
+            return sum(_bytes(v) for v in value)
+        return 0
+
+    return sum(_bytes(v) for v in module.state_dict().values()) / (1024 * 1024)
+
+
+# =========================================================
+# 🔹 MODEL REGISTRY (LOAD ON DEMAND, LRU EVICTION)
+# =========================================================
+class ModelRegistry:
+    """
+    Loads registered models on first use and keeps them under a RAM
+    budget, evicting the least recently used ones when it is exceeded.
+
+    Models are registered as name -> factory; `get(name, variant)` builds
+    `factory(variant)` (the variant is e.g. a captioner's precision; plain
+    `factory()` without one) once and returns the same instance until it
+    is evicted. Evicting only drops the registry's reference: a caller
+    still holding the instance keeps it alive until it is done with it.
+
+    `stats()` reports, per loaded model, its load time, resident size
+    and usage, including models that have since been evicted.
+    """
+
+    def __init__(self, budget_mb: float = MODEL_MEMORY_BUDGET_MB):
+        self.budget_mb = budget_mb
+        self._factories = {}
+        self._kinds = {}
+        self._resident = OrderedDict()  # (name, variant) -> instance, LRU first
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.evictions = 0
+
+    def register(self, name: str, factory, kind: str = "captioner", replace: bool = False):
+        with self._lock:
+            if name in self._factories and not replace:
+                raise ValueError(f"Model {name!r} is already registered")
+            self._factories[name] = factory
+            self._kinds[name] = kind
+
+    def names(self, kind: str = None) -> list:
+        return [n for n in self._factories if kind is None or self._kinds[n] == kind]
+
+    def get(self, name: str, variant=None):
+        key = (name, variant)
+        with self._lock:
+            if name not in self._factories:
+                raise KeyError(f"Unknown model {name!r}")
+            if key in self._resident:
+                return self._touch(key)
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # One load per key at a time; different models load in parallel
+        with load_lock:
+            with self._lock:
+                if key in self._resident:
+                    return self._touch(key)
+                # Make room up front when we know how big the model is
+                known = self._stats.get(key, {}).get("size_mb", 0.0)
+                self._evict(needed_mb=known, keep=key)
+
+            factory = self._factories[name]
+            rss_before = rss_mb()
+            start = time.perf_counter()
+            instance = factory() if variant is None else factory(variant)
+            load_s = time.perf_counter() - start
+            size = model_size_mb(instance) or max(0.0, rss_mb() - rss_before)
+
+            with self._lock:
+                stats = self._stats.setdefault(key, {"loads": 0, "hits": 0})
+                now = time.time()
+                stats.update(
+                    name=name, variant=variant, kind=self._kinds[name],
+                    load_s=load_s, size_mb=size, loaded_at=now, last_used=now
+                )
+                stats["loads"] += 1
+                self._resident[key] = instance
+                self._evict(keep=key)
+            return instance
+
+    def _touch(self, key):
+        self._resident.move_to_end(key)
+        stats = self._stats[key]
+        stats["hits"] += 1
+        stats["last_used"] = time.time()
+        return self._resident[key]
+
+    def resident_mb(self) -> float:
+        with self._lock:
+            return self._resident_mb()
+
+    def _resident_mb(self) -> float:
+        return sum(self._stats[key]["size_mb"] for key in self._resident)
+
+    def _evict(self, needed_mb: float = 0.0, keep=None):
+        # Caller holds self._lock
+        if not self.budget_mb:
+            return
+        evicted = False
+        for key in list(self._resident):
+            if self._resident_mb() + needed_mb <= self.budget_mb:
+                break
+            if key == keep:
+                continue
+            del self._resident[key]
+            self.evictions += 1
+            evicted = True
+        if evicted:
+            gc.collect()
+
+    def release(self, name: str, variant=None):
+        """Drop a model now (it is reloaded on next use)."""
+        with self._lock:
+            self._resident.pop((name, variant), None)
+        gc.collect()
+
+    def stats(self) -> dict:
+        """{"name[variant]": {load_s, size_mb, loads, hits, resident, ...}}"""
+        with self._lock:
+            return {
+                (f"{name}[{variant}]" if variant is not None else name): {
+                    **stats, "resident": (name, variant) in self._resident
+                }
+                for (name, variant), stats in self._stats.items()
+            }
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "budget_mb": self.budget_mb,
+                "resident_mb": self._resident_mb(),
+                "evictions": self.evictions,
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
@@ -0,0 +1,452 @@
+"""
+ONNX Runtime backend for the captioners (CAPTION_BACKEND=onnx).
+
+Each model is exported once (vision encoder and text decoder as separate
+graphs) into ONNX_CACHE_DIR and then run with ONNX Runtime on CPU, with
+a greedy decoding loop in numpy instead of Hugging Face `generate`:
+
+    BLIP, ViT-GPT2  encoder.onnx, decoder_init.onnx (first step, returns
+                    the KV cache) and decoder.onnx (one token + KV cache)
+    GIT             encoder.onnx and decoder.onnx; GIT's image features
+                    are a prefix of its own decoder and HF exposes no
+                    cache for them, so each step re-runs the decoder on
+                    the whole sequence (the vision encoder still runs once)
+
+Only greedy decoding is supported (what the pipeline uses). Parity and
+latency against the PyTorch backend: benchmarks/onnx_parity.py.
+"""
+import gc
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from caption_models import (
+    BlipBaseCaptioner,
+    GitCaptioner,
+    VitGpt2Captioner,
+    _Captioner,
+)
+
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", ".onnx_cache")
+# Intra-op threads per session (0 = let ONNX Runtime decide)
+ONNX_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", "0"))
+ONNX_OPSET = 17
+# Bump when the exported graphs change, to re-export cached artifacts
+EXPORT_FORMAT = 1
+
+_export_lock = threading.Lock()
+
+
+# =========================================================
+# 🔹 EXPORT (ONCE PER CHECKPOINT, CACHED ON DISK)
+# =========================================================
+def _wrap(model, fn):
+    import torch
+
+    class _Graph(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return fn(self.model, *args)
+
+    return _Graph().eval()
+
+
+def _export(module, args: tuple, path: str, input_names: list, output_names: list, dynamic_axes: dict):
+    import torch
+
+    with torch.no_grad():
+        torch.onnx.export(
+            module, args, path,
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET,
+            do_constant_folding=True,
+        )
+
+
+def _legacy(past):
+    return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+
+
+def _as_cache(flat: tuple, per_layer: int, cache_objects: bool):
+    """Flat KV tensors -> what the HF decoder takes as past_key_values."""
+    layers = tuple(tuple(flat[i:i + per_layer]) for i in range(0, len(flat), per_layer))
+    if not cache_objects:
+        return layers
+    from transformers.cache_utils import DynamicCache, EncoderDecoderCache
+    if per_layer == 4:
+        return EncoderDecoderCache.from_legacy_cache(layers)
+    return DynamicCache.from_legacy_cache(layers)
+
+
+def _export_decoder_with_cache(decoder, hidden, start_token_id: int, out_dir: str) -> dict:
+    """
+    Export `decoder` (a HF causal LM with cross-attention) as
+    decoder_init.onnx and decoder.onnx.
+
+    Returns:
+        dict: the past_key_values layout, for meta.json.
+    """
+    import torch
+
+    batch = hidden.shape[0]
+    input_ids = torch.full((batch, 1), start_token_id, dtype=torch.long)
+
+    def run(model, input_ids, encoder_hidden_states, past=None):
+        out = model(
+            input_ids=input_ids, encoder_hidden_states=encoder_hidden_states,
+            past_key_values=past, use_cache=True, return_dict=True
+        )
+        return (out.logits,) + tuple(t for layer in _legacy(out.past_key_values) for t in layer)
+
+    with torch.no_grad():
+        layers = _legacy(decoder(
+            input_ids=input_ids, encoder_hidden_states=hidden, use_cache=True, return_dict=True
+        ).past_key_values)
+    # 2 tensors per layer (self-attention) or 4 (+ cross-attention)
+    per_layer = len(layers[0])
+    present = tuple(t for layer in layers for t in layer)
+
+    # Newer transformers only take Cache objects as past_key_values
+    cache_objects = False
+    try:
+        with torch.no_grad():
+            run(decoder, input_ids, hidden, _as_cache(present, per_layer, False))
+    except (TypeError, AttributeError, ValueError):
+        cache_objects = True
+
+    present_names = [f"present.{i}" for i in range(len(present))]
+    past_names = [f"past.{i}" for i in range(len(present))]
+    kv_axes = {i: {0: "batch", 2: f"kv_len_{i}"} for i in range(len(present))}
+
+    _export(
+        _wrap(decoder, lambda m, ids, h: run(m, ids, h)),
+        (input_ids, hidden),
+        os.path.join(out_dir, "decoder_init.onnx"),
+        ["input_ids", "encoder_hidden_states"], ["logits"] + present_names,
+        {
+            "input_ids": {0: "batch", 1: "tokens"},
+            "encoder_hidden_states": {0: "batch", 1: "image_tokens"},
+            "logits": {0: "batch", 1: "tokens"},
+            **{present_names[i]: kv_axes[i] for i in kv_axes},
+        },
+    )
+    _export(
+        _wrap(decoder, lambda m, ids, h, *past: run(m, ids, h, _as_cache(past, per_layer, cache_objects))),
+        (input_ids, hidden) + tuple(present),
+        os.path.join(out_dir, "decoder.onnx"),
+        ["input_ids", "encoder_hidden_states"] + past_names, ["logits"] + present_names,
+        {
+            "input_ids": {0: "batch"},
+            "encoder_hidden_states": {0: "batch", 1: "image_tokens"},
+            "logits": {0: "batch"},
+            **{past_names[i]: kv_axes[i] for i in kv_axes},
+            **{present_names[i]: kv_axes[i] for i in kv_axes},
+        },
+    )
+    return {"past_names": past_names, "per_layer": per_layer}
+
+
+def _dummy_pixels(image_processor):
+    import torch
+    from PIL import Image
+
+    images = [Image.new("RGB", (384, 384), color) for color in ("white", "gray")]
+    return image_processor(images, return_tensors="pt").pixel_values.to(torch.float32)
+
+
+def _export_encoder(model, fn, pixel_values, out_dir: str):
+    import torch
+
+    _export(
+        _wrap(model, fn), (pixel_values,), os.path.join(out_dir, "encoder.onnx"),
+        ["pixel_values"], ["encoder_hidden_states"],
+        {"pixel_values": {0: "batch"}, "encoder_hidden_states": {0: "batch"}},
+    )
+    with torch.no_grad():
+        return fn(model, pixel_values)
+
+
+def _export_blip(checkpoint: str, out_dir: str) -> dict:
+    from transformers import BlipForConditionalGeneration, BlipProcessor
+
+    model = BlipForConditionalGeneration.from_pretrained(checkpoint, attn_implementation="eager").eval()
+    pixels = _dummy_pixels(BlipProcessor.from_pretrained(checkpoint).image_processor)
+    hidden = _export_encoder(model, lambda m, pv: m.vision_model(pixel_values=pv)[0], pixels, out_dir)
+
+    text_config = model.config.text_config
+    layout = _export_decoder_with_cache(model.text_decoder, hidden, text_config.bos_token_id, out_dir)
+    return {
+        **layout,
+        "start_token_id": text_config.bos_token_id,
+        "eos_token_id": text_config.sep_token_id,
+        "pad_token_id": text_config.pad_token_id,
+    }
+
+
+def _vit_gpt2_encoder(model, pixel_values):
+    hidden = model.encoder(pixel_values=pixel_values).last_hidden_state
+    # Only present when the encoder and decoder widths differ
+    projection = getattr(model, "enc_to_dec_proj", None)
+    return projection(hidden) if projection is not None else hidden
+
+
+def _export_vit_gpt2(checkpoint: str, out_dir: str) -> dict:
+    from transformers import VisionEncoderDecoderModel, ViTImageProcessor
+
+    model = VisionEncoderDecoderModel.from_pretrained(checkpoint, attn_implementation="eager").eval()
+    pixels = _dummy_pixels(ViTImageProcessor.from_pretrained(checkpoint))
+    hidden = _export_encoder(model, _vit_gpt2_encoder, pixels, out_dir)
+
+    generation = model.generation_config
+    start = generation.decoder_start_token_id
+    if start is None:
+        start = model.config.decoder_start_token_id
+    eos = generation.eos_token_id
+    eos = eos[0] if isinstance(eos, (list, tuple)) else eos
+    layout = _export_decoder_with_cache(model.decoder, hidden, start, out_dir)
+    return {
+        **layout,
+        "start_token_id": start,
+        "eos_token_id": eos,
+        "pad_token_id": generation.pad_token_id if generation.pad_token_id is not None else eos,
+    }
+
+
+def _git_encoder(model, pixel_values):
+    return model.git.visual_projection(model.git.image_encoder(pixel_values).last_hidden_state)
+
+
+def _git_decoder(model, input_ids, visual_features):
+    """GIT's forward pass from precomputed image features (no KV cache)."""
+    import torch
+
+    git = model.git
+    hidden = torch.cat([visual_features, git.embeddings(input_ids=input_ids)], dim=1)
+    # Image tokens see each other; text tokens see the image and earlier text
+    num_image = visual_features.shape[1]
+    positions = torch.arange(hidden.shape[1], device=hidden.device)
+    query, key = positions[:, None], positions[None, :]
+    allowed = (key < num_image) | ((query >= num_image) & (key <= query))
+    mask = torch.zeros(allowed.shape, dtype=hidden.dtype, device=hidden.device)
+    mask = mask.masked_fill(~allowed, torch.finfo(hidden.dtype).min)[None, None]
+    out = git.encoder(hidden, attention_mask=mask, return_dict=True)
+    return model.output(out.last_hidden_state[:, num_image:, :])
+
+
+def _export_git(checkpoint: str, out_dir: str) -> dict:
+    import torch
+    from transformers import AutoModelForCausalLM, AutoProcessor
+
+    model = AutoModelForCausalLM.from_pretrained(checkpoint, attn_implementation="eager").eval()
+    pixels = _dummy_pixels(AutoProcessor.from_pretrained(checkpoint).image_processor)
+    visual = _export_encoder(model, _git_encoder, pixels, out_dir)
+
+    generation = model.generation_config
+    eos = generation.eos_token_id
+    eos = eos[0] if isinstance(eos, (list, tuple)) else eos
+    input_ids = torch.full((visual.shape[0], 2), generation.bos_token_id, dtype=torch.long)
+    _export(
+        _wrap(model, _git_decoder), (input_ids, visual), os.path.join(out_dir, "decoder.onnx"),
+        ["input_ids", "visual_features"], ["logits"],
+        {
+            "input_ids": {0: "batch", 1: "tokens"},
+            "visual_features": {0: "batch"},
+            "logits": {0: "batch", 1: "tokens"},
+        },
+    )
+    return {
+        "start_token_id": generation.bos_token_id,
+        "eos_token_id": eos,
+        "pad_token_id": generation.pad_token_id if generation.pad_token_id is not None else 0,
+    }
+
+
+_EXPORTERS = {"blip": _export_blip, "vit-gpt2": _export_vit_gpt2, "git": _export_git}
+
+
+def export_artifacts(kind: str, checkpoint: str, cache_dir: str = None) -> tuple[str, dict]:
+    """
+    Directory holding the exported graphs of `checkpoint` (exported on
+    first use; later calls and other processes reuse it).
+
+    Returns:
+        (directory, meta)
+    """
+    import torch
+    import transformers
+
+    cache_dir = cache_dir or ONNX_CACHE_DIR
+    target = os.path.join(cache_dir, f"{kind}--{checkpoint.replace('/', '--')}")
+    meta_path = os.path.join(target, "meta.json")
+    with _export_lock:
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format") == EXPORT_FORMAT:
+                return target, meta
+            shutil.rmtree(target, ignore_errors=True)
+
+        # Export next to the target, then rename: a crash never leaves a
+        # half-written model directory behind
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".export-", dir=cache_dir)
+        try:
+            meta = {
+                "format": EXPORT_FORMAT,
+                "kind": kind,
+                "checkpoint": checkpoint,
+                "opset": ONNX_OPSET,
+                "torch": torch.__version__,
+                "transformers": transformers.__version__,
+                **_EXPORTERS[kind](checkpoint, tmp),
+            }
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+            try:
+                os.replace(tmp, target)
+            except OSError:
+                pass  # another process finished first: keep its export
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+            gc.collect()
+    return target, meta
+
+
+# =========================================================
+# 🔹 ONNX RUNTIME CAPTIONERS (GREEDY DECODING)
+# =========================================================
+def _session(path: str):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ONNX_NUM_THREADS:
+        options.intra_op_num_threads = ONNX_NUM_THREADS
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def _run(session, feeds: dict) -> list:
+    # Exported graphs drop inputs they don't use (e.g. the image states
+    # once BLIP's cross-attention keys / values are cached)
+    names = {i.name for i in session.get_inputs()}
+    return session.run(None, {k: v for k, v in feeds.items() if k in names})
+
+
+class _OnnxCaptioner(_Captioner):
+    """
+    Greedy decoding over exported graphs. Subclasses set the processor
+    (`image_processor`, `_batch_decode`) and call `_load(kind, checkpoint)`.
+    """
+
+    backend = "onnx"
+
+    def _load(self, kind: str, checkpoint: str):
+        import torch
+
+        self.device, self.dtype = "cpu", torch.float32
+        self.directory, self.meta = export_artifacts(kind, checkpoint)
+        self.encoder = _session(os.path.join(self.directory, "encoder.onnx"))
+        self.decoder = _session(os.path.join(self.directory, "decoder.onnx"))
+        init = os.path.join(self.directory, "decoder_init.onnx")
+        self.decoder_init = _session(init) if os.path.exists(init) else None
+
+    @property
+    def max_new_tokens(self) -> int:
+        # Same length limit as the PyTorch captioner's generate() call
+        if "max_new_tokens" in self.generate_kwargs:
+            return self.generate_kwargs["max_new_tokens"]
+        return self.generate_kwargs["max_length"] - 1
+
+    def _batch_decode(self, sequences) -> list[str]:
+        raise NotImplementedError
+
+    def _generate(self, pixel_values) -> list[str]:
+        hidden = _run(self.encoder, {"pixel_values": pixel_values.cpu().numpy()})[0]
+        batch = hidden.shape[0]
+        eos, pad = self.meta["eos_token_id"], self.meta["pad_token_id"]
+        sequences = np.full((batch, 1), self.meta["start_token_id"], dtype=np.int64)
+        finished = np.zeros(batch, dtype=bool)
+
+        past = {}
+        for step in range(self.max_new_tokens):
+            if self.decoder_init is None:
+                # No KV cache: the decoder sees the whole sequence again
+                logits = _run(self.decoder, {"input_ids": sequences, "visual_features": hidden})[0]
+            else:
+                session = self.decoder_init if step == 0 else self.decoder
+                tokens = sequences[:, -1:]
+                logits, *present = _run(session, {
+                    "input_ids": tokens, "encoder_hidden_states": hidden, **past
+                })
+                past = dict(zip(self.meta["past_names"], present))
+
+            next_tokens = np.where(finished, pad, logits[:, -1].argmax(axis=-1)).astype(np.int64)
+            sequences = np.concatenate([sequences, next_tokens[:, None]], axis=1)
+            finished |= next_tokens == eos
+            if finished.all():
+                break
+        return self._batch_decode(sequences)
+
+    def caption_candidates(self, images: list, strategies=None, max_batch_size: int = None):
+        raise NotImplementedError(
+            "The ONNX backend only decodes greedily; use the torch backend for candidates"
+        )
+
+
+class OnnxBlipCaptioner(_OnnxCaptioner):
+    generate_kwargs = BlipBaseCaptioner.generate_kwargs
+
+    def __init__(self, checkpoint: str = "Salesforce/blip-image-captioning-base"):
+        from transformers import BlipProcessor
+
+        self.processor = BlipProcessor.from_pretrained(checkpoint)
+        self.image_processor = self.processor.image_processor
+        self._load("blip", checkpoint)
+
+    def _batch_decode(self, sequences) -> list[str]:
+        return self.processor.batch_decode(sequences, skip_special_tokens=True)
+
+
+class OnnxVitGpt2Captioner(_OnnxCaptioner):
+    generate_kwargs = VitGpt2Captioner.generate_kwargs
+
+    def __init__(self, checkpoint: str = "nlpconnect/vit-gpt2-image-captioning"):
+        from transformers import AutoTokenizer, ViTImageProcessor
+
+        self.image_processor = ViTImageProcessor.from_pretrained(checkpoint)
+        self.tokenizer = AutoTokenizer.from_pretrained(checkpoint)
+        self._load("vit-gpt2", checkpoint)
+
+    def _batch_decode(self, sequences) -> list[str]:
+        return self.tokenizer.batch_decode(sequences, skip_special_tokens=True)
+
+
+class OnnxGitCaptioner(_OnnxCaptioner):
+    generate_kwargs = GitCaptioner.generate_kwargs
+
+    def __init__(self, checkpoint: str = "microsoft/git-base"):
+        from transformers import AutoProcessor
+
+        self.processor = AutoProcessor.from_pretrained(checkpoint)
+        self.image_processor = self.processor.image_processor
+        self._load("git", checkpoint)
+
+    def _batch_decode(self, sequences) -> list[str]:
+        return self.processor.batch_decode(sequences, skip_special_tokens=True)
+
+
+# Same keys as caption_models.CAPTIONER_TYPES
+ONNX_CAPTIONERS = {
+    "blip": OnnxBlipCaptioner,
+    "vit-gpt2": OnnxVitGpt2Captioner,
+    "git": OnnxGitCaptioner,
+}
@@ -1,78 +1,598 @@
-from caption_models import generate_all_captions
+import os
+import time
+
+from caption_models import (
+    CAPTIONERS,
+    DEFAULT_MAX_BATCH_SIZE,
+    captioner_config,
+    generate_all_captions_batch,
+    iter_captions
+)
+from image_ingest import load_image
 from consensus import semantic_consensus
 from gemini_fusion import (
+    DEFAULT_REASONING_MODE,
+    GEMINI_MODEL,
+    PROMPT_VERSION,
+    REASONING_MODES,
+    CombinedResponseError,
     fuse_captions_with_gemini,
     self_correct_caption,
-    fuse_with_tree_of_thoughts
+    fuse_with_tree_of_thoughts,
+    reason_in_one_call,
+    fuse_captions_batch,
+    self_correct_captions_batch,
+    fuse_with_tree_of_thoughts_batch
 )
-from evaluation import load_ground_truth, evaluate_all
-from tot_selector import pick_best_tot_candidate
-from agent_explanation import generate_agent_explanation
+from evaluation import load_ground_truth, EvaluationEngine
+from ground_truth_store import GROUND_TRUTH_PATH
+from reasoning_state import get_reasoning_state
+from result_cache import get_result_cache, make_key
+from profiling import METRICS, TRACE_PATH, StageProfiler, profile_call
+from image_index import NEAR_DUP_ENABLED, NEAR_DUP_MAX_CANDIDATES, get_near_dup_index
+import early_exit
+
+# Cache pipeline results by image content + configuration (set to 0 to disable)
+USE_CACHE = os.getenv("CAPTION_CACHE", "1") != "0"
+
+# What a near-duplicate hit reuses (see image_index.py):
+# "reuse": the whole cached result of the near-duplicate
+# "seed":  its captions only; consensus and Gemini run for this image
+NEAR_DUP_MODE = os.getenv("NEAR_DUP_MODE", "reuse")
 
 
+_ground_truth_path = GROUND_TRUTH_PATH
 _ground_truth = None
+_evaluation_engine = None
+
+
+def set_ground_truth(path: str):
+    """Score the pipeline's captions against `path` (default: GROUND_TRUTH_PATH)."""
+    global _ground_truth_path, _ground_truth, _evaluation_engine
+    _ground_truth_path, _ground_truth, _evaluation_engine = path, None, None
 
 def get_ground_truth():
+    # Indexed store: nothing is loaded until an image is looked up
     global _ground_truth
     if _ground_truth is None:
-        _ground_truth = load_ground_truth()
+        _ground_truth = load_ground_truth(_ground_truth_path)
     return _ground_truth
 
 
-def run_captioning_pipeline(
-    image_path: str,
+def get_evaluation_engine():
+    global _evaluation_engine
+    if _evaluation_engine is None:
+        _evaluation_engine = EvaluationEngine(get_ground_truth())
+    return _evaluation_engine
+
+
+def _cache_get(cache, layer: str, key: str, report: dict, looked_up: dict = None):
+    """
+    Cached `layer`/`key`, or None. `looked_up` ({layer: (key, value)})
+    holds lookups the caller already made: they are not read, nor
+    counted in the cache stats, twice.
+    """
+    if cache is None:
+        return None
+    if looked_up and looked_up.get(layer, (None,))[0] == key:
+        value = looked_up[layer][1]
+    else:
+        value = cache.get(layer, key)
+    report[layer] = "miss" if value is None else "hit"
+    return value
+
+
+def _cached(cache, layer: str, key: str, compute, report: dict):
+    """Read `layer`/`key` from the cache, computing and storing it on a miss."""
+    value = _cache_get(cache, layer, key, report)
+    if value is None:
+        value = compute()
+        if cache is not None:
+            cache.put(layer, key, value)
+    return value
+
+
+def _captions_key(image_key: str, adaptive: bool) -> str:
+    # Adaptive runs may caption with fewer models: keep them apart
+    return make_key(image_key, early_exit.config()) if adaptive else image_key
+
+
+def _gemini_key(image_key: str, captions: dict, consensus: dict,
+                use_tot: bool, use_self_correction: bool, combined: bool) -> str:
+    # Same key whether Gemini runs per image or in bulk (gemini_fn)
+    return make_key(
+        image_key, captions, consensus["best_caption"],
+        GEMINI_MODEL, PROMPT_VERSION, use_tot, use_self_correction, combined
+    )
+
+
+def _find_near_duplicate(cache, image, adaptive: bool):
+    """
+    (match, image_key, captions) of the nearest near-duplicate whose
+    captions are cached, or None. Matches are tried nearest first.
+    """
+    for match in get_near_dup_index().query_all(image.perceptual_hash, limit=NEAR_DUP_MAX_CANDIDATES):
+        image_key = make_key(match["content_hash"], captioner_config())
+        captions = cache.get("captions", _captions_key(image_key, adaptive))
+        if captions is not None:
+            return match, image_key, captions
+    return None
+
+
+def iter_captioning_pipeline(
+    image_path,
     image_name: str,
     enable_self_correction: bool = True,
-    enable_tot: bool = True
-) -> dict:
+    enable_tot: bool = True,
+    execution_mode: str = None,
+    use_cache: bool = None,
+    caption_fn=None,
+    adaptive: bool = None,
+    reasoning_mode: str = None,
+    gemini_fn=None,
+    near_duplicates: bool = None,
+    looked_up: dict = None
+):
+    """
+    Run the pipeline, yielding each stage's output as soon as it is ready.
 
-    # 1) Multi-model captions
-    captions = generate_all_captions(image_path)
+    Every event is a dict with "stage", "stage_seconds" (time spent in
+    that stage) and "elapsed" (since the start of the run), plus:
+
+        "near_duplicate"  near_duplicate            (near-duplicate hit only)
+        "caption"         model, caption            (once per model)
+        "consensus"       consensus
+        "early_exit"      early_exit                (adaptive mode only)
+        "tot_candidates"  tot_debug                 (ToT only)
+        "fusion"          caption                   (simple fusion only)
+        "final_caption"   caption
+        "evaluation"      evaluation                (None without ground truth)
+        "explanation"     agent_explanation
+        "done"            result (same dict as run_captioning_pipeline)
+
+    Cached stages are replayed with "cached": True and no stage time;
+    "caption" events of a non-streaming captioning stage (cache hit or
+    `caption_fn`) are emitted together once it is done.
+    `gemini_fn(captions, consensus) -> {"final_caption", "tot_debug"}`
+    replaces the Gemini stages, like `caption_fn` for the captioners.
+    `looked_up` ({layer: (key, value)}) passes cache lookups already made
+    by the caller (see _cache_get).
+    See run_captioning_pipeline for the arguments.
+    """
+    profiler = StageProfiler()
+
+    def event(stage: str, stage_seconds: float, **payload) -> dict:
+        return {
+            "stage": stage,
+            "stage_seconds": stage_seconds,
+            "elapsed": time.perf_counter() - profiler.started,
+            **payload
+        }
+
+    cache = get_result_cache() if (USE_CACHE if use_cache is None else use_cache) else None
+    cache_report = {}
+    adaptive = early_exit.ADAPTIVE if adaptive is None else adaptive
+    near_duplicates = (NEAR_DUP_ENABLED if near_duplicates is None else near_duplicates) and cache is not None
+    reasoning_mode = reasoning_mode or DEFAULT_REASONING_MODE
+    if reasoning_mode not in REASONING_MODES:
+        raise ValueError(f"Unknown reasoning mode {reasoning_mode!r}, expected one of {REASONING_MODES}")
+
+    with profiler.stage("image_load"):
+        image = load_image(image_path)
+        image_key = make_key(image.content_hash, captioner_config())
+    captions_key = _captions_key(image_key, adaptive)
+
+    # 1) Multi-model captions (streamed model by model)
+    # Time spent by the consumer while we are suspended in `yield` is
+    # subtracted, so the stage only accounts for our own work.
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    paused_wall = paused_cpu = 0.0
+    model_timings = {}
+    captions = _cache_get(cache, "captions", captions_key, cache_report, looked_up)
+    pending_events = []
+    near_duplicate = None
+    if captions is None and near_duplicates:
+        with profiler.stage("near_dup_lookup"):
+            found = _find_near_duplicate(cache, image, adaptive)
+        if found is not None:
+            match, dup_image_key, captions = found
+            near_duplicate = {**match, "mode": NEAR_DUP_MODE}
+            cache_report["captions"] = "near_duplicate"
+            if NEAR_DUP_MODE == "seed":
+                cache.put("captions", captions_key, captions)
+            else:
+                # Every later stage is looked up under the duplicate's key
+                image_key, captions_key = dup_image_key, _captions_key(dup_image_key, adaptive)
+            pending_events.append(
+                event("near_duplicate", profiler.wall("near_dup_lookup"), near_duplicate=near_duplicate)
+            )
+    if captions is not None:
+        pending_events += [
+            event("caption", 0.0, model=model, caption=caption, cached=True)
+            for model, caption in captions.items()
+        ]
+    elif caption_fn is not None:
+        captions, timings = caption_fn(image)
+        model_timings.update(timings)
+        for model, caption in captions.items():
+            profiler.record("caption", {"wall_s": timings.get(model, 0.0)}, model=model)
+            pending_events.append(event("caption", timings.get(model), model=model, caption=caption))
+    else:
+        # Adaptive: run the first wave, and the others only if it disagrees
+        waves = early_exit.model_waves(CAPTIONERS) if adaptive else [list(CAPTIONERS)]
+        streamed = {}
+        for wave_index, wave in enumerate(waves):
+            if not wave:
+                continue
+            if wave_index > 0:
+                with profiler.stage("early_exit.check"):
+                    first_wave = dict(streamed)
+                    skip = early_exit.should_skip_models(
+                        early_exit.agreement(semantic_consensus(first_wave))
+                    )
+                if skip:
+                    break
+            for model, caption, stats in iter_captions(image, execution_mode=execution_mode, models=wave):
+                streamed[model] = caption
+                model_timings[model] = stats["wall_s"]
+                profiler.record("caption", stats, model=model)
+                pause_wall, pause_cpu = time.perf_counter(), time.process_time()
+                yield event("caption", stats["wall_s"], model=model, caption=caption)
+                paused_wall += time.perf_counter() - pause_wall
+                paused_cpu += time.process_time() - pause_cpu
+        # Report in the usual model order, not completion order
+        captions = {model: streamed[model] for model in CAPTIONERS if model in streamed}
+    if cache is not None and cache_report.get("captions") == "miss":
+        cache.put("captions", captions_key, captions)
+        if near_duplicates:
+            get_near_dup_index().add_image(image)
+    profiler.record("captions", {
+        "wall_s": time.perf_counter() - wall0 - paused_wall,
+        "cpu_s": time.process_time() - cpu0 - paused_cpu,
+    })
+    yield from pending_events
 
     # 2) Consensus sémantique
-    consensus = semantic_consensus(captions)
-
-    # 3) Gemini: ToT ou fusion simple
-    tot_debug = None
-    if enable_tot:
-        candidates = fuse_with_tree_of_thoughts(
-            captions=captions,
-            consensus_caption=consensus["best_caption"]
-        )
-        tot_debug = pick_best_tot_candidate(consensus["best_caption"], candidates)
-        final_caption = tot_debug["picked_caption"]
+    # The reasoning state (embeddings, similarity, ToT scores, explanation)
+    # is memoized in memory: a rerun with other options reuses it
+    consensus_key = make_key(image_key, captions)
+    state = get_reasoning_state(consensus_key, captions)
+    with profiler.stage("consensus"):
+        consensus = _cached(cache, "consensus", consensus_key, lambda: state.consensus, cache_report)
+        state.consensus = consensus
+    yield event("consensus", profiler.wall("consensus"), consensus=consensus)
+
+    # Early exit: skip the Gemini stages the agreement makes unnecessary
+    decision = None
+    use_tot, use_self_correction = enable_tot, enable_self_correction
+    if adaptive:
+        score = early_exit.agreement(consensus)
+        plan = early_exit.gemini_plan(score, enable_tot, enable_self_correction)
+        use_tot, use_self_correction = plan["tot"], plan["self_correction"]
+        decision = {
+            "agreement": score,
+            "skipped_models": [model for model in CAPTIONERS if model not in captions],
+            "gemini": plan["mode"],
+            "gemini_calls_saved": plan["calls_saved"],
+            "thresholds": early_exit.thresholds(),
+        }
+        yield event("early_exit", 0.0, early_exit=decision)
+
+    # 3) Gemini: ToT ou fusion simple, puis 4) self-correction
+    # The combined call only replaces the ToT path
+    combined = use_tot and reasoning_mode == "combined"
+    gemini_key = _gemini_key(image_key, captions, consensus, use_tot, use_self_correction, combined)
+    if decision is not None and decision["gemini"] == "consensus":
+        gemini = {"final_caption": consensus["best_caption"], "tot_debug": None, "reasoning": None}
     else:
-        final_caption = fuse_captions_with_gemini(
-            captions=captions,
-            consensus_caption=consensus["best_caption"]
-        )
+        gemini = _cache_get(cache, "gemini", gemini_key, cache_report, looked_up)
+    if gemini is not None:
+        if gemini["tot_debug"]:
+            yield event("tot_candidates", 0.0, tot_debug=gemini["tot_debug"], cached=True)
+    elif gemini_fn is not None:
+        # Computed for many images at once (see run_captioning_pipeline_batch)
+        with profiler.stage("gemini.batch"):
+            gemini = {**gemini_fn(captions, consensus), "reasoning": None}
+        if gemini["tot_debug"]:
+            yield event("tot_candidates", profiler.wall("gemini.batch"), tot_debug=gemini["tot_debug"])
+        if cache is not None:
+            cache.put("gemini", gemini_key, gemini)
+    else:
+        tot_debug = None
+        candidates = corrected = None
+        reasoning = None
+        if combined:
+            # One structured call for candidates + corrections, else 3 calls
+            with profiler.stage("gemini.combined"):
+                try:
+                    answer = reason_in_one_call(
+                        captions=captions,
+                        consensus_caption=consensus["best_caption"]
+                    )
+                    candidates, corrected = answer["candidates"], answer["corrected"]
+                    reasoning = {"mode": "combined", "fallback": None}
+                except CombinedResponseError as exc:
+                    reasoning = {"mode": "multi", "fallback": str(exc)}
+        if use_tot:
+            if candidates is None:
+                with profiler.stage("gemini.tot"):
+                    candidates, branch_seconds = fuse_with_tree_of_thoughts(
+                        captions=captions,
+                        consensus_caption=consensus["best_caption"],
+                        return_timings=True
+                    )
+                # The branches run concurrently: one sample per call too
+                for branch, seconds in enumerate(branch_seconds):
+                    profiler.record("gemini.tot_call", {"wall_s": seconds}, branch=branch)
+            with profiler.stage("tot_select"):
+                tot_debug = state.pick_tot(candidates)
+            final_caption = tot_debug["picked_caption"]
+            yield event(
+                "tot_candidates",
+                profiler.wall("gemini.combined") + profiler.wall("gemini.tot") + profiler.wall("tot_select"),
+                tot_debug=tot_debug
+            )
+        else:
+            with profiler.stage("gemini.fusion"):
+                final_caption = fuse_captions_with_gemini(
+                    captions=captions,
+                    consensus_caption=consensus["best_caption"]
+                )
+            yield event("fusion", profiler.wall("gemini.fusion"), caption=final_caption)
+
+        if use_self_correction:
+            if corrected is not None:
+                final_caption = corrected[candidates.index(final_caption)]
+            else:
+                with profiler.stage("gemini.self_correction"):
+                    final_caption = self_correct_caption(final_caption)
 
-    # 4) Self-correction
-    if enable_self_correction:
-        final_caption = self_correct_caption(final_caption)
+        gemini = {"final_caption": final_caption, "tot_debug": tot_debug, "reasoning": reasoning}
+        if cache is not None:
+            cache.put("gemini", gemini_key, gemini)
 
-    # 5) Evaluation (si image dans data.json)
-    ground_truth = get_ground_truth()
-    all_captions = captions.copy()
-    all_captions["Gemini-Fusion"] = final_caption
+    final_caption = gemini["final_caption"]
+    tot_debug = gemini["tot_debug"]
+    reasoning = gemini.get("reasoning")
+    yield event("final_caption", profiler.wall("gemini.self_correction"), caption=final_caption)
 
-    scores = None
-    if image_name in ground_truth:
-        scores = evaluate_all(ground_truth, image_name, all_captions)
+    # 5) Evaluation (si image dans la vérité terrain)
+    with profiler.stage("evaluation"):
+        ground_truth = get_ground_truth()
+        all_captions = captions.copy()
+        all_captions["Gemini-Fusion"] = final_caption
+
+        scores = None
+        if image_name in ground_truth:
+            scores = _cached(
+                cache, "evaluation",
+                make_key(ground_truth[image_name], all_captions),
+                lambda: get_evaluation_engine().evaluate_all(image_name, all_captions),
+                cache_report
+            )
+    yield event("evaluation", profiler.wall("evaluation"), evaluation=scores)
 
     # 6) Explication dynamique
-    explanation = generate_agent_explanation(
-        captions=captions,
-        consensus=consensus,
-        final_caption=final_caption,
-        tot_debug=tot_debug
-    )
+    with profiler.stage("explanation"):
+        explanation = state.explanation(final_caption, tot_debug, decision)
+    yield event("explanation", profiler.wall("explanation"), agent_explanation=explanation)
 
-    return {
+    timings = profiler.summary()
+    if TRACE_PATH:
+        profiler.write_trace(TRACE_PATH, image=image_name, image_hash=image.content_hash)
+
+    yield event("done", timings["total_s"], result={
         "captions": captions,
+        "model_timings": model_timings,
+        "stage_timings": {name: stats["wall_s"] for name, stats in timings["stages"].items()},
+        "timings": timings,
         "consensus": consensus,
         "final_caption": final_caption,
         "evaluation": scores,
         "tot_debug": tot_debug,
-        "agent_explanation": explanation
-    }
+        "early_exit": decision,
+        "reasoning": reasoning,
+        "near_duplicate": near_duplicate,
+        "agent_explanation": explanation,
+        "intermediate": state,
+        "cache": {
+            "layers": cache_report,
+            "totals": cache.snapshot() if cache is not None else None
+        }
+    })
+
+
+def run_captioning_pipeline(
+    image_path,
+    image_name: str,
+    enable_self_correction: bool = True,
+    enable_tot: bool = True,
+    execution_mode: str = None,
+    use_cache: bool = None,
+    caption_fn=None,
+    adaptive: bool = None,
+    reasoning_mode: str = None,
+    near_duplicates: bool = None
+) -> dict:
+    """
+    `image_path` may be a file path, in-memory bytes, a PIL image or a
+    PreparedImage; it is decoded once and shared by all captioners.
+    `execution_mode` selects how the captioners run ("sequential",
+    "threads" or "processes", default from CAPTION_EXECUTION_MODE).
+    `caption_fn(image) -> (captions, timings)` replaces the captioning
+    stage (the HTTP server uses it to route images through its batcher).
+
+    With `use_cache` (default: CAPTION_CACHE env, on), each stage is
+    looked up in the persistent result cache, keyed by the image content
+    hash plus the models and prompt configuration it depends on.
+
+    With `adaptive` (default: CAPTION_ADAPTIVE env, off), the pipeline
+    exits early when the models already agree: the last captioners are
+    skipped, and Gemini is reduced to one fusion call or skipped entirely
+    (see early_exit.py for the thresholds). The decision is reported in
+    the result's "early_exit" entry (None when adaptive mode is off).
+    With `caption_fn`, every model still runs and only Gemini is reduced.
+
+    `reasoning_mode` (default: GEMINI_REASONING_MODE env, "multi") set to
+    "combined" replaces the ToT + self-correction calls with a single
+    structured-output Gemini call, falling back to the separate calls
+    when its answer cannot be parsed. In that mode the result's
+    "reasoning" entry ({"mode", "fallback"}) says which path ran; it is
+    None otherwise.
+
+    With `near_duplicates` (default: CAPTION_NEAR_DUP env, off) and the
+    cache on, an image whose captions are not cached is looked up in the
+    perceptual-hash index (image_index.py). A near-duplicate within
+    NEAR_DUP_THRESHOLD reuses its cached result (NEAR_DUP_MODE="reuse")
+    or just its captions ("seed"); the match is in "near_duplicate".
+
+    The result's "intermediate" is the in-memory ReasoningState of the
+    captions (reasoning_state.py): embeddings, similarity matrix, ToT
+    scores and memoized explanations, reused by reruns with other options.
+    It is not JSON-serializable (the server drops it).
+
+    Use iter_captioning_pipeline to get stage results as they are ready.
+    The result's "timings" block has wall / CPU time and memory per stage
+    and per model (see profiling.py for trace export and profiler hooks).
+    """
+    with profile_call("pipeline"):
+        for event in iter_captioning_pipeline(
+            image_path,
+            image_name,
+            enable_self_correction=enable_self_correction,
+            enable_tot=enable_tot,
+            execution_mode=execution_mode,
+            use_cache=use_cache,
+            caption_fn=caption_fn,
+            adaptive=adaptive,
+            reasoning_mode=reasoning_mode,
+            near_duplicates=near_duplicates
+        ):
+            if event["stage"] == "done":
+                return event["result"]
+
+
+def _observe_bulk_calls(kind: str, stats: dict):
+    # One metrics sample per bulk Gemini request (no per-image profiler here)
+    for seconds in stats["request_s"]:
+        METRICS.observe("gemini.bulk_call", {"kind": kind}, {"wall_s": seconds})
+
+
+def run_captioning_pipeline_batch(
+    images: list,
+    image_names: list,
+    enable_self_correction: bool = True,
+    enable_tot: bool = True,
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+    execution_mode: str = None,
+    use_cache: bool = None
+) -> list:
+    """
+    Batch version of run_captioning_pipeline for offline jobs.
+
+    The captioners run batched (generate_all_captions_batch), fusion and
+    self-correction go through bulk Gemini requests covering many images
+    each (gemini_fusion.fuse_captions_batch), ToT branches included
+    (one bulk item per image and branch). Adaptive early exit and the combined
+    reasoning mode do not apply to batch runs. Images whose Gemini result
+    is cached are left out of the bulk requests.
+
+    Returns:
+        list[dict]: one run_captioning_pipeline result per image, in order
+        ({"captions", "error"} for an image that failed).
+    """
+    with profile_call("pipeline_batch"):
+        images = [load_image(img) for img in images]
+        cache = get_result_cache() if (USE_CACHE if use_cache is None else use_cache) else None
+
+        # Captions: cached ones are reused, the others are captioned together
+        image_keys = [make_key(img.content_hash, captioner_config()) for img in images]
+        captions = [
+            cache.get("captions", image_key) if cache is not None else None
+            for image_key in image_keys
+        ]
+        cached_captions = list(captions)
+        todo = [i for i, c in enumerate(captions) if c is None]
+        model_timings = {}
+        if todo:
+            batch, timings = generate_all_captions_batch(
+                [images[i] for i in todo],
+                max_batch_size=max_batch_size,
+                execution_mode=execution_mode,
+                return_timings=True
+            )
+            for i, c in zip(todo, batch):
+                captions[i] = c
+            # Per-image share of each model's batch time
+            model_timings = {model: seconds / len(todo) for model, seconds in timings.items()}
+
+        # Gemini: bulk requests for the images whose result is not cached.
+        # The reasoning states are the ones the per-image runs below pick
+        # up again.
+        states = [
+            get_reasoning_state(make_key(image_key, c), c)
+            for image_key, c in zip(image_keys, captions)
+        ]
+        gemini_keys = [
+            _gemini_key(image_key, c, state.consensus, enable_tot, enable_self_correction, False)
+            for image_key, c, state in zip(image_keys, captions, states)
+        ]
+        gemini = [cache.get("gemini", key) if cache is not None else None for key in gemini_keys]
+        cached_gemini = list(gemini)
+        todo = [i for i, g in enumerate(gemini) if g is None]
+        if todo:
+            items = [(captions[i], states[i].consensus["best_caption"]) for i in todo]
+            if enable_tot:
+                candidates, stats = fuse_with_tree_of_thoughts_batch(items, return_stats=True)
+                _observe_bulk_calls("tot", stats)
+                tot_debug = [
+                    cands if isinstance(cands, Exception) else states[i].pick_tot(cands)
+                    for i, cands in zip(todo, candidates)
+                ]
+                finals = [t if isinstance(t, Exception) else t["picked_caption"] for t in tot_debug]
+            else:
+                tot_debug = [None] * len(todo)
+                finals, stats = fuse_captions_batch(items, return_stats=True)
+                _observe_bulk_calls("fusion", stats)
+            if enable_self_correction:
+                # Failed items are not sent again; they fall back below
+                ok = [k for k, f in enumerate(finals) if not isinstance(f, Exception)]
+                corrections, stats = self_correct_captions_batch([finals[k] for k in ok], return_stats=True)
+                _observe_bulk_calls("self_correction", stats)
+                for k, corrected in zip(ok, corrections):
+                    finals[k] = corrected
+            for i, final, tot in zip(todo, finals, tot_debug):
+                if not isinstance(final, Exception):
+                    gemini[i] = {"final_caption": final, "tot_debug": tot}
+
+        # An image whose bulk Gemini call failed runs the per-image Gemini
+        # path; if that fails too, its result is {"captions", "error"}
+        results = []
+        for i, (image, image_name) in enumerate(zip(images, image_names)):
+            gemini_fn = None
+            if gemini[i] is not None:
+                gemini_fn = lambda _captions, _consensus, i=i: {
+                    "final_caption": gemini[i]["final_caption"], "tot_debug": gemini[i]["tot_debug"]
+                }
+            try:
+                for event in iter_captioning_pipeline(
+                    image,
+                    image_name,
+                    enable_self_correction=enable_self_correction,
+                    enable_tot=enable_tot,
+                    use_cache=use_cache,
+                    caption_fn=lambda _image, i=i: (captions[i], model_timings),
+                    adaptive=False,
+                    reasoning_mode="multi",
+                    gemini_fn=gemini_fn,
+                    # Already read above: each lookup is counted once
+                    looked_up={
+                        "captions": (image_keys[i], cached_captions[i]),
+                        "gemini": (gemini_keys[i], cached_gemini[i]),
+                    }
+                ):
+                    if event["stage"] == "done":
+                        results.append(event["result"])
+            except Exception as exc:
+                results.append({"captions": captions[i], "error": repr(exc)})
+        return results
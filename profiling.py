@@ -0,0 +1,229 @@
+"""
+Per-stage instrumentation for the captioning pipeline.
+
+Environment switches:
+    PIPELINE_TRACE_PATH   append one JSON line per pipeline run (stage records)
+    PIPELINE_PROFILER     "cprofile" or "pyinstrument": profile every
+                          run_captioning_pipeline call
+    PIPELINE_PROFILE_DIR  where profiler outputs go (default: profiles/)
+"""
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+TRACE_PATH = os.getenv("PIPELINE_TRACE_PATH")
+PROFILER = os.getenv("PIPELINE_PROFILER", "").lower()
+PROFILE_DIR = os.getenv("PIPELINE_PROFILE_DIR", "profiles")
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_mb() -> float:
+    """Current resident set size (Linux /proc; falls back to the peak)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except (OSError, IndexError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(fn, *args, cpu_clock=time.process_time, **kwargs):
+    """
+    Call fn and return (result, stats) with wall/CPU time and memory.
+
+    Use cpu_clock=time.thread_time when other work runs concurrently in
+    this process (it then misses the callee's own helper threads).
+    """
+    wall0, cpu0, peak0 = time.perf_counter(), cpu_clock(), peak_rss_mb()
+    result = fn(*args, **kwargs)
+    peak1 = peak_rss_mb()
+    return result, {
+        "wall_s": time.perf_counter() - wall0,
+        "cpu_s": cpu_clock() - cpu0,
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": peak1,
+        "peak_rss_growth_mb": peak1 - peak0,
+    }
+
+
+# =========================================================
+# 🔹 PER-RUN STAGE PROFILER
+# =========================================================
+class StageProfiler:
+    """
+    Records wall time, CPU time and memory for each stage of one run.
+
+    Memory is the process RSS after the stage, the process peak RSS and
+    how much the peak grew during the stage. When tracemalloc is tracing,
+    the Python-heap peak of the stage is recorded too (torch tensors are
+    not allocated through Python and do not show up there).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.records = []
+
+    @contextmanager
+    def stage(self, name: str, **labels):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        wall0, cpu0, peak0 = time.perf_counter(), time.process_time(), peak_rss_mb()
+        try:
+            yield
+        finally:
+            peak1 = peak_rss_mb()
+            stats = {
+                "wall_s": time.perf_counter() - wall0,
+                "cpu_s": time.process_time() - cpu0,
+                "rss_mb": rss_mb(),
+                "peak_rss_mb": peak1,
+                "peak_rss_growth_mb": peak1 - peak0,
+            }
+            if tracing:
+                stats["py_heap_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+            self.record(name, stats, **labels)
+
+    def record(self, name: str, stats: dict, **labels):
+        """Add an externally measured stage (e.g. a model run in a worker)."""
+        self.records.append({"stage": name, "labels": labels, **stats})
+        METRICS.observe(name, labels, stats)
+
+    def wall(self, name: str) -> float:
+        return sum(r["wall_s"] for r in self.records if r["stage"] == name)
+
+    def summary(self) -> dict:
+        """
+        Timings block for the result dict. Labelled records other than
+        models (e.g. one per Gemini call of a stage) are listed in "calls".
+        """
+        stages, models, calls = {}, {}, []
+        for r in self.records:
+            stats = {k: v for k, v in r.items() if k not in ("stage", "labels")}
+            model = r["labels"].get("model")
+            if model is not None:
+                models[model] = stats
+            elif r["labels"]:
+                calls.append({"stage": r["stage"], **r["labels"], **stats})
+            else:
+                stages[r["stage"]] = stats
+        return {
+            "total_s": time.perf_counter() - self.started,
+            "stages": stages,
+            "models": models,
+            "calls": calls,
+        }
+
+    def write_trace(self, path: str, **fields):
+        """Append this run as one JSON line."""
+        line = {"ts": time.time(), **fields, "records": self.records}
+        with _trace_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+_trace_lock = threading.Lock()
+
+
+# =========================================================
+# 🔹 PROCESS-WIDE METRICS (PROMETHEUS TEXT FORMAT)
+# =========================================================
+def _label_value(value) -> str:
+    # Prometheus text format: backslash, double quote and newline are escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Cumulative per-stage counters, exportable as Prometheus text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, stage: str, labels: dict, stats: dict):
+        key = (stage, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._series.setdefault(key, {"count": 0, "wall_s": 0.0, "cpu_s": 0.0})
+            series["count"] += 1
+            series["wall_s"] += stats.get("wall_s", 0.0)
+            series["cpu_s"] += stats.get("cpu_s", 0.0)
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP pipeline_stage_wall_seconds Wall time spent per pipeline stage.",
+            "# TYPE pipeline_stage_wall_seconds summary",
+        ]
+        cpu = [
+            "# HELP pipeline_stage_cpu_seconds_total CPU time spent per pipeline stage.",
+            "# TYPE pipeline_stage_cpu_seconds_total counter",
+        ]
+        with self._lock:
+            for (stage, labels), series in sorted(self._series.items()):
+                label_str = ",".join(
+                    [f'stage="{_label_value(stage)}"'] + [f'{k}="{_label_value(v)}"' for k, v in labels]
+                )
+                lines.append(f"pipeline_stage_wall_seconds_sum{{{label_str}}} {series['wall_s']:.6f}")
+                lines.append(f"pipeline_stage_wall_seconds_count{{{label_str}}} {series['count']}")
+                cpu.append(f"pipeline_stage_cpu_seconds_total{{{label_str}}} {series['cpu_s']:.6f}")
+        lines += cpu
+        lines += [
+            "# HELP process_resident_memory_megabytes Current resident set size.",
+            "# TYPE process_resident_memory_megabytes gauge",
+            f"process_resident_memory_megabytes {rss_mb():.1f}",
+            "# HELP process_peak_resident_memory_megabytes Peak resident set size.",
+            "# TYPE process_peak_resident_memory_megabytes gauge",
+            f"process_peak_resident_memory_megabytes {peak_rss_mb():.1f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Write the metrics for a node-exporter textfile collector."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+
+METRICS = MetricsRegistry()
+
+
+# =========================================================
+# 🔹 OPTIONAL PER-CALL PROFILER HOOK
+# =========================================================
+@contextmanager
+def profile_call(name: str):
+    """cProfile / pyinstrument the wrapped call when PIPELINE_PROFILER is set."""
+    if PROFILER not in ("cprofile", "pyinstrument"):
+        yield
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}")
+
+    if PROFILER == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{stem}.prof")
+    else:
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(f"{stem}.html", "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
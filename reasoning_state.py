@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from agent_explanation import generate_agent_explanation
+from consensus import consensus_from_embeddings
+from embeddings import get_embedding_service
+from result_cache import make_key
+from tot_selector import pick_best_tot_candidate
+
+# Reasoning states kept in memory (one per image + captions)
+REASONING_STATE_MEMO_SIZE = int(os.getenv("REASONING_STATE_MEMO_SIZE", "256"))
+
+
+# =========================================================
+# 🔹 STRUCTURED INTERMEDIATE (CONSENSUS, ToT, EXPLANATION)
+# =========================================================
+class ReasoningState:
+    """
+    Everything computed from one set of captions, shared by the later
+    stages and by reruns with other options (ToT on / off, reasoning
+    shown or not):
+
+    - `embeddings`: unit-norm caption embeddings (encoded on first use)
+    - `consensus` / `similarity_matrix`: from the embeddings, or from a
+      cached consensus (then nothing is encoded)
+    - `pick_tot(candidates)`: ToT scores against the consensus embedding,
+      memoized per candidate list (`candidate_scores` keeps them all)
+    - `explanation(...)`: the agent explanation, memoized per input
+
+    Like PreparedImage, every field is computed lazily and only once.
+    """
+
+    def __init__(self, captions: dict):
+        self.captions = dict(captions)
+        self._lock = threading.RLock()
+        self._embeddings = None
+        self._consensus = None
+        self._tot = {}
+        self._explanations = {}
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = get_embedding_service().encode(list(self.captions.values()))
+            return self._embeddings
+
+    @property
+    def consensus(self) -> dict:
+        with self._lock:
+            if self._consensus is None:
+                self._consensus = consensus_from_embeddings(self.captions, self.embeddings)
+            return self._consensus
+
+    @consensus.setter
+    def consensus(self, consensus: dict):
+        # A consensus read from the result cache (same captions)
+        with self._lock:
+            self._consensus = consensus
+
+    @property
+    def similarity_matrix(self) -> np.ndarray:
+        return np.asarray(self.consensus["similarity_matrix"])
+
+    @property
+    def consensus_embedding(self) -> np.ndarray:
+        return self.embeddings[list(self.captions).index(self.consensus["best_model"])]
+
+    def pick_tot(self, candidates: list) -> dict:
+        key = tuple(candidates)
+        with self._lock:
+            if key not in self._tot:
+                self._tot[key] = pick_best_tot_candidate(
+                    self.consensus["best_caption"], list(candidates),
+                    consensus_embedding=self.consensus_embedding
+                )
+            return self._tot[key]
+
+    @property
+    def candidate_scores(self) -> dict:
+        """{candidate: final ToT score} over every candidate list scored."""
+        with self._lock:
+            return {
+                caption: tot["final_score"][f"cand_{i + 1}"]
+                for tot in self._tot.values()
+                for i, caption in enumerate(tot["candidates"])
+            }
+
+    def explanation(self, final_caption: str, tot_debug: dict = None, early_exit: dict = None) -> str:
+        key = make_key(final_caption, tot_debug, early_exit)
+        with self._lock:
+            if key not in self._explanations:
+                self._explanations[key] = generate_agent_explanation(
+                    captions=self.captions,
+                    consensus=self.consensus,
+                    final_caption=final_caption,
+                    tot_debug=tot_debug,
+                    early_exit=early_exit
+                )
+            return self._explanations[key]
+
+
+_states = OrderedDict()
+_states_lock = threading.Lock()
+
+
+def get_reasoning_state(key: str, captions: dict) -> ReasoningState:
+    """Memoized ReasoningState for `captions` (key: image + captions)."""
+    with _states_lock:
+        state = _states.get(key)
+        if state is None:
+            state = _states[key] = ReasoningState(captions)
+            while len(_states) > REASONING_STATE_MEMO_SIZE:
+                _states.popitem(last=False)
+        else:
+            _states.move_to_end(key)
+        return state
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.getenv("CAPTION_CACHE_PATH", ".caption_cache.sqlite")
+DEFAULT_MAX_ENTRIES = int(os.getenv("CAPTION_CACHE_MAX_ENTRIES", "10000"))
+
+# One layer per pipeline stage, each keyed by everything that stage depends on.
+LAYERS = ("captions", "consensus", "gemini", "evaluation")
+
+
+def make_key(*parts) -> str:
+    """Stable content key from JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# =========================================================
+# 🔹 SQLITE-BACKED LRU CACHE
+# =========================================================
+class ResultCache:
+    """
+    Persistent pipeline result cache.
+
+    Values are JSON documents stored in SQLite, one table row per
+    (layer, key). Each layer holds at most `max_entries` rows; the least
+    recently read ones are evicted first. Hit/miss counters are kept per
+    layer for the lifetime of the object.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " layer TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " PRIMARY KEY (layer, key))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_lru ON results (layer, last_access)"
+        )
+        self._conn.commit()
+        self.stats = {layer: {"hits": 0, "misses": 0} for layer in LAYERS}
+
+    def get(self, layer: str, key: str):
+        """Return the cached value, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE layer = ? AND key = ?", (layer, key)
+            ).fetchone()
+            if row is None:
+                self.stats[layer]["misses"] += 1
+                return None
+            self._conn.execute(
+                "UPDATE results SET last_access = ? WHERE layer = ? AND key = ?",
+                (time.time(), layer, key)
+            )
+            self._conn.commit()
+            self.stats[layer]["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, layer: str, key: str, value):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (layer, key, value, last_access) VALUES (?, ?, ?, ?)",
+                (layer, key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self._evict(layer)
+            self._conn.commit()
+
+    def _evict(self, layer: str):
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM results WHERE layer = ?", (layer,)
+        ).fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM results WHERE rowid IN ("
+                " SELECT rowid FROM results WHERE layer = ?"
+                " ORDER BY last_access ASC LIMIT ?)",
+                (layer, excess)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def snapshot(self) -> dict:
+        """Copy of the cumulative per-layer hit/miss counters."""
+        with self._lock:
+            return {layer: dict(counts) for layer, counts in self.stats.items()}
+
+
+_cache_instance = None
+
+
+def get_result_cache() -> ResultCache:
+    global _cache_instance
+    if _cache_instance is None:
+        _cache_instance = ResultCache()
+    return _cache_instance
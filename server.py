@@ -0,0 +1,309 @@
+"""
+Headless HTTP inference server (plain ASGI, no framework).
+
+    uvicorn server:app --host 0.0.0.0 --port 8000
+
+Endpoints:
+    POST /caption?image_name=img1.jpg&tot=1&self_correction=1&adaptive=1
+        body: the encoded image bytes -> JSON pipeline result
+    GET  /healthz
+        queue depth, in-flight requests, batching statistics and the
+        load time / resident size of every loaded model
+    GET  /metrics
+        per-stage timings in Prometheus text format
+
+Concurrent requests share one set of loaded models: their images are
+collected into micro-batches (up to CAPTION_SERVER_MAX_BATCH images, or
+whatever arrived within CAPTION_SERVER_MAX_WAIT_MS) before going through
+the captioners. When the batch queue or the pipeline pool is full, new
+requests are rejected with 503 + Retry-After instead of piling up.
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from caption_models import DEFAULT_MAX_BATCH_SIZE, generate_all_captions_batch, model_stats
+from image_ingest import load_image
+from pipeline import run_captioning_pipeline
+from profiling import METRICS
+
+MAX_BATCH_SIZE = int(os.getenv("CAPTION_SERVER_MAX_BATCH", str(DEFAULT_MAX_BATCH_SIZE)))
+MAX_WAIT_MS = float(os.getenv("CAPTION_SERVER_MAX_WAIT_MS", "20"))
+MAX_QUEUE = int(os.getenv("CAPTION_SERVER_MAX_QUEUE", "64"))
+MAX_IN_FLIGHT = int(os.getenv("CAPTION_SERVER_MAX_IN_FLIGHT", "32"))
+MAX_BODY_BYTES = int(os.getenv("CAPTION_SERVER_MAX_BODY_MB", "20")) * 1024 * 1024
+RETRY_AFTER_S = 1
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted (queue or pool full)."""
+
+
+class InvalidImage(Exception):
+    """Raised when the request body cannot be decoded as an image."""
+
+
+# =========================================================
+# 🔹 DYNAMIC MICRO-BATCHING
+# =========================================================
+class MicroBatcher:
+    """
+    Groups concurrent `submit` calls into batches for `batch_fn`.
+
+    A batch is dispatched once it holds `max_batch_size` items or
+    `max_wait` seconds after its first item arrived, whichever comes
+    first. Batches run one at a time on a dedicated thread, so the
+    models are never used by two batches at once.
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int, max_wait: float, max_queue: int):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batcher")
+        self.batches = 0
+        self.items = 0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            raise Overloaded("batch queue is full") from None
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self.batch_fn, items)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+
+def _caption_batch(images: list) -> list:
+    results, timings = generate_all_captions_batch(
+        images, max_batch_size=MAX_BATCH_SIZE, return_timings=True
+    )
+    # Every image of the batch shares the batch's per-model wall time
+    return [(captions, dict(timings, batch_size=len(images))) for captions in results]
+
+
+# =========================================================
+# 🔹 SERVER STATE
+# =========================================================
+class CaptionServer:
+    def __init__(self):
+        self.batcher = MicroBatcher(
+            _caption_batch, MAX_BATCH_SIZE, MAX_WAIT_MS / 1000, MAX_QUEUE
+        )
+        self.pool = ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT, thread_name_prefix="pipeline")
+        self.in_flight = 0
+        self.rejected = 0
+        self.loop = None
+
+    def start(self):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.batcher.start()
+
+    def _batched_captions(self, image):
+        # Called from a pipeline thread: hop onto the event loop to batch
+        future = asyncio.run_coroutine_threadsafe(self.batcher.submit(image), self.loop)
+        return future.result()
+
+    async def caption(
+        self,
+        body: bytes,
+        image_name: str,
+        enable_tot: bool,
+        enable_self_correction: bool,
+        adaptive: bool = None
+    ) -> dict:
+        if self.in_flight >= MAX_IN_FLIGHT:
+            self.rejected += 1
+            raise Overloaded("too many requests in flight")
+        self.in_flight += 1
+        try:
+            # Decoding is CPU work: keep it off the event loop
+            try:
+                image = await self.loop.run_in_executor(self.pool, load_image, body)
+            except Exception as exc:
+                raise InvalidImage(f"cannot decode the image: {exc}") from None
+            return await self.loop.run_in_executor(
+                self.pool,
+                lambda: run_captioning_pipeline(
+                    image,
+                    image_name,
+                    enable_self_correction=enable_self_correction,
+                    enable_tot=enable_tot,
+                    caption_fn=self._batched_captions,
+                    adaptive=adaptive
+                )
+            )
+        finally:
+            self.in_flight -= 1
+
+    def health(self) -> dict:
+        return {
+            "status": "ok",
+            "queue_depth": self.batcher.depth,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "batches": self.batcher.batches,
+            "mean_batch_size": self.batcher.items / self.batcher.batches if self.batcher.batches else 0.0,
+            "max_batch_size": MAX_BATCH_SIZE,
+            "max_wait_ms": MAX_WAIT_MS,
+            "models": model_stats(),
+        }
+
+
+_server = CaptionServer()
+
+
+# =========================================================
+# 🔹 ASGI APP
+# =========================================================
+async def _send_json(send, status: int, payload: dict, headers=()):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive) -> bytes:
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise ValueError("request body too large")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _flag(query: dict, name: str, default):
+    values = query.get(name)
+    if not values:
+        return default
+    return values[0].lower() not in ("0", "false", "no", "off")
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                _server.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    if scope["type"] != "http":
+        return
+    _server.start()
+
+    method, path = scope["method"], scope["path"]
+    if method == "GET" and path == "/healthz":
+        await _send_json(send, 200, _server.health())
+        return
+
+    if method == "GET" and path == "/metrics":
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; version=0.0.4")],
+        })
+        await send({"type": "http.response.body", "body": METRICS.to_prometheus().encode("utf-8")})
+        return
+
+    if method != "POST" or path != "/caption":
+        await _send_json(send, 404, {"error": "not found"})
+        return
+
+    query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+    try:
+        body = await _read_body(receive)
+    except ValueError as exc:
+        await _send_json(send, 413, {"error": str(exc)})
+        return
+    if not body:
+        await _send_json(send, 400, {"error": "empty body, send the image bytes"})
+        return
+
+    start = time.perf_counter()
+    try:
+        result = await _server.caption(
+            body,
+            image_name=query.get("image_name", ["upload"])[0],
+            enable_tot=_flag(query, "tot", True),
+            enable_self_correction=_flag(query, "self_correction", True),
+            adaptive=_flag(query, "adaptive", None),
+        )
+    except Overloaded as exc:
+        await _send_json(
+            send, 503, {"error": str(exc)},
+            headers=[(b"retry-after", str(RETRY_AFTER_S).encode())]
+        )
+        return
+    except InvalidImage as exc:
+        await _send_json(send, 400, {"error": str(exc)})
+        return
+    except Exception as exc:
+        await _send_json(send, 500, {"error": repr(exc)})
+        return
+
+    # The in-memory reasoning state stays in this process
+    result = {k: v for k, v in result.items() if k != "intermediate"}
+    result["server_seconds"] = time.perf_counter() - start
+    await _send_json(send, 200, result)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", "8000")))
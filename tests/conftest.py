@@ -0,0 +1,82 @@
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class FakeEncoder:
+    """Bag-of-words stand-in for the SentenceTransformer (unit-norm rows)."""
+
+    def encode(self, texts, normalize_embeddings=True, convert_to_numpy=True):
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in zip(vectors, texts):
+            for word in text.split():
+                row[int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1
+            row /= np.linalg.norm(row) or 1
+        return vectors
+
+
+@pytest.fixture(autouse=True)
+def ground_truth_store_dir(monkeypatch, tmp_path):
+    """Indexed ground-truth stores are built in tmp_path, never in the source tree."""
+    import ground_truth_store
+    monkeypatch.setattr(ground_truth_store, "GROUND_TRUTH_STORE_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def offline_pipeline(monkeypatch, tmp_path):
+    """
+    The pipeline with fake captioners and embeddings, the Gemini stub, no
+    ground truth and a result cache in tmp_path.
+    """
+    import caption_models
+    import embeddings
+    import gemini_fusion
+    import pipeline
+    from gemini_fusion import GeminiClient
+    from gemini_stub import StubGenerativeModel
+    from result_cache import ResultCache
+
+    def fake_captions(image):
+        digest = image.content_hash[:6]
+        return {
+            name: f"a photo number {digest} seen by {i}"
+            for i, name in enumerate(caption_models.CAPTIONERS)
+        }
+
+    def generate_all_captions_batch(images, max_batch_size=None, execution_mode=None, return_timings=False):
+        captions = [fake_captions(image) for image in images]
+        timings = {name: 0.0 for name in caption_models.CAPTIONERS}
+        return (captions, timings) if return_timings else captions
+
+    service = embeddings.get_embedding_service()
+    monkeypatch.setattr(service, "_model", FakeEncoder())
+    monkeypatch.setattr(service, "_cache", OrderedDict())
+    model = StubGenerativeModel(latency=0.0)
+    client = GeminiClient(model=model, rate_per_second=1000.0, rate_burst=1000)
+    monkeypatch.setattr(gemini_fusion, "get_gemini_client", lambda api_key=None: client)
+    cache = ResultCache(str(tmp_path / "cache.sqlite"))
+    monkeypatch.setattr(pipeline, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(pipeline, "get_ground_truth", lambda: {})
+    monkeypatch.setattr(pipeline, "generate_all_captions_batch", generate_all_captions_batch)
+
+    return SimpleNamespace(
+        pipeline=pipeline, gemini=model, client=client, cache=cache,
+        caption_fn=lambda image: (fake_captions(image), {})
+    )
+
+
+@pytest.fixture
+def images():
+    """Distinct small in-memory images."""
+    from image_ingest import load_image
+    from PIL import Image
+    return [load_image(Image.new("RGB", (16, 16), (40 * i, 10, 200 - 30 * i))) for i in range(6)]
@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+import batch_job
+import caption_models
+
+
+class _Progress:
+    def __init__(self):
+        self.updates = []
+
+    def put(self, stats):
+        self.updates.append(stats)
+
+
+@pytest.fixture
+def shard_dir(tmp_path, monkeypatch):
+    """Shard 0 holding a success for b.png and an error for a.png."""
+    monkeypatch.setattr(batch_job, "_pin_threads", lambda n: None)
+    monkeypatch.setattr(caption_models, "CAPTIONERS", {})
+    path = batch_job._shard_path(str(tmp_path), 0, "jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "a.png", "error": "StubRateLimitError('429')"}) + "\n")
+        f.write(json.dumps({"id": "b.png", "captions": {"GIT": "a cat"}}) + "\n")
+    batch_job.write_checkpoint(str(tmp_path), 0, {"offset": os.path.getsize(path), "done": 2})
+    return str(tmp_path)
+
+
+def test_recover_shard_does_not_count_errors_as_done(shard_dir):
+    assert batch_job.recover_shard(shard_dir, 0) == ({"b.png"}, {"a.png"})
+
+
+def test_resume_retries_failed_items(shard_dir, monkeypatch):
+    processed = []
+
+    def process_batch(paths, items, args):
+        processed.extend(items)
+        return [{"id": item, "captions": {"GIT": "a dog"}} for item in items]
+    monkeypatch.setattr(batch_job, "_process_batch", process_batch)
+    progress = _Progress()
+    args = {"output_dir": shard_dir, "input": shard_dir, "batch_size": 4,
+            "threads_per_worker": 1, "pipeline": False}
+
+    batch_job.run_shard(0, ["a.png", "b.png", "c.png"], args, progress)
+
+    assert processed == ["a.png", "c.png"]
+    stats = progress.updates[-1]
+    assert (stats["skipped"], stats["retried"], stats["processed"], stats["errors"]) == (1, 1, 2, 0)
+    assert batch_job.recover_shard(shard_dir, 0) == ({"a.png", "b.png", "c.png"}, set())
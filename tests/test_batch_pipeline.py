@@ -0,0 +1,65 @@
+import math
+
+import pytest
+
+import batch_eval
+import gemini_fusion
+from gemini_fusion import BATCH_MAX_ITEMS, TOT_BRANCHES
+
+
+def test_tot_branches_are_packed_into_bulk_requests(offline_pipeline):
+    items = [({"BLIP": f"a dog {i}"}, f"a dog {i}") for i in range(20)]
+
+    candidates, stats = gemini_fusion.fuse_with_tree_of_thoughts_batch(items, return_stats=True)
+
+    assert candidates == [[f"a dog {i}"] * len(TOT_BRANCHES) for i in range(20)]
+    expected = math.ceil(20 * len(TOT_BRANCHES) / BATCH_MAX_ITEMS)
+    assert stats["requests"] == offline_pipeline.gemini.calls == expected
+    assert stats["fallback"] == 0
+
+
+def test_batch_with_tot_costs_a_few_requests_not_one_per_image(offline_pipeline, images):
+    names = [f"img{i}.png" for i in range(len(images))]
+
+    results = offline_pipeline.pipeline.run_captioning_pipeline_batch(images, names, enable_tot=True)
+
+    assert all("error" not in r for r in results)
+    assert all(r["tot_debug"] for r in results)
+    # One bulk request for every ToT branch, one for every self-correction
+    assert offline_pipeline.gemini.calls == 2
+
+    # Cached now: a second run sends nothing
+    offline_pipeline.pipeline.run_captioning_pipeline_batch(images, names, enable_tot=True)
+    assert offline_pipeline.gemini.calls == 2
+
+
+@pytest.mark.parametrize("flags", [["--adaptive"], ["--reasoning-mode", "combined"]])
+def test_batch_eval_rejects_flags_the_batch_path_ignores(flags, capsys):
+    with pytest.raises(SystemExit):
+        batch_eval.main(["--batch-size", "4", *flags])
+    assert "--batch-size cannot be combined" in capsys.readouterr().err
+
+
+def test_single_image_pipeline_keeps_the_image_path_keyword(offline_pipeline, images):
+    result = offline_pipeline.pipeline.run_captioning_pipeline(
+        image_path=images[0], image_name="img0.png", caption_fn=offline_pipeline.caption_fn
+    )
+
+    batch = offline_pipeline.pipeline.run_captioning_pipeline_batch([images[0]], ["img0.png"])
+    assert result["final_caption"] == batch[0]["final_caption"]
+
+
+def test_batch_counts_each_cache_lookup_once(offline_pipeline, images):
+    names = [f"img{i}.png" for i in range(len(images))]
+    n = len(images)
+
+    offline_pipeline.pipeline.run_captioning_pipeline_batch(images, names)
+    stats = offline_pipeline.cache.snapshot()
+    assert stats["captions"] == {"hits": 0, "misses": n}
+    assert stats["gemini"] == {"hits": 0, "misses": n}
+
+    results = offline_pipeline.pipeline.run_captioning_pipeline_batch(images, names)
+    stats = offline_pipeline.cache.snapshot()
+    assert stats["captions"] == {"hits": n, "misses": n}
+    assert stats["gemini"] == {"hits": n, "misses": n}
+    assert all(r["cache"]["layers"]["gemini"] == "hit" for r in results)
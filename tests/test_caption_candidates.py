@@ -0,0 +1,41 @@
+import pytest
+from PIL import Image
+
+import caption_models
+from model_registry import ModelRegistry
+
+
+class _Captioner:
+    def __init__(self, backend: str):
+        self.backend = backend
+
+    def caption_candidates(self, images, strategies=None, max_batch_size=None):
+        if self.backend == "onnx":
+            raise NotImplementedError("greedy only")
+        return [[{"caption": "a photo", "strategy": "greedy", "log_prob": -1.0, "mean_log_prob": -0.5}]
+                for _ in images]
+
+
+@pytest.fixture
+def fake_captioner(monkeypatch):
+    registry = ModelRegistry()
+    monkeypatch.setattr(caption_models, "get_model_registry", lambda: registry)
+    monkeypatch.setattr(caption_models, "CAPTIONERS", {})
+    monkeypatch.setattr(caption_models, "_PRECISION_ENV", {})
+    monkeypatch.setattr(caption_models, "_ONNX_FACTORIES", {})
+    caption_models.register_captioner(
+        "Fake", lambda precision: _Captioner("torch"), "FAKE", source="fake",
+        onnx_factory=lambda: _Captioner("onnx")
+    )
+    return "Fake"
+
+
+def test_candidates_stay_on_torch_when_onnx_is_the_default(fake_captioner, monkeypatch):
+    monkeypatch.setenv("CAPTION_BACKEND", "onnx")
+    assert caption_models.CAPTIONERS[fake_captioner]().backend == "onnx"
+
+    results = caption_models.generate_caption_candidates([Image.new("RGB", (8, 8))], models=[fake_captioner])
+
+    assert results == [{fake_captioner: [
+        {"caption": "a photo", "strategy": "greedy", "log_prob": -1.0, "mean_log_prob": -0.5}
+    ]}]
@@ -0,0 +1,39 @@
+import json
+import os
+
+import pytest
+
+import gemini_fusion
+from gemini_fusion import CombinedResponseError, GeminiClient, parse_combined_response
+from gemini_stub import FixtureResponder, StubGenerativeModel
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "fixtures", "gemini_combined.json")
+with open(FIXTURES_PATH, encoding="utf-8") as f:
+    FIXTURES = json.load(f)
+
+VALID = [fx for fx in FIXTURES if fx["valid"]]
+INVALID = [fx for fx in FIXTURES if not fx["valid"]]
+
+
+@pytest.mark.parametrize("fixture", VALID, ids=[fx["name"] for fx in VALID])
+def test_valid_recorded_responses_parse_to_expected(fixture):
+    assert parse_combined_response(fixture["response"]) == fixture["expected"]
+
+
+@pytest.mark.parametrize("fixture", INVALID, ids=[fx["name"] for fx in INVALID])
+def test_invalid_recorded_responses_are_rejected(fixture):
+    with pytest.raises(CombinedResponseError):
+        parse_combined_response(fixture["response"])
+
+
+def test_reason_in_one_call_replays_the_fixtures(monkeypatch):
+    client = GeminiClient(model=StubGenerativeModel(latency=0.0, responder=FixtureResponder(FIXTURES_PATH)))
+    monkeypatch.setattr(gemini_fusion, "get_gemini_client", lambda api_key=None: client)
+
+    for fixture in FIXTURES:
+        if fixture["valid"]:
+            assert gemini_fusion.reason_in_one_call({"BLIP": "a dog"}, "a dog") == fixture["expected"]
+        else:
+            with pytest.raises(CombinedResponseError):
+                gemini_fusion.reason_in_one_call({"BLIP": "a dog"}, "a dog")
@@ -0,0 +1,64 @@
+import json
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("nltk")
+pytest.importorskip("rouge_score")
+
+import evaluation
+from evaluation import EvaluationEngine, ReferenceSet, compute_bleu_scores, compute_rouge_l
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+with open(os.path.join(ROOT, "data.json"), encoding="utf-8") as f:
+    GROUND_TRUTH = json.load(f)
+
+HYPOTHESES = [
+    "a dog running on grass",
+    "A sunset over the ocean under a pier.",
+    "the the the the",
+    "pier",
+    "a green leaf lit by sunlight on a sunny day near the ocean",
+    "Waves move under a pier at sunset. Waves move under a pier at sunset.",
+    "completely unrelated words here",
+]
+
+
+@pytest.fixture(autouse=True)
+def no_pos_tagger(monkeypatch):
+    # SPICE-like needs nltk tagger data; BLEU / ROUGE-L do not
+    monkeypatch.setattr(evaluation, "sentence_to_concept_set", lambda s: set(s.lower().split()))
+    evaluation._concepts.cache_clear()
+
+
+@pytest.mark.parametrize("img_name", sorted(GROUND_TRUTH))
+def test_engine_bleu_and_rouge_l_match_the_reference_functions(img_name):
+    captions = [r["caption"] for r in GROUND_TRUTH[img_name]]
+    refs = ReferenceSet(captions)
+    for hypo in HYPOTHESES + captions:
+        assert refs.bleu(hypo.lower().split()) == tuple(compute_bleu_scores(captions, hypo))
+        assert refs.rouge_l(hypo) == compute_rouge_l(captions, hypo)
+
+
+def test_references_lru_is_thread_safe():
+    engine = EvaluationEngine(GROUND_TRUTH, max_cached_images=3)
+    names = sorted(GROUND_TRUTH)
+    errors = []
+
+    def hammer(offset):
+        try:
+            for i in range(300):
+                name = names[(i + offset) % len(names)]
+                assert engine.references(name).captions == [r["caption"] for r in GROUND_TRUTH[name]]
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=hammer, args=(k,)) for k in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(engine._refs) <= 3
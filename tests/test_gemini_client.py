@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import pytest
+
+import gemini_fusion
+from gemini_fusion import GeminiClient, TokenBucket
+from gemini_stub import StubGenerativeModel, StubRateLimitError, echo_consensus
+
+
+def _failing_first(n: int, error=StubRateLimitError):
+    """Responder raising `error` on its first `n` calls, then echoing."""
+    calls = []
+
+    def responder(prompt):
+        calls.append(prompt)
+        if len(calls) <= n:
+            raise error("stub failure")
+        return echo_consensus(prompt)
+    return responder
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """Backoff upper bounds drawn by the client (no actual waiting)."""
+    drawn = []
+
+    def uniform(low, high):
+        drawn.append(high)
+        return 0.0
+    monkeypatch.setattr(gemini_fusion.random, "uniform", uniform)
+    return drawn
+
+
+def _client(model, **kwargs):
+    kwargs = {"rate_per_second": 1000.0, "rate_burst": 1000, **kwargs}
+    return GeminiClient(model=model, **kwargs)
+
+
+def test_429s_are_retried_with_exponential_backoff(backoffs):
+    model = StubGenerativeModel(latency=0.0, responder=_failing_first(3))
+    client = _client(model, max_retries=4)
+
+    assert client.generate('Caption: "a dog"') == "a dog"
+    assert model.calls == 4
+    assert client.retries == 3
+    base, cap = gemini_fusion.BACKOFF_BASE, gemini_fusion.BACKOFF_MAX
+    assert backoffs == [min(cap, base), min(cap, base * 2), min(cap, base * 4)]
+
+
+def test_gives_up_after_max_retries(backoffs):
+    model = StubGenerativeModel(latency=0.0, error_rate=1.0)
+    client = _client(model, max_retries=2)
+
+    with pytest.raises(StubRateLimitError):
+        client.generate("a prompt")
+    assert model.calls == 3
+    assert client.retries == 2
+
+
+def test_non_retryable_errors_fail_at_once(backoffs):
+    model = StubGenerativeModel(latency=0.0, responder=_failing_first(1, error=ValueError))
+    client = _client(model, max_retries=4)
+
+    with pytest.raises(ValueError):
+        client.generate("a prompt")
+    assert model.calls == 1
+    assert client.retries == 0
+
+
+def test_timeouts_are_retried(backoffs):
+    model = StubGenerativeModel(latency=0.2)
+    client = _client(model, max_retries=1, timeout=0.02)
+
+    with pytest.raises(asyncio.TimeoutError):
+        client.generate("a prompt")
+    assert model.calls == 2
+    assert client.retries == 1
+
+
+def test_random_429s_are_absorbed_by_retries(backoffs):
+    model = StubGenerativeModel(latency=0.0, error_rate=0.3, seed=1)
+    client = _client(model, max_retries=10)
+
+    answers = client.generate_many([f'Caption: "photo {i}"' for i in range(20)])
+    assert answers == [f"photo {i}" for i in range(20)]
+    assert model.errors > 0
+    assert client.retries == model.errors
+    assert model.calls == 20 + model.errors
+
+
+def test_return_exceptions_keeps_the_other_answers(backoffs):
+    model = StubGenerativeModel(latency=0.0, responder=_failing_first(1, error=ValueError))
+    client = _client(model, max_concurrency=1)
+
+    answers = client.generate_many(['"a"', '"b"', '"c"'], return_exceptions=True)
+    assert isinstance(answers[0], ValueError)
+    assert answers[1:] == ["b", "c"]
+
+
+def test_concurrency_is_bounded_by_the_semaphore():
+    model = StubGenerativeModel(latency=0.05)
+    client = _client(model, max_concurrency=3)
+
+    client.generate_many([f"prompt {i}" for i in range(12)])
+    assert model.calls == 12
+    assert model.max_in_flight == 3
+
+
+def test_token_bucket_limits_the_request_rate():
+    model = StubGenerativeModel(latency=0.0)
+    client = _client(model, rate_per_second=20.0, rate_burst=2)
+
+    start = time.monotonic()
+    client.generate_many([f"prompt {i}" for i in range(6)])
+    # The burst goes through at once, the other 4 wait 1/20 s each
+    assert time.monotonic() - start >= 4 / 20 * 0.9
+    assert model.calls == 6
+
+
+def test_token_bucket_allows_the_burst_immediately():
+    bucket = TokenBucket(rate=1.0, capacity=5)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    start = time.monotonic()
+    asyncio.run(take(5))
+    assert time.monotonic() - start < 0.1
@@ -0,0 +1,65 @@
+import io
+import json
+import os
+
+import pytest
+
+from ground_truth_store import iter_json_object, open_ground_truth
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALARS = '{"a": 1.5e3, "b": -2.25, "c": true, "d": null, "e": [1.5], "f": 12}'
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 12))
+def test_streaming_reader_matches_json_load_at_any_chunk_boundary(chunk_size):
+    assert dict(iter_json_object(io.StringIO(SCALARS), chunk_size)) == json.loads(SCALARS)
+
+
+@pytest.mark.parametrize("text", ['{"a": 1', '{"a" 1}', '[1]', '{"a": [1,}', '{1: 2}'])
+def test_streaming_reader_rejects_invalid_json(text):
+    with pytest.raises(ValueError):
+        list(iter_json_object(io.StringIO(text), 2))
+
+
+@pytest.fixture
+def source(tmp_path):
+    data = {"": [{"caption": "no name"}]}
+    data.update({f"img{i:05d}.jpg": [{"caption": f"caption {i}"}] for i in range(2500)})
+    path = tmp_path / "gt.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return str(path), data
+
+
+def test_store_reads_like_the_json_dict(source):
+    path, data = source
+    store = open_ground_truth(path)
+
+    assert len(store) == len(data)
+    assert store["img00042.jpg"] == data["img00042.jpg"]
+    assert "missing.jpg" not in store
+    with pytest.raises(KeyError):
+        store["missing.jpg"]
+    # Iteration pages through every name, the empty one included
+    assert list(store) == sorted(data)
+    assert dict(store.items()) == data
+
+
+def test_store_is_rebuilt_when_the_source_changes(source):
+    path, _ = source
+    open_ground_truth(path).close()
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"new.jpg": [{"caption": "a new one"}, {"caption": "and another"}]}, f)
+
+    assert dict(open_ground_truth(path)) == {"new.jpg": [{"caption": "a new one"}, {"caption": "and another"}]}
+
+
+def test_bundled_ground_truth_store_is_built_outside_the_source_tree(ground_truth_store_dir):
+    source = os.path.join(ROOT, "data.json")
+
+    store = open_ground_truth(source)
+
+    assert os.path.dirname(store.path) == str(ground_truth_store_dir)
+    with open(source, encoding="utf-8") as f:
+        assert dict(store) == json.load(f)
+    store.close()
@@ -0,0 +1,52 @@
+import pytest
+
+import pipeline
+from image_index import NearDuplicateIndex
+
+QUERY = 0x0F0F0F0F0F0F0F0F
+A, B, C = "a" * 64, "b" * 64, "c" * 64
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.bin"), threshold=0.9)  # up to 6 bits
+    index.add_many(
+        [QUERY ^ 0b111, QUERY ^ 0b1, QUERY ^ 0b11, QUERY ^ 0xFF00],
+        [B, A, A, C]  # A twice (two crop variants), C too far
+    )
+    return index
+
+
+def test_query_all_is_nearest_first_once_per_image(index):
+    matches = index.query_all(QUERY)
+
+    assert [(m["content_hash"], m["distance"]) for m in matches] == [(A, 1), (B, 3)]
+    assert index.query(QUERY)["content_hash"] == A
+    assert index.query_all(QUERY, limit=1) == matches[:1]
+    assert index.query(QUERY ^ 0xFFFFFFFF) is None
+
+
+class _Cache:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def get(self, layer, key):
+        return self.entries.get((layer, key))
+
+
+class _Image:
+    perceptual_hash = QUERY
+
+
+def test_near_duplicate_falls_back_to_the_next_cached_match(index, monkeypatch):
+    monkeypatch.setattr(pipeline, "get_near_dup_index", lambda: index)
+    key_b = pipeline.make_key(B, pipeline.captioner_config())
+    # The nearest match (A) has no cached captions, B does
+    cache = _Cache({("captions", key_b): {"BLIP Base": "a red square"}})
+
+    match, image_key, captions = pipeline._find_near_duplicate(cache, _Image(), adaptive=False)
+
+    assert match["content_hash"] == B
+    assert image_key == key_b
+    assert captions == {"BLIP Base": "a red square"}
+    assert pipeline._find_near_duplicate(_Cache({}), _Image(), adaptive=False) is None
@@ -0,0 +1,43 @@
+from gemini_fusion import TOT_BRANCHES
+from profiling import METRICS, MetricsRegistry
+
+
+def test_prometheus_label_values_are_escaped():
+    metrics = MetricsRegistry()
+    metrics.observe("gemini.tot", {"model": 'C:\\models\\"blip"\nbase'}, {"wall_s": 1.0, "cpu_s": 0.5})
+
+    text = metrics.to_prometheus()
+
+    assert ('pipeline_stage_wall_seconds_count{stage="gemini.tot",'
+            'model="C:\\\\models\\\\\\"blip\\"\\nbase"} 1') in text.splitlines()
+
+
+def _series(stage):
+    with METRICS._lock:
+        return {labels: s["count"] for (name, labels), s in METRICS._series.items() if name == stage}
+
+
+def test_tot_records_one_sample_per_branch_call(offline_pipeline, images):
+    before = _series("gemini.tot_call")
+
+    result = offline_pipeline.pipeline.run_captioning_pipeline(
+        images[0], "img0.png", enable_tot=True, caption_fn=offline_pipeline.caption_fn
+    )
+
+    calls = [c for c in result["timings"]["calls"] if c["stage"] == "gemini.tot_call"]
+    assert [c["branch"] for c in calls] == list(range(len(TOT_BRANCHES)))
+    after = _series("gemini.tot_call")
+    for branch in range(len(TOT_BRANCHES)):
+        key = (("branch", branch),)
+        assert after[key] == before.get(key, 0) + 1
+
+
+def test_batch_records_one_sample_per_bulk_request(offline_pipeline, images):
+    before = _series("gemini.bulk_call")
+
+    offline_pipeline.pipeline.run_captioning_pipeline_batch(images, [f"img{i}.png" for i in range(len(images))])
+
+    after = _series("gemini.bulk_call")
+    sent = sum(after.values()) - sum(before.values())
+    assert sent == offline_pipeline.gemini.calls == 2
+    assert after[(("kind", "tot"),)] == before.get((("kind", "tot"),), 0) + 1
@@ -0,0 +1,62 @@
+import asyncio
+import io
+import json
+import threading
+
+import pytest
+from PIL import Image
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def fresh_server(monkeypatch):
+    monkeypatch.setattr(server, "_server", server.CaptionServer())
+
+
+def _post(body: bytes, path: str = "/caption"):
+    messages = []
+    requests = iter([{"type": "http.request", "body": body, "more_body": False}])
+
+    async def receive():
+        return next(requests)
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b"image_name=x.png"}
+    asyncio.run(server.app(scope, receive, send))
+    return messages[0]["status"], json.loads(messages[1]["body"])
+
+
+def _png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 16), "red").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_undecodable_upload_is_a_400(monkeypatch):
+    monkeypatch.setattr(server, "run_captioning_pipeline", lambda *a, **k: pytest.fail("pipeline ran"))
+
+    status, payload = _post(b"definitely not an image")
+
+    assert status == 400
+    assert "cannot decode" in payload["error"]
+
+
+def test_image_is_decoded_off_the_event_loop(monkeypatch):
+    decoded_on = []
+    load_image = server.load_image
+
+    def recording_load_image(body):
+        decoded_on.append(threading.current_thread().name)
+        return load_image(body)
+    monkeypatch.setattr(server, "load_image", recording_load_image)
+    monkeypatch.setattr(server, "run_captioning_pipeline",
+                        lambda image, image_name, **kwargs: {"final_caption": f"{image_name} {image.size}"})
+
+    status, payload = _post(_png())
+
+    assert status == 200
+    assert payload["final_caption"] == "x.png (16, 16)"
+    assert decoded_on and decoded_on[0].startswith("pipeline")
@@ -1,27 +1,28 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 
-_embed_model = None
+from embeddings import get_embedding_service
 
-def _get_embed():
-    global _embed_model
-    if _embed_model is None:
-        _embed_model = SentenceTransformer("all-MiniLM-L6-v2")
-    return _embed_model
 
-
-def pick_best_tot_candidate(consensus_caption: str, candidates: list[str]) -> dict:
+def pick_best_tot_candidate(
+    consensus_caption: str,
+    candidates: list[str],
+    consensus_embedding: np.ndarray = None
+) -> dict:
     """
     Choisit le meilleur candidat ToT par similarité sémantique au consensus,
     avec une petite pénalité si le texte est trop long (évite blabla).
-    """
-    m = _get_embed()
-    emb = m.encode([consensus_caption] + candidates)
 
-    base = emb[0:1]
-    c_emb = emb[1:]
-    sims = cosine_similarity(base, c_emb)[0]
+    `consensus_embedding` : embedding déjà calculé du consensus (voir
+    reasoning_state), sinon il est ré-encodé.
+    """
+    service = get_embedding_service()
+    if consensus_embedding is None:
+        emb = service.encode([consensus_caption] + candidates)
+        base, c_emb = emb[0:1], emb[1:]
+    else:
+        base = np.asarray(consensus_embedding).reshape(1, -1)
+        c_emb = service.encode(candidates)
+    sims = service.similarity(base, c_emb)[0]
 
     lengths = np.array([len(c.split()) for c in candidates], dtype=float)
     length_penalty = np.clip((lengths - 20) / 30, 0, 0.2)  # max -0.2
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from caption_models import CAPTIONERS
+from embeddings import get_embedding_service
+
+
+def default_warmup_tasks() -> dict:
+    """Name -> loader for every model the pipeline needs."""
+    tasks = dict(CAPTIONERS)
+    tasks["Embeddings"] = lambda: get_embedding_service().model
+    return tasks
+
+
+# =========================================================
+# 🔹 BACKGROUND WARM-UP
+# =========================================================
+class Warmup:
+    """
+    Loads models in parallel background threads.
+
+    `status()` reports, per model, its state ("pending", "loading",
+    "ready" or "failed"), load time and error, so the UI can show
+    progress while the page is already interactive.
+    """
+
+    def __init__(self, tasks: dict = None):
+        self.tasks = tasks if tasks is not None else default_warmup_tasks()
+        self._lock = threading.Lock()
+        self._status = {
+            name: {"state": "pending", "seconds": None, "error": None}
+            for name in self.tasks
+        }
+        self._threads = []
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        for name, loader in self.tasks.items():
+            thread = threading.Thread(
+                target=self._load, args=(name, loader), name=f"warmup-{name}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _load(self, name: str, loader):
+        with self._lock:
+            self._status[name]["state"] = "loading"
+        start = time.perf_counter()
+        try:
+            loader()
+        except Exception as exc:
+            state, error = "failed", repr(exc)
+        else:
+            state, error = "ready", None
+        with self._lock:
+            self._status[name].update(
+                state=state, seconds=time.perf_counter() - start, error=error
+            )
+
+    def status(self) -> dict:
+        with self._lock:
+            return {name: dict(s) for name, s in self._status.items()}
+
+    def progress(self) -> float:
+        """Fraction of models finished (ready or failed)."""
+        status = self.status()
+        finished = sum(s["state"] in ("ready", "failed") for s in status.values())
+        return finished / len(status) if status else 1.0
+
+    def done(self) -> bool:
+        return self.progress() >= 1.0
+
+    def wait(self, timeout: float = None) -> bool:
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for thread in self._threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            thread.join(remaining)
+        return self.done()
+
+
+def start_warmup(tasks: dict = None) -> Warmup:
+    return Warmup(tasks).start()